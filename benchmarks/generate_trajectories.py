@@ -0,0 +1,192 @@
+"""
+©Rudina Subaih
+Generate synthetic trajectory files of an experiment (geometry and fps of EXPERIMENTS) with known velocities, e.g.
+to test the analysis with large data (10^7 - 10^8 rows). The text file is written in chunks of frames (sorted by
+frame), so the file can be larger than the memory.
+
+Run from the benchmarks directory:
+python generate_trajectories.py -expk genderCroMa_setupLeft_germany_paetzke -np 1000 -d 3600 -a 0.5 -po data
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from experiments import EXPERIMENTS
+from synthetic import SyntheticConfig, generate_synthetic, iter_synthetic
+from trajectory_io import TRAJ_FMT, TRAJ_HEADER, write_data, write_text_rows
+
+TRUE_VELOCITY_HEADER = "#id\tfr\tvelocity"
+TRUE_VELOCITY_FMT = "%d\t%d\t%.4f"
+
+
+def get_parser_args() -> argparse.Namespace:
+    """
+    Arguments required from user to input
+    :return: parser of arguments
+    """
+    parser = argparse.ArgumentParser(description="Generate synthetic trajectories in the corridor of an experiment")
+    parser.add_argument(
+        "-expk",
+        "--expKey",
+        help="Enter the experiment key: " + " , ".join(EXPERIMENTS.keys()),
+    )
+    parser.add_argument(
+        "-po",
+        "--pathOutput",
+        help="Enter the path to save the output"
+    )
+    parser.add_argument(
+        "-n",
+        "--fileName",
+        default="synthetic",
+        help="Enter the name of the trajectory file (default=synthetic)"
+    )
+    parser.add_argument(
+        "-np",
+        "--numberPeds",
+        type=int,
+        default=20,
+        help="Enter the number of pedestrians (default=20)"
+    )
+    parser.add_argument(
+        "-d",
+        "--duration",
+        type=float,
+        default=60,
+        help="Enter the duration in seconds (default=60)"
+    )
+    parser.add_argument(
+        "-v",
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Enter the free speed in m/s (default=1.0)"
+    )
+    parser.add_argument(
+        "-ramp",
+        "--ramp",
+        type=float,
+        default=5,
+        help="Enter the duration of the acceleration and deceleration (transit states) in seconds (default=5)"
+    )
+    parser.add_argument(
+        "-a",
+        "--stopGoAmplitude",
+        type=float,
+        default=0,
+        help="Enter the relative speed reduction of the stop-and-go wave (default=0 => no wave, 1 => full stop)"
+    )
+    parser.add_argument(
+        "-T",
+        "--stopGoPeriod",
+        type=float,
+        default=20,
+        help="Enter the period of the stop-and-go wave in seconds (default=20)"
+    )
+    parser.add_argument(
+        "-wl",
+        "--stopGoWavelength",
+        type=float,
+        help="Enter the wavelength of the stop-and-go wave in meters (default=corridor length)"
+    )
+    parser.add_argument(
+        "-m",
+        "--missingRate",
+        type=float,
+        default=0,
+        help="Enter the fraction of missing detections (default=0)"
+    )
+    parser.add_argument(
+        "-ib",
+        "--idBreakRate",
+        type=float,
+        default=0,
+        help="Enter the rate of ID breaks per pedestrian and second (default=0)"
+    )
+    parser.add_argument(
+        "-noise",
+        "--noise",
+        type=float,
+        default=0,
+        help="Enter the standard deviation of the position noise in meters (default=0)"
+    )
+    parser.add_argument(
+        "-c",
+        "--corridorLength",
+        type=float,
+        help="Enter the length of the closed corridor (default=2*length+2*pi*radius, circumference if no radius)"
+    )
+    parser.add_argument(
+        "-seed",
+        "--seed",
+        type=int,
+        help="Enter the seed of the random numbers"
+    )
+    parser.add_argument(
+        "-gt",
+        "--groundTruth",
+        action="store_true",
+        help="Save the true velocity of each row (<fileName>_velocity.txt)"
+    )
+    parser.add_argument(
+        "-b",
+        "--binary",
+        action="store_true",
+        help="Save the output in the binary columnar format (the data has to fit into the memory)"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_parser_args()
+    if args.expKey not in EXPERIMENTS:
+        print("Warning:\tPlease enter one of the experiment keys: %s" % " , ".join(EXPERIMENTS.keys()))
+        sys.exit(1)
+
+    e = EXPERIMENTS[args.expKey]
+    config = SyntheticConfig(
+        n_peds=args.numberPeds,
+        duration=args.duration,
+        speed=args.speed,
+        ramp=args.ramp,
+        stop_go_amplitude=args.stopGoAmplitude,
+        stop_go_period=args.stopGoPeriod,
+        stop_go_wavelength=args.stopGoWavelength,
+        missing_rate=args.missingRate,
+        id_break_rate=args.idBreakRate,
+        noise=args.noise,
+        corridor_length=args.corridorLength,
+        seed=args.seed,
+    )
+    os.makedirs(args.pathOutput, exist_ok=True)
+    path_base = "%s/%s" % (args.pathOutput, args.fileName)
+
+    if args.binary:
+        data, velocity = generate_synthetic(e, config)
+        p_file = write_data(path_base, data, TRAJ_HEADER, TRAJ_FMT, binary=True)
+        if args.groundTruth:
+            write_data(path_base + "_velocity", np.column_stack((data[:, :2], velocity)), TRUE_VELOCITY_HEADER,
+                       TRUE_VELOCITY_FMT, binary=True)
+        rows = len(data)
+    else:
+        p_file = path_base + ".txt"
+        rows = 0
+        truth_file = open(path_base + "_velocity.txt", "w", newline="") if args.groundTruth else None
+        try:
+            with open(p_file, "w", newline="") as traj_file:
+                traj_file.write(TRAJ_HEADER + "\r\n")
+                if truth_file is not None:
+                    truth_file.write(TRUE_VELOCITY_HEADER + "\r\n")
+                for data, velocity in iter_synthetic(e, config):
+                    write_text_rows(traj_file, data, TRAJ_FMT)
+                    if truth_file is not None:
+                        write_text_rows(truth_file, np.column_stack((data[:, :2], velocity)), TRUE_VELOCITY_FMT)
+                    rows += len(data)
+        finally:
+            if truth_file is not None:
+                truth_file.close()
+
+    print("Info:\tSaved %d rows: %s" % (rows, p_file))
@@ -0,0 +1,611 @@
+"""
+©Rudina Subaih
+Benchmarks of the analysis hot paths on the demo data and on scaled-up copies of it:
+- transformation_coord, process_data, calculate_speed_density_headway (top view and side view),
+  extract_steady_state, and bin_data (binning of 04_plot_data_binning.py).
+- each benchmark reports rows/sec and the peak memory (tracemalloc) for each scale of the number of pedestrians and
+  of the number of frames (scaling curves).
+- the results can be saved (JSON) and compared with the results of a previous version to catch regressions.
+- compact mode: the hot paths also run on float32 data (*_compact benchmarks), and their results are validated against
+  the float64 results (rows matched by id and frame, each column within its tolerance).
+- experiments: a Run (analysis.py) of the demo trajectories is calculated for every experiment of EXPERIMENTS, so each
+  experiment definition works with the in-memory analysis.
+- import-time budget: the import of each helper module and the startup (-h) of the stage scripts are measured in a
+  fresh interpreter (python -X importtime). They have to stay within their budget and must not import the heavy
+  dependencies (pandas, matplotlib, scipy), which are only imported on the paths that need them.
+
+Run from the benchmarks directory:
+python run_benchmarks.py -o results.json
+python run_benchmarks.py -b results.json (exit code 1 if a benchmark is slower than the baseline)
+python run_benchmarks.py -k none (only the import-time budget, the compact tolerances, and the experiments, exit code 1 if exceeded or failed)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from analysis import Run
+from experiments import EXPERIMENTS
+from helper import (bin_data, calculate_speed_density_headway, compact_array, detect_steady_state,
+                    extract_steady_state, process_data, transformation_coord)
+from trajectory_io import read_text
+
+DEMO_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notebooks", "demo_data")
+TOP_VIEW_KEY = "genderCroMa_setupLeft_germany_paetzke"
+TOP_VIEW_FILE = "genderFemale_germany_paetzke2023/traj/00_raw/setupLeft/croma_female_16_1.txt"
+SIDE_VIEW_KEY = "gender_palestine_Subaih"
+SIDE_VIEW_FILE = "genderMixedAlternating_palestine_subaih2019/traj/00_raw/UX_30_1.txt"
+
+HELPER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "helper")
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+# import budget in seconds of each helper module (import in a fresh interpreter, numpy included)
+IMPORT_BUDGETS = {
+    "experiments": 0.1,
+    "metrics": 0.1,
+    "helper": 0.3,
+    "trajectory_io": 0.3,
+    "synthetic": 0.3,
+    "plotting": 0.3,
+    "pipeline": 0.2,
+    "rendering": 0.2,
+    "analysis": 0.3,
+}
+# startup budget in seconds of the stage scripts (python <script> -h, interpreter startup included)
+STARTUP_BUDGET = 0.6
+STARTUP_SCRIPTS = (
+    "01_trajectory_data_preperation/00_traj_file_format.py",
+    "01_trajectory_data_preperation/01_transformation_additional.py",
+    "01_trajectory_data_preperation/02_transformation_straight_traj.py",
+    "02_calculate_vel_rho_headway/00_cal_vel_rho_headway.py",
+    "02_calculate_vel_rho_headway/01_extract_steady_state_data.py",
+    "00_pipeline/00_run_pipeline.py",
+    "03_plotting/06_render_figures.py",
+)
+HEAVY_MODULES = ("pandas", "matplotlib", "scipy")
+
+# compact mode (float32) compared with float64: max. absolute difference of each column (rho: relative difference),
+# e.g. 1e-4 m is the precision of the text files. Rows can be only in one of the results if a velocity is at a
+# threshold (forward movement) within the float32 precision, at most COMPACT_MAX_ROWS_DIFFERENT of the rows
+COMPACT_TOLERANCES = {"x": 1e-4, "y": 1e-4, "z": 1e-4, "velocity": 1e-4, "headway": 1e-4, "rho": 1e-4}
+COMPACT_RELATIVE = ("rho",)
+COMPACT_MAX_ROWS_DIFFERENT = 1e-4
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    Result of one benchmark run:
+    - name: name of the benchmark.
+    - axis: scaled quantity ("pedestrians" or "frames").
+    - scale: scale factor of the demo data.
+    - rows: number of input rows.
+    - seconds: best wall time of the repeats.
+    - rows_per_sec: rows / seconds.
+    - peak_mb: peak memory allocated during the run (MB, tracemalloc).
+    """
+
+    name: str
+    axis: str
+    scale: int
+    rows: int
+    seconds: float
+    rows_per_sec: float
+    peak_mb: float
+
+
+@dataclass
+class ImportResult:
+    """
+    Import time of a helper module or startup time of a script:
+    - name: name of the module or path of the script.
+    - seconds: best time of the repeats.
+    - budget: allowed time in seconds.
+    - heavy_modules: heavy dependencies imported (should be empty).
+    """
+
+    name: str
+    seconds: float
+    budget: float
+    heavy_modules: List[str] = field(default_factory=list)
+
+
+@dataclass
+class CompactResult:
+    """
+    Results of the compact mode (float32) compared with the float64 results:
+    - name: name of the compared function.
+    - rows: number of rows of the float64 result.
+    - rows_different: number of rows which are only in one of the results.
+    - errors: column name -> max. difference (absolute, relative for COMPACT_RELATIVE).
+    """
+
+    name: str
+    rows: int
+    rows_different: int
+    errors: Dict[str, float] = field(default_factory=dict)
+
+
+def get_parser_args() -> argparse.Namespace:
+    """
+    Arguments required from user to input
+    :return: parser of arguments
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the analysis hot paths with scaling curves")
+    parser.add_argument(
+        "-s",
+        "--scales",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8],
+        help="Enter the scale factors of the number of pedestrians and frames (default=1 2 4 8)"
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=3,
+        help="Enter the number of repeats of each benchmark, the best time is reported (default=3)"
+    )
+    parser.add_argument(
+        "-k",
+        "--benchmarks",
+        nargs="+",
+        help="Enter the names of the benchmarks to run (default: all, none => only the import-time budget)"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Enter the path of the JSON file to save the results"
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        help="Enter the path of the JSON results of a previous version to compare with"
+    )
+    parser.add_argument(
+        "-tol",
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Enter the allowed slowdown compared with the baseline (default=0.25 => 25%%)"
+    )
+    parser.add_argument(
+        "-po",
+        "--pathOutput",
+        help="Enter the path to save the figure of the scaling curves"
+    )
+    parser.add_argument(
+        "-ib",
+        "--importBudget",
+        type=float,
+        default=1.0,
+        help="Enter the scale factor of the import-time budgets, e.g. 2 for a slow machine (default=1, 0 => no "
+             "import-time check)"
+    )
+    parser.add_argument(
+        "-nec",
+        "--noExperimentCheck",
+        action="store_true",
+        help="Skip the check that calculates a Run of the demo trajectories for every experiment key"
+    )
+    parser.add_argument(
+        "-ct",
+        "--compactTolerance",
+        type=float,
+        default=1.0,
+        help="Enter the scale factor of the tolerances of the compact mode compared with float64 (default=1, 0 => "
+             "no compact check)"
+    )
+    return parser.parse_args()
+
+
+def import_profile(command: Sequence[str]) -> Tuple[float, Dict[str, float]]:
+    """
+    run python -X importtime in a fresh interpreter
+    :param command: list. arguments of the interpreter, e.g. ["-c", "import helper"] or [<script>, "-h"]
+    :return: wall time of the process (seconds), dict. imported module -> cumulative import time (seconds)
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (HELPER_DIR, os.environ.get("PYTHONPATH")))))
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", *command], env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE, text=True, check=True)
+    seconds = time.perf_counter() - start
+
+    # lines "import time: <self us> | <cumulative us> | <module>"
+    modules = {}
+    for line in completed.stderr.splitlines():
+        parts = line.split("|")
+        if line.startswith("import time:") and len(parts) == 3 and parts[1].strip().isdigit():
+            modules[parts[2].strip()] = int(parts[1]) / 10 ** 6
+    return seconds, modules
+
+
+def heavy_imports(modules: Dict[str, float]) -> List[str]:
+    """
+    :param modules: dict. imported modules (import_profile)
+    :return: list. heavy dependencies among the imported modules
+    """
+    return [name for name in HEAVY_MODULES if name in modules]
+
+
+def check_imports(repeat: int, scale: float) -> List[ImportResult]:
+    """
+    measure the import time of the helper modules and the startup time of the stage scripts
+    :param repeat: int. number of repeats, the best time is reported
+    :param scale: float. scale factor of the budgets
+    :return: list of ImportResult
+    """
+    results = []
+    for module, budget in IMPORT_BUDGETS.items():
+        profiles = [import_profile(["-c", "import %s" % module])[1] for _ in range(repeat)]
+        results.append(ImportResult(module, min(profile[module] for profile in profiles), budget * scale,
+                                    heavy_imports(profiles[0])))
+    for script in STARTUP_SCRIPTS:
+        profiles = [import_profile([os.path.join(SCRIPTS_DIR, script), "-h"]) for _ in range(repeat)]
+        results.append(ImportResult(script, min(seconds for seconds, _ in profiles), STARTUP_BUDGET * scale,
+                                    heavy_imports(profiles[0][1])))
+
+    for result in results:
+        print("%-65s %8.3f s (budget %5.3f s) %s" % (
+            result.name, result.seconds, result.budget, " ".join(result.heavy_modules)))
+    return results
+
+
+def compare_import_budget(results: Sequence[ImportResult]) -> int:
+    """
+    :param results: list of ImportResult
+    :return: int. number of imports over the budget or with heavy dependencies
+    """
+    exceeded = 0
+    for result in results:
+        if result.seconds > result.budget or result.heavy_modules:
+            exceeded += 1
+            print("Warning:\tImport budget %s: %.3f s (budget %.3f s) %s" % (
+                result.name, result.seconds, result.budget,
+                "imports " + ", ".join(result.heavy_modules) if result.heavy_modules else ""))
+    return exceeded
+
+
+def load_demo_data() -> Dict[str, npt.NDArray[np.float64]]:
+    """
+    load the demo trajectories and prepare the inputs of the benchmarks
+    :return: dict. name -> data (id, fr, x, y, z)
+    """
+    top_raw = read_text(os.path.join(DEMO_DATA, TOP_VIEW_FILE), usecols=(0, 1, 2, 3, 4))
+    e = EXPERIMENTS[TOP_VIEW_KEY]
+    oval = top_raw.copy()
+    oval[:, 2:4] = process_data(top_raw[:, 2:4].copy(), TOP_VIEW_KEY)
+    straight = oval.copy()
+    transformation_coord(oval[:, 2:4], e.length, e.radius, out=straight[:, 2:4])
+
+    side = read_text(os.path.join(DEMO_DATA, SIDE_VIEW_FILE), usecols=(0, 1, 2, 3, 4))
+    e = EXPERIMENTS[SIDE_VIEW_KEY]
+    side[:, 2:4] = process_data(side[:, 2:4].copy(), SIDE_VIEW_KEY)
+    side = side[(side[:, 2] >= e.Min) & (side[:, 2] <= e.Max)]
+
+    return {"raw": top_raw, "oval": oval, "top_view": straight, "side_view": side}
+
+
+def scale_pedestrians(data: npt.NDArray[np.float64], factor: int, c: Optional[float]) -> npt.NDArray[np.float64]:
+    """
+    copy the pedestrians with new ids, each copy shifted along the corridor (periodic)
+    :param data: numpy array. trajectory data (id, fr, x, y, z, ...)
+    :param factor: int. number of copies
+    :param c: float. circumference of the oval corridor (period of x), None => the copies are not shifted
+    :return: numpy array. scaled data
+    """
+    copies = []
+    n_ids = data[:, 0].max() + 1
+    for i in range(factor):
+        copy = data.copy()
+        copy[:, 0] += i * n_ids
+        if c is not None:
+            copy[:, 2] = (copy[:, 2] + i * c / factor) % c
+        copies.append(copy)
+    return np.concatenate(copies)
+
+
+def scale_frames(data: npt.NDArray[np.float64], factor: int) -> npt.NDArray[np.float64]:
+    """
+    repeat the experiment after its last frame
+    :param data: numpy array. trajectory data (id, fr, x, y, z, ...)
+    :param factor: int. number of repeats
+    :return: numpy array. scaled data
+    """
+    n_frames = data[:, 1].max() - data[:, 1].min() + 1
+    copies = []
+    for i in range(factor):
+        copy = data.copy()
+        copy[:, 1] += i * n_frames
+        copies.append(copy)
+    return np.concatenate(copies)
+
+
+def benchmark_cases(demo: Dict[str, npt.NDArray[np.float64]]) -> Dict[str, tuple]:
+    """
+    the benchmarks: name -> (input data, period of x for scaling (None => not periodic), function of the scaled input)
+    :param demo: dict. demo data of load_demo_data
+    :return: dict
+    """
+    top = EXPERIMENTS[TOP_VIEW_KEY]
+    side = EXPERIMENTS[SIDE_VIEW_KEY]
+    vel_h_rho = calculate_speed_density_headway(demo["top_view"], top.fps, top.circumference, top.camera_capture, 0.4)
+    vel_h_rho = vel_h_rho.copy()
+    window = detect_steady_state(vel_h_rho, top.fps)
+    vel_h_rho_compact = compact_array(vel_h_rho)
+
+    return {
+        "transformation_coord": (demo["oval"], None,
+                                 lambda d: transformation_coord(d[:, 2:4], top.length, top.radius)),
+        "process_data": (demo["raw"], None,
+                         lambda d: process_data(d[:, 2:4].copy(), TOP_VIEW_KEY)),
+        "calculate_speed_density_headway_top_view": (
+            demo["top_view"], top.circumference,
+            lambda d: calculate_speed_density_headway(d, top.fps, top.circumference, top.camera_capture, 0.4)),
+        "calculate_speed_density_headway_side_view": (
+            demo["side_view"], side.circumference,
+            lambda d: calculate_speed_density_headway(d, side.fps, side.circumference, side.camera_capture, 0.4)),
+        "extract_steady_state": (vel_h_rho, top.circumference, lambda d: extract_steady_state(d, window)),
+        "bin_data": (vel_h_rho, top.circumference, lambda d: bin_data(d[:, 7], d[:, 5])),
+        "process_data_compact": (compact_array(demo["raw"]), None,
+                                 lambda d: process_data(d[:, 2:4].copy(), TOP_VIEW_KEY)),
+        "calculate_speed_density_headway_top_view_compact": (
+            compact_array(demo["top_view"]), top.circumference,
+            lambda d: calculate_speed_density_headway(d, top.fps, top.circumference, top.camera_capture, 0.4)),
+        "calculate_speed_density_headway_side_view_compact": (
+            compact_array(demo["side_view"]), side.circumference,
+            lambda d: calculate_speed_density_headway(d, side.fps, side.circumference, side.camera_capture, 0.4)),
+        "extract_steady_state_compact": (vel_h_rho_compact, top.circumference,
+                                         lambda d: extract_steady_state(d, window)),
+    }
+
+
+def measure(function: Callable[[npt.NDArray[np.float64]], object], data: npt.NDArray[np.float64],
+            repeat: int) -> tuple:
+    """
+    best wall time and peak memory of a function
+    :param function: function of the data
+    :param data: numpy array. input data
+    :param repeat: int. number of repeats
+    :return: seconds, peak memory (bytes)
+    """
+    function(data)  # warm-up
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(data)
+        seconds.append(time.perf_counter() - start)
+
+    # the memory is measured separately because tracemalloc slows the allocations down
+    tracemalloc.start()
+    function(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(seconds), peak
+
+
+def run_benchmarks(names: Optional[Sequence[str]], scales: Sequence[int], repeat: int) -> List[BenchmarkResult]:
+    """
+    run the benchmarks for each scale of the number of pedestrians and of the number of frames
+    :param names: list. names of the benchmarks to run (None => all)
+    :param scales: list. scale factors
+    :param repeat: int. number of repeats
+    :return: list of BenchmarkResult
+    """
+    cases = benchmark_cases(load_demo_data())
+    results = []
+    for name, (data, c, function) in cases.items():
+        if names and name not in names:
+            continue
+        for axis in ("pedestrians", "frames"):
+            for scale in scales:
+                if axis == "frames" and scale == 1:
+                    continue  # same as pedestrians scale 1
+                scaled = scale_pedestrians(data, scale, c) if axis == "pedestrians" else scale_frames(data, scale)
+                seconds, peak = measure(function, scaled, repeat)
+                result = BenchmarkResult(name, axis, scale, len(scaled), seconds, len(scaled) / seconds,
+                                         peak / 1024 ** 2)
+                results.append(result)
+                print("%-50s %-12s x%-3d %10d rows %10.4f s %14.0f rows/s %10.1f MB" % (
+                    name, axis, scale, result.rows, seconds, result.rows_per_sec, result.peak_mb))
+    return results
+
+
+def match_rows(reference: npt.NDArray[np.float64],
+               compact: npt.NDArray[np.float32]) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """
+    rows of the same id and frame in the float64 and the compact result
+    :param reference: numpy array. float64 result (id, fr, ...)
+    :param compact: numpy array. compact result (id, fr, ...)
+    :return: row indices of the matched rows in reference, in compact
+    """
+    n_frames = int(max(reference[:, 1].max(initial=0), compact[:, 1].max(initial=0))) + 1
+    keys = [data[:, 0].astype(np.int64) * n_frames + data[:, 1].astype(np.int64) for data in (reference, compact)]
+    _, rows_reference, rows_compact = np.intersect1d(keys[0], keys[1], assume_unique=True, return_indices=True)
+    return rows_reference, rows_compact
+
+
+def compare_columns(name: str, reference: npt.NDArray[np.float64], compact: npt.NDArray[np.float32],
+                    columns: Sequence[str]) -> CompactResult:
+    """
+    max. differences of the columns of the compact result (rows matched by id and frame)
+    :param name: str. name of the compared function
+    :param reference: numpy array. float64 result (id, fr, ...)
+    :param compact: numpy array. compact result (id, fr, ...)
+    :param columns: list. column names of the results
+    :return: CompactResult
+    """
+    rows_reference, rows_compact = match_rows(reference, compact)
+    result = CompactResult(name, len(reference), len(reference) + len(compact) - 2 * len(rows_reference))
+    for i, column in enumerate(columns):
+        if column not in COMPACT_TOLERANCES:
+            continue
+        expected = reference[rows_reference, i]
+        difference = np.abs(compact[rows_compact, i].astype(np.float64) - expected)
+        if column in COMPACT_RELATIVE:
+            difference /= np.maximum(np.abs(expected), np.finfo(np.float32).tiny)
+        result.errors[column] = float(np.nanmax(difference, initial=0))
+    return result
+
+
+def validate_compact(demo: Dict[str, npt.NDArray[np.float64]]) -> List[CompactResult]:
+    """
+    run the analysis functions on the compact (float32) demo data and compare the results with float64
+    :param demo: dict. demo data of load_demo_data
+    :return: list of CompactResult
+    """
+    top = EXPERIMENTS[TOP_VIEW_KEY]
+    side = EXPERIMENTS[SIDE_VIEW_KEY]
+    columns = ("id", "fr", "x", "y", "z", "velocity", "headway", "rho")
+
+    def transform(data):
+        transformed = data.copy()
+        process_data(transformed[:, 2:4], TOP_VIEW_KEY)
+        transformation_coord(transformed[:, 2:4], top.length, top.radius, out=transformed[:, 2:4])
+        return transformed
+
+    results = [compare_columns("process_data + transformation_coord", transform(demo["raw"]),
+                               transform(compact_array(demo["raw"])), columns[:5])]
+    for name, data, e in (("top_view", demo["top_view"], top), ("side_view", demo["side_view"], side)):
+        vel_h_rho = calculate_speed_density_headway(data, e.fps, e.circumference, e.camera_capture, 0.4)
+        vel_h_rho_compact = calculate_speed_density_headway(compact_array(data), e.fps, e.circumference,
+                                                            e.camera_capture, 0.4)
+        results.append(compare_columns("calculate_speed_density_headway_%s" % name, vel_h_rho, vel_h_rho_compact,
+                                       columns))
+        window = detect_steady_state(vel_h_rho, e.fps)
+        if window is not None:
+            results.append(compare_columns("extract_steady_state_%s" % name, extract_steady_state(vel_h_rho, window),
+                                           extract_steady_state(vel_h_rho_compact, window), columns))
+    return results
+
+
+def compare_compact(results: Sequence[CompactResult], scale: float) -> int:
+    """
+    :param results: list of CompactResult
+    :param scale: float. scale factor of the tolerances
+    :return: int. number of compact results out of the tolerances
+    """
+    exceeded = 0
+    for result in results:
+        errors = ", ".join("%s %.1e" % (column, error) for column, error in result.errors.items())
+        over = [column for column, error in result.errors.items() if error > scale * COMPACT_TOLERANCES[column]]
+        if result.rows_different > scale * COMPACT_MAX_ROWS_DIFFERENT * result.rows:
+            over.append("rows")
+        if over:
+            exceeded += 1
+            print("Warning:	Compact %s out of the tolerance (%s): %d of %d rows different, %s" % (
+                result.name, ", ".join(over), result.rows_different, result.rows, errors))
+        else:
+            print("Info:	Compact %s: %d of %d rows different, %s" % (
+                result.name, result.rows_different, result.rows, errors))
+    return exceeded
+
+
+def check_experiments(demo: Dict[str, npt.NDArray[np.float64]]) -> int:
+    """
+    calculate a Run (additional transformation, straight trajectories, velocity, headway, and rho) of the raw demo
+    trajectories for every experiment of EXPERIMENTS
+    :param demo: dict. demo data of load_demo_data
+    :return: int. number of experiments whose Run failed
+    """
+    failed = 0
+    for exp_key in EXPERIMENTS:
+        try:
+            Run(demo["raw"], exp_key).speed_density_headway
+        except Exception as err:
+            failed += 1
+            print("Warning:	Run of the experiment %s failed (%r)" % (exp_key, err))
+    return failed
+
+
+def compare_baseline(results: Sequence[BenchmarkResult], baseline: Sequence[dict], tolerance: float) -> int:
+    """
+    compare the rows/sec with the results of a previous version
+    :param results: list of BenchmarkResult
+    :param baseline: list of results (JSON) of the previous version
+    :param tolerance: float. allowed slowdown (0.25 => 25%)
+    :return: int. number of regressions
+    """
+    previous = {(b["name"], b["axis"], b["scale"]): b["rows_per_sec"] for b in baseline}
+    regressions = 0
+    for result in results:
+        key = (result.name, result.axis, result.scale)
+        if key in previous and result.rows_per_sec < (1 - tolerance) * previous[key]:
+            regressions += 1
+            print("Warning:\tRegression %s %s x%d: %.0f rows/s (baseline %.0f rows/s)" % (
+                result.name, result.axis, result.scale, result.rows_per_sec, previous[key]))
+    return regressions
+
+
+def plot_scaling(results: Sequence[BenchmarkResult], path_output: str) -> None:
+    """
+    plot the scaling curves (wall time over input rows) of each benchmark
+    :param results: list of BenchmarkResult
+    :param path_output: str. Path to save the figure
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(1, 2, figsize=(12, 5), sharey=True)
+    for ax, axis in zip(axes, ("pedestrians", "frames")):
+        for name in dict.fromkeys(r.name for r in results):
+            curve = [r for r in results if r.name == name and (r.axis == axis or r.scale == 1)]
+            ax.loglog([r.rows for r in curve], [r.seconds for r in curve], "o-", label=name)
+        ax.set_xlabel("rows (scaled number of %s)" % axis)
+        ax.set_title("scaling over the number of %s" % axis)
+    axes[0].set_ylabel("time [s]")
+    axes[0].legend(fontsize=7)
+    fig.tight_layout()
+    fig.savefig("%s/benchmark_scaling.png" % path_output)
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    args = get_parser_args()
+
+    exceeded = 0
+    if args.importBudget:
+        exceeded = compare_import_budget(check_imports(args.repeat, args.importBudget))
+    compact_exceeded = 0
+    if args.compactTolerance:
+        compact_exceeded = compare_compact(validate_compact(load_demo_data()), args.compactTolerance)
+    experiments_failed = 0
+    if not args.noExperimentCheck:
+        experiments_failed = check_experiments(load_demo_data())
+
+    results = [] if args.benchmarks == ["none"] else run_benchmarks(args.benchmarks, args.scales, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as result_file:
+            json.dump([asdict(result) for result in results], result_file, indent=1)
+
+    if args.pathOutput:
+        plot_scaling(results, args.pathOutput)
+
+    if exceeded:
+        print("Warning:\t%d imports over the budget" % exceeded)
+    if compact_exceeded:
+        print("Warning:\t%d compact results out of the tolerance" % compact_exceeded)
+    if experiments_failed:
+        print("Warning:\t%d experiments failed" % experiments_failed)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_baseline(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("Warning:\t%d regressions" % regressions)
+            sys.exit(1)
+        print("Info:\tNo regressions")
+
+    if exceeded or compact_exceeded or experiments_failed:
+        sys.exit(1)
@@ -0,0 +1,291 @@
+"""
+©Rudina Subaih
+Lazy in-memory analysis of trajectory files for notebooks and scripts (the in-memory counterpart of the stage
+scripts, without text files between the stages):
+- a Run is the analysis of one trajectory file (or array) of an experiment of EXPERIMENTS. Its stages (raw,
+  transformation_additional, straight_traj, speed_density_headway, steady_state, steady_state_data) are computed on
+  the first access and memoized. Each stage takes the result of the previous stage in memory.
+- the trajectories are kept as columns (id, fr, x, y, z): only these columns are read from the file, and a stage only
+  creates the columns it changes (e.g. x and y), the other columns are shared with the previous stage.
+- a Pipeline holds the experiment and the parameters shared by the runs of several files.
+- with_params gives a Run with other parameters which reuses the stages that do not depend on the changed parameters
+  (e.g. several delta_t on the same transformed trajectories).
+- compact=True keeps id and fr as int32 columns and the coordinates and results as float32 (half the memory of the
+  float64 stages, the results agree with float64 within the float32 precision).
+
+pipeline = Pipeline("gender_palestine_Subaih", delta_t=0.6)
+runs = pipeline.runs(path, ["UX_14_1.txt", "UX_20_1.txt"])
+runs["UX_14_1.txt"].speed_density_headway.rho
+"""
+import os
+import sys
+from dataclasses import dataclass, fields, replace
+from functools import cached_property
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from experiments import EXPERIMENTS, ExperimentData
+from helper import (SpeedDensityHeadway, build_speed_density_headway, compact_array, detect_steady_state,
+                    extract_steady_state, transformation_coord)
+from metrics import add_rows
+from trajectory_io import COMPACT_FLOAT, SQLITE_TRAJ_COLUMNS, read_data, read_sqlite
+
+TRAJ_COLUMNS = ("id", "fr", "x", "y", "z")
+Trajectories = Dict[str, npt.NDArray[np.float64]]
+# coordinate of the x_rotate/y_rotate index of an experiment. The registry uses the indices of an x/y array (0, 1,
+# helper.process_data) or of a trajectory row (2, 3, 01_transformation_additional)
+ROTATE_COLUMNS = {0: "x", 1: "y", 2: "x", 3: "y"}
+
+# stages of a Run in order, with the parameters each stage depends on (besides the stages before it)
+STAGES = (
+    ("raw", ("source", "exp_key", "compact")),
+    ("transformation_additional", ("transform_additional",)),
+    ("straight_traj", ("transform_straight",)),
+    ("speed_density_headway", ("delta_t", "flag_disp")),
+    ("steady_state", ("steady_state_frames",)),
+    ("steady_state_data", ()),
+)
+
+
+def rotate_column(exp_key: str, name: str) -> str:
+    """
+    coordinate column of the x_rotate or y_rotate index of an experiment
+    :param exp_key: str. experiment key of EXPERIMENTS
+    :param name: str. "x_rotate" or "y_rotate"
+    :return: str. "x" or "y"
+    """
+    index = getattr(EXPERIMENTS[exp_key], name)
+    if index not in ROTATE_COLUMNS:
+        raise ValueError("ERROR: %s=%s of the experiment %s is not a coordinate index (%s)." % (
+            name, index, exp_key, ", ".join(map(str, ROTATE_COLUMNS))))
+    return ROTATE_COLUMNS[index]
+
+
+def trajectory_array(columns: Trajectories) -> npt.NDArray[np.float64]:
+    """
+    row array of the trajectory columns (e.g. to save them with write_data)
+    :param columns: dict. trajectory columns id, fr, x, y, z
+    :return: numpy array. id, fr, x, y, z (dtype of the coordinates, float32 in the compact mode)
+    """
+    data = np.empty((len(columns["x"]), len(TRAJ_COLUMNS)), dtype=columns["x"].dtype)
+    for i, name in enumerate(TRAJ_COLUMNS):
+        data[:, i] = columns[name]
+    return data
+
+
+@dataclass
+class Run:
+    """
+    Lazy analysis of one trajectory file of an experiment:
+    - source: path of the trajectory file (.txt, .cols, or .sqlite) or trajectory array (id, fr, x, y, z, ...).
+    - exp_key: experiment key of EXPERIMENTS.
+    - delta_t: time constant(s) of the velocity (one velocity column per delta_t).
+    - flag_disp: displacement of the top view velocity: 'x', 'y', or 'r'.
+    - transform_additional: True => apply the additional transformation of the experiment (process_data, and only the
+      rows inside the measurement area if the experiment has one).
+    - transform_straight: True => transform the oval to straight trajectories (None => top view experiments with an
+      oval corridor).
+    - steady_state_frames: (start frame, end frame) of the steady state (None => detected).
+    - compact: True => int32 ids and frames, float32 coordinates and results (False => float64).
+    - name: name of the run (default: file name of the source).
+    """
+
+    source: Union[str, npt.NDArray[np.float64]]
+    exp_key: str
+    delta_t: Union[float, Sequence[float]] = 0.4
+    flag_disp: str = "x"
+    transform_additional: bool = True
+    transform_straight: Optional[bool] = None
+    steady_state_frames: Optional[Tuple[float, float]] = None
+    compact: bool = False
+    name: Optional[str] = None
+
+    def __post_init__(self):
+        if self.exp_key not in EXPERIMENTS:
+            raise ValueError("ERROR: unknown experiment key %s." % self.exp_key)
+        if self.name is None:
+            self.name = os.path.basename(self.source) if isinstance(self.source, str) else "array"
+
+    @property
+    def experiment(self) -> ExperimentData:
+        """
+        data of the experiment
+        """
+        return EXPERIMENTS[self.exp_key]
+
+    @cached_property
+    def raw(self) -> Trajectories:
+        """
+        raw trajectories: columns id, fr, x, y, z (only these columns are read)
+        """
+        dtype = COMPACT_FLOAT if self.compact else np.float64
+        if isinstance(self.source, str) and os.path.splitext(self.source)[1] == ".sqlite":
+            data = read_sqlite(self.source, SQLITE_TRAJ_COLUMNS[:len(TRAJ_COLUMNS)])
+        elif isinstance(self.source, str):
+            data = read_data(self.source, usecols=range(len(TRAJ_COLUMNS)), dtype=dtype)
+        else:
+            data = self.source[:, :len(TRAJ_COLUMNS)]
+        add_rows(rows_in=len(data))
+        if self.compact:
+            data = compact_array(data)
+
+        # one contiguous array per column (the source array is not changed by the stages)
+        columns = dict(zip(TRAJ_COLUMNS, np.ascontiguousarray(data.T, dtype=dtype)))
+        if self.compact:
+            columns.update(id=columns["id"].astype(np.int32), fr=columns["fr"].astype(np.int32))
+        return columns
+
+    @cached_property
+    def transformation_additional(self) -> Trajectories:
+        """
+        trajectories after the additional transformation of the experiment (new x and y columns)
+        """
+        columns = self.raw
+        if not self.transform_additional:
+            return columns
+
+        e = self.experiment
+        if (e.Min is not None) and (e.Max is not None):  # data inside measurement area (unique for each experiment)
+            x = columns["x"] / e.unit
+            inside = (x >= e.Min) & (x <= e.Max)
+            columns = {name: column[inside] for name, column in columns.items()}
+
+        # transformation for x and y values (unique for each experiment, y is kept if y_rotate is None)
+        x = columns[rotate_column(self.exp_key, "x_rotate")]
+        x = (e.ref_x * x / e.unit) + e.shift_x
+        if e.y_rotate is None:
+            return dict(columns, x=x)
+        y = columns[rotate_column(self.exp_key, "y_rotate")]
+        return dict(columns, x=x, y=((e.ref_y * y) / e.unit) + e.shift_y)
+
+    @cached_property
+    def straight_traj(self) -> Trajectories:
+        """
+        straight periodic trajectories of the oval corridor (new x and y columns)
+        """
+        columns = self.transformation_additional
+        e = self.experiment
+        transform = self.transform_straight
+        if transform is None:
+            transform = e.camera_capture == 0 and bool(e.radius)
+        if not transform:
+            return columns
+
+        xy = np.empty((2, len(columns["x"])), dtype=columns["x"].dtype)
+        transformation_coord(np.stack((columns["x"], columns["y"]), axis=1), e.length, e.radius, out=xy.T)
+        return dict(columns, x=xy[0], y=xy[1])
+
+    @cached_property
+    def speed_density_headway(self) -> SpeedDensityHeadway:
+        """
+        velocity, headway, and rho of the trajectories (columnar result, all nan-value rows are dropped)
+        """
+        e = self.experiment
+        data = trajectory_array(self.straight_traj)
+        result = build_speed_density_headway(data, e.fps, e.circumference, e.camera_capture, self.delta_t,
+                                             self.flag_disp)
+        add_rows(rows_out=result.size, rows_nan_dropped=len(data) - result.size)
+        return result
+
+    @cached_property
+    def steady_state(self) -> Tuple[float, float]:
+        """
+        (start frame, end frame) of the steady state, detected if not given
+        """
+        if self.steady_state_frames is not None:
+            return tuple(self.steady_state_frames)
+
+        window = detect_steady_state(self.speed_density_headway.to_array(), self.experiment.fps)
+        if window is None:
+            raise ValueError("ERROR: no steady state found in %s." % self.name)
+        return window
+
+    @cached_property
+    def steady_state_data(self) -> npt.NDArray[np.float64]:
+        """
+        rows of the steady state: id, fr, x, y, z, velocity (one column per delta_t), headway, rho
+        """
+        return extract_steady_state(self.speed_density_headway.to_array(), self.steady_state)
+
+    def with_params(self, **params: Any) -> "Run":
+        """
+        run with other parameters. The stages computed so far which do not depend on the changed parameters are reused
+        :param params: changed parameters (fields of Run)
+        :return: Run
+        """
+        if "source" in params:
+            params.setdefault("name", None)  # name of the new source
+        run = replace(self, **params)
+        changed = {name for name, value in params.items() if not _same_value(getattr(self, name), value)}
+        for stage, depends in STAGES:
+            if changed.intersection(depends):
+                break
+            if stage in self.__dict__:
+                run.__dict__[stage] = self.__dict__[stage]
+        return run
+
+    def clear(self, *stages: str) -> None:
+        """
+        free the memoized results of stages (e.g. the raw trajectories once the velocities are calculated). They are
+        computed again on the next access
+        :param stages: names of the stages (default: all stages)
+        """
+        for stage in stages or [stage for stage, _ in STAGES]:
+            self.__dict__.pop(stage, None)
+
+
+def _same_value(old: Any, new: Any) -> bool:
+    """
+    :return: bool. True if a parameter did not change (arrays are compared by identity)
+    """
+    if isinstance(old, np.ndarray) or isinstance(new, np.ndarray):
+        return old is new
+    return old == new
+
+
+@dataclass
+class Pipeline:
+    """
+    Lazy analysis of the files of one experiment with shared parameters (see Run)
+    """
+
+    exp_key: str
+    delta_t: Union[float, Sequence[float]] = 0.4
+    flag_disp: str = "x"
+    transform_additional: bool = True
+    transform_straight: Optional[bool] = None
+    compact: bool = False
+
+    def __post_init__(self):
+        if self.exp_key not in EXPERIMENTS:
+            raise ValueError("ERROR: unknown experiment key %s." % self.exp_key)
+
+    def run(self, source: Union[str, npt.NDArray[np.float64]], name: Optional[str] = None,
+            steady_state_frames: Optional[Tuple[float, float]] = None, **params: Any) -> Run:
+        """
+        run of one trajectory file (nothing is computed before the first access to a stage)
+        :param source: path of the trajectory file or trajectory array (id, fr, x, y, z, ...)
+        :param name: name of the run (default: file name of the source)
+        :param steady_state_frames: (start frame, end frame) of the steady state (None => detected)
+        :param params: parameters of the run which differ from the pipeline
+        :return: Run
+        """
+        shared = {f.name: getattr(self, f.name) for f in fields(self)}
+        return Run(source, **dict(shared, **params), steady_state_frames=steady_state_frames, name=name)
+
+    def runs(self, path: str, files: Sequence[str],
+             steady_state_frames: Optional[Sequence[Optional[Tuple[float, float]]]] = None) -> Dict[str, Run]:
+        """
+        runs of several trajectory files
+        :param path: str. path of the directory of the trajectory files
+        :param files: list. names of the trajectory files
+        :param steady_state_frames: list. (start frame, end frame) of the steady state of each file (None => detected)
+        :return: dict. file name -> Run
+        """
+        if steady_state_frames is None:
+            steady_state_frames = [None] * len(files)
+        return {file: self.run("%s/%s" % (path, file), file, window)
+                for file, window in zip(files, steady_state_frames)}
@@ -2,288 +2,340 @@
 ©Rudina Subaih
 """
 import math
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
-from scipy.ndimage.interpolation import shift
 import numpy.typing as npt
 
 import os
 import sys
 sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
 from experiments import EXPERIMENTS
+from metrics import add_rows, timer
+from trajectory_io import COMPACT_FLOAT
 
+# compact mode: float32 analysis arrays (COMPACT_FLOAT, half the memory and bandwidth of float64). ids and frames are
+# exact in float32 up to 2^24
+COMPACT_MAX_INT = 2 ** 24
 
-def transformation_coord(data: npt.NDArray[np.float64], length: float, r: float) -> npt.NDArray[np.float64]:
+
+@dataclass
+class FrameIndex:
+    """
+    CSR-style frame index of a trajectory dataset:
+    - data: trajectory rows sorted by frame and, inside each frame, by the position x (order of the pedestrians).
+    - frames: sorted unique frame numbers.
+    - frame_start: first frame number (offset of the index).
+    - offsets: rows of frame (frame_start + i) are data[offsets[i]:offsets[i + 1]].
+    - keys: (pedestrian, frame) join keys of the rows (built on the first join).
+    - key_order: row positions that sort the keys ascending (built on the first join).
     """
-    transform coordinates to straight periodic trajectories (Ziemer2016)
-    :param data_transformation_additional: numpy array.
-    :param length: float. length of the oval corridor (circumference) in meter
-    :param r: flowt. Radius
-    :return: float, float. x and y-coordinate
-    """
-    data_new = np.empty((len(data), 2))
-
-    for i, row in enumerate(data):
-        x_trans = None
-        y_trans = None
-
-        x=row[0]
-        y=row[1]
-
-        if x < 0:
-            arccos_val = (r - y) / math.sqrt((x ** 2) + ((y - r) ** 2))
-            x_trans = (2 * length) + (r * math.pi) + (r * np.arccos(-arccos_val))
-            y_trans = math.sqrt((x ** 2) + ((y - r) ** 2)) - r
-        elif 0 <= x <= length:
-            y_trans = math.sqrt(((y - r) ** 2)) - r
-            if y < r:
-                x_trans = x
-            elif y >= r:
-                x_trans = (2 * length) + (r * math.pi) - x
-        elif x > length:
-            arccos_val = (r - y) / math.sqrt(((x - length) ** 2) + ((y - r) ** 2))
-            x_trans = length + (r * np.arccos(arccos_val))
-            y_trans = math.sqrt(((x - length) ** 2) + ((y - r) ** 2)) - r
-        
-        data_new[i] = [x_trans, y_trans]
-
-    return data_new
-
-def individual_velocity_top_view(data: npt.NDArray[np.float64], frame_data: npt.NDArray[np.float64], delta_t: float, frame_current: int, frame_start: int, frame_end: int, fps: int, c: float, flag_disp) -> npt.NDArray[np.float64]:
 
-    if flag_disp == 'x':
-        return individual_velocity_top_view_x(data, frame_data, delta_t, frame_current, frame_start, frame_end, fps, c)
-    elif flag_disp == 'y':
-        return individual_velocity_top_view_y(data, frame_data, delta_t, frame_current, frame_start, frame_end, fps, c)
-    elif flag_disp == 'r':
-        return individual_velocity_top_view_r(data, frame_data, delta_t, frame_current, frame_start, frame_end, fps, c)
-    else:
-        raise ValueError('The target should be x, y, or r')
+    data: npt.NDArray[np.float64]
+    frames: npt.NDArray[np.float64]
+    frame_start: int
+    offsets: npt.NDArray[np.int64]
+    keys: Optional[npt.NDArray[np.int64]] = field(default=None, repr=False)
+    key_order: Optional[npt.NDArray[np.int64]] = field(default=None, repr=False)
+
+    def rows(self, fr: float) -> slice:
+        """
+        get the rows of a specific frame (empty slice if the frame is not in the dataset)
+        :param fr: frame number
+        :return: slice of the rows of the frame in data
+        """
+        i = int(fr) - self.frame_start
+        if i < 0 or i >= len(self.offsets) - 1:
+            return slice(0, 0)
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def frame(self, fr: float) -> npt.NDArray[np.float64]:
+        """
+        get the data of a specific frame (empty array if the frame is not in the dataset)
+        :param fr: frame number
+        :return: numpy array. View of the rows of the frame
+        """
+        return self.data[self.rows(fr)]
+
+    def bounds(self) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+        """
+        get the positions of the first and the last row of every frame in the dataset
+        :return: numpy array, numpy array. First rows and last rows
+        """
+        first = self.offsets[:-1]
+        end = self.offsets[1:]
+        not_empty = end > first
+        return first[not_empty], end[not_empty] - 1
+
+    def shifted_rows(self, k: int) -> npt.NDArray[np.int64]:
+        """
+        join every row with the row of the same pedestrian k frames later (k < 0 => earlier)
+        :param k: int. Number of frames to shift
+        :return: numpy array. Position of the partner row in data for each row (-1 if there is no partner)
+        """
+        n_frames = len(self.offsets) - 1
+        if self.keys is None:
+            # key = pedestrian rank * number of frames + frame offset (unique for each (id, frame) pair)
+            _, id_rank = np.unique(self.data[:, 0], return_inverse=True)
+            frame_offset = self.data[:, 1].astype(np.int64) - self.frame_start
+            self.keys = id_rank.astype(np.int64) * n_frames + frame_offset
+            self.key_order = np.argsort(self.keys, kind="stable")
+
+        partner = np.full(len(self.data), -1, dtype=np.int64)
+        if len(self.data) == 0:
+            return partner
+
+        # the shifted frame has to stay inside the index, otherwise the key belongs to another pedestrian
+        frame_offset = self.keys % n_frames + k
+        inside = (frame_offset >= 0) & (frame_offset < n_frames)
+        target = self.keys[inside] + k
+
+        sorted_keys = self.keys[self.key_order]
+        pos = np.minimum(np.searchsorted(sorted_keys, target), len(sorted_keys) - 1)
+        found = sorted_keys[pos] == target
+        partner[np.flatnonzero(inside)[found]] = self.key_order[pos[found]]
+
+        return partner
+
+
+def build_frame_index(data: npt.NDArray[np.float64]) -> FrameIndex:
+    """
+    sort the trajectory data once by (frame, x) and build the frame -> row offsets index
+    :param data: numpy array. Trajectory data (id, fr, x, y, z, ...) with integer frame numbers
+    :return: FrameIndex
+    """
+    order = np.lexsort((data[:, 2], data[:, 1]))
+    data = data[order]
+    frames = np.unique(data[:, 1])
+    frame_start = int(frames[0]) if frames.size else 0
+
+    counts = np.bincount((data[:, 1] - frame_start).astype(np.int64))
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    return FrameIndex(data, frames, frame_start, offsets)
+
 
-def individual_velocity_top_view_x(data: npt.NDArray[np.float64], frame_data: npt.NDArray[np.float64], delta_t: float, frame_current: int, frame_start: int, frame_end: int, fps: int, c: float) -> npt.NDArray[np.float64]:
+SPEED_DENSITY_HEADWAY_COLUMNS = ("id", "fr", "x", "y", "z", "velocity", "headway", "rho")
+
+
+def _result_column(name: str) -> property:
     """
-    to calculate the individual velocity for top view experiments (value + direction) of pedestrians
-    :param data: ndarray. Trajectory dataset
-    :param frame_data: the data of a specific frame
-    :param delta_t: short time constant (to smooth the traj. in order to avoid fluctuations of ped. stepping)
-    :param frame_current: ped_id of the current camera frame
-    :param frame_start: ped_id of the starting camera frame
-    :param frame_end: ped_id of the ending camera frame
-    :param fps: camera frame per second
-    :param c: circumference of the oval corridor
-    :return: numpy array contain the velocity values
-    """
-    velocity = np.zeros((len(frame_data[:, 0])))
-
-    # 1. Get the data of the frame previous delta frame and the frame after delta frame
-    data_frame_prev = data[data[:, 1] == (frame_current - int(delta_t * fps / 2))]
-    data_frame_next = data[data[:, 1] == (frame_current + int(delta_t * fps / 2))]
-
-    if data_frame_prev.size == 0:  # in case delta_t frames prev. < time start the video
-        # data_frame_prev = data[data[:, 1] == frame_start]  # take the first data frame (frame_start)
-        velocity[:] = np.NaN
-        return velocity
-    if data_frame_next.size == 0:  # in case delta_t frames prev. > time end the video
-        # data_frame_next = data[data[:, 1] == frame_end]  # take the last data frame (frame_end)
-        velocity[:] = np.NaN
-        return velocity
-
-    # 2. Order the rows of the data frame prev and next by the value of x-axis ascending (orders of ped. walking)
-    # TODO: some pedestrians' information in the previous and next frame is missing (data extraction error). ERROR:
-    #  in velocity calculation
-    data_frame_prev_x = data_frame_prev[:, 2]
-    data_frame_next_x = data_frame_next[:, 2]
-    data_frame_prev = data_frame_prev[data_frame_prev_x.argsort()]
-    data_frame_next = data_frame_next[data_frame_next_x.argsort()]
-
-    # Some of the pedestrians are missing (trajectories not detected on specific time frames). So, it is better
-    # to iterate over one by one
-    indx = 0
-    ped_ids = frame_data[:, 0]
-    for ped_id in ped_ids:
-        x1 = data_frame_next[data_frame_next[:, 0] == ped_id][0][2]
-        x2 = data_frame_prev[data_frame_prev[:, 0] == ped_id][0][2]
-
-        ped_data_frame = data_frame_next[data_frame_next[:, 0] == ped_id]
-        
-        if x1 > x2 and np.abs(x1-x2) < 1:
-            if ped_data_frame.size != 0:
-                try:
-                    velocity[indx] = (x1 - x2) / delta_t
-                    # if velocity[indx] > 37:
-                    #     print('here',x1, x2, y1, y2, frame_current,delta_t,ped_id,data_frame_next.shape,data_frame_prev.shape)
-                    # if velocity[indx] > 37:
-                        # print(x1, x2, y1, y2, frame_current,delta_t,ped_id,data_frame_next.shape,data_frame_prev.shape)
-                    indx += 1
-                except:
-                    # TODO: some pedestrians' information in the previous and next frame is missing (data extraction
-                    #  error). ERROR: in velocity calculation. For now I will do it like this
-                    velocity[indx] = np.NAN
-                    indx += 1
-            # if ped_id == 27 and frame_current == 3392:
-            #     print(x1, x2, y1, y2, frame_current,delta_t,ped_id,data_frame_next.shape,data_frame_prev.shape)
-        else:
-            # when the pedestrina finish the round and start new
-            velocity[indx] = np.NAN
-            indx += 1
+    named column of SpeedDensityHeadway (view of the valid rows in the buffer)
+    :param name: str. column name
+    :return: property
+    """
+    i = SPEED_DENSITY_HEADWAY_COLUMNS.index(name)
+    if i > SPEED_DENSITY_HEADWAY_COLUMNS.index("velocity"):
+        i -= len(SPEED_DENSITY_HEADWAY_COLUMNS)  # after the velocity columns (one per delta_t)
+    return property(lambda self: self.buffer[i, :self.size], doc="%s column of the result" % name)
 
-    return velocity
 
-def individual_velocity_top_view_r(data: npt.NDArray[np.float64], frame_data: npt.NDArray[np.float64], delta_t: float, frame_current: int, frame_start: int, frame_end: int, fps: int, c: float) -> npt.NDArray[np.float64]:
+@dataclass
+class SpeedDensityHeadway:
+    """
+    Columnar result of the speed, headway, and density calculation:
+    - buffer: preallocated (columns x rows) array, columns are id, fr, x, y, z, velocity, headway, rho. There is one
+      velocity column for each delta_t of the calculation.
+    - size: number of valid rows at the beginning of the buffer.
+    """
+
+    buffer: npt.NDArray[np.float64]
+    size: int
+
+    id = _result_column("id")
+    fr = _result_column("fr")
+    x = _result_column("x")
+    y = _result_column("y")
+    z = _result_column("z")
+    velocity = _result_column("velocity")
+    headway = _result_column("headway")
+    rho = _result_column("rho")
+
+    @property
+    def velocities(self) -> npt.NDArray[np.float64]:
+        """
+        velocity columns of the result (one per delta_t)
+        """
+        return self.buffer[5:-2, :self.size]
+
+    @classmethod
+    def allocate(cls, n_rows: int, n_velocities: int = 1, dtype: Any = np.float64) -> "SpeedDensityHeadway":
+        """
+        allocate the buffer for a known number of rows
+        :param n_rows: int. number of rows
+        :param n_velocities: int. number of velocity columns (one per delta_t)
+        :param dtype: dtype of the buffer (float64, or COMPACT_FLOAT in the compact mode)
+        :return: SpeedDensityHeadway
+        """
+        return cls(np.empty((len(SPEED_DENSITY_HEADWAY_COLUMNS) - 1 + n_velocities, n_rows), dtype=dtype), n_rows)
+
+    def drop_nan(self) -> None:
+        """
+        drop all rows containing a nan-value by moving the valid rows to the beginning of the buffer. With several
+        velocity columns, a row is kept if at least one of its velocities is valid (the others stay nan)
+        """
+        valid = ~np.isnan(self.buffer[:, :self.size])
+        keep = np.flatnonzero(valid[:5].all(axis=0) & valid[5:-2].any(axis=0) & valid[-2:].all(axis=0))
+        for column in self.buffer:
+            column[:len(keep)] = column[keep]
+        self.size = len(keep)
+
+    def to_array(self) -> npt.NDArray[np.float64]:
+        """
+        row view of the result (no copy)
+        :return: numpy array. id, fr, x, y, z, velocity (one column per delta_t), headway, rho
+        """
+        return self.buffer[:, :self.size].T
+
+
+def transformation_coord(data: npt.NDArray[np.float64], length: float, r: float, out: Optional[npt.NDArray[np.float64]] = None) -> npt.NDArray[np.float64]:
+    """
+    transform coordinates to straight periodic trajectories (Ziemer2016)
+    :param data: numpy array. x and y-coordinate columns
+    :param length: float. length of the straight part of the oval corridor in meter (ExperimentData.length)
+    :param r: float. Radius (ExperimentData.radius)
+    :param out: numpy array. Optional (n, 2) array to write the result into, can be data itself (in place)
+    :return: numpy array. transformed x and y-coordinate (dtype of data)
     """
-    to calculate the individual velocity for top view experiments (value + direction) of pedestrians
-    :param data: ndarray. Trajectory dataset
-    :param frame_data: the data of a specific frame
+    x = data[:, 0]
+    y = data[:, 1]
+
+    # the three regions of the oval corridor
+    left = x < 0
+    straight = (0 <= x) & (x <= length)
+    right = x > length
+
+    if out is None:
+        out = np.empty((len(data), 2), dtype=data.dtype)
+    # rows that are in none of the regions (NaN values)
+    out[~(left | straight | right)] = np.NaN
+
+    # 1. left arc
+    x_left = x[left]
+    y_left = y[left]
+    dist = np.sqrt((x_left ** 2) + ((y_left - r) ** 2))
+    # angle on the arc, arccos((y - r) / dist) as arctan2 (also precise close to the ends of the arc, float32)
+    out[left, 0] = (2 * length) + (r * math.pi) + (r * np.arctan2(-x_left, y_left - r))
+    out[left, 1] = dist - r
+
+    # 2. straight part (lower part walking forward, upper part walking backward)
+    x_straight = x[straight]
+    y_straight = y[straight]
+    y_trans = np.sqrt(((y_straight - r) ** 2)) - r
+    out[straight, 0] = np.where(y_straight < r, x_straight, (2 * length) + (r * math.pi) - x_straight)
+    out[straight, 1] = y_trans
+
+    # 3. right arc
+    x_right = x[right]
+    y_right = y[right]
+    dist = np.sqrt(((x_right - length) ** 2) + ((y_right - r) ** 2))
+    # arccos((r - y) / dist)
+    out[right, 0] = length + (r * np.arctan2(x_right - length, r - y_right))
+    out[right, 1] = dist - r
+
+    return out
+
+def individual_velocity_top_view(index: FrameIndex, delta_t: float, fps: int, flag_disp='x', out: Optional[npt.NDArray[np.float64]] = None) -> npt.NDArray[np.float64]:
+    """
+    to calculate the individual velocity for top view experiments of all pedestrians in all frames at once
+    :param index: FrameIndex. Frame index of the trajectory dataset (straight trajectories format)
     :param delta_t: short time constant (to smooth the traj. in order to avoid fluctuations of ped. stepping)
-    :param frame_current: ped_id of the current camera frame
-    :param frame_start: ped_id of the starting camera frame
-    :param frame_end: ped_id of the ending camera frame
     :param fps: camera frame per second
-    :param c: circumference of the oval corridor
-    :return: numpy array contain the velocity values
-    """
-    velocity = np.zeros((len(frame_data[:, 0])))
-
-    # 1. Get the data of the frame previous delta frame and the frame after delta frame
-    data_frame_prev = data[data[:, 1] == (frame_current - int(delta_t * fps / 2))]
-    data_frame_next = data[data[:, 1] == (frame_current + int(delta_t * fps / 2))]
-
-    if data_frame_prev.size == 0:  # in case delta_t frames prev. < time start the video
-        # data_frame_prev = data[data[:, 1] == frame_start]  # take the first data frame (frame_start)
-        velocity[:] = np.NaN
-        return velocity
-    if data_frame_next.size == 0:  # in case delta_t frames prev. > time end the video
-        # data_frame_next = data[data[:, 1] == frame_end]  # take the last data frame (frame_end)
-        velocity[:] = np.NaN
-        return velocity
-
-    # 2. Order the rows of the data frame prev and next by the value of x-axis ascending (orders of ped. walking)
-    # TODO: some pedestrians' information in the previous and next frame is missing (data extraction error). ERROR:
-    #  in velocity calculation
-    data_frame_prev_r = np.sqrt(data_frame_prev[:, 2] ** 2 + data_frame_prev[:, 3] ** 2)
-    data_frame_next_r = np.sqrt(data_frame_next[:, 2] ** 2 + data_frame_next[:, 3] ** 2)
-    data_frame_prev = data_frame_prev[data_frame_prev_r.argsort()]
-    data_frame_next = data_frame_next[data_frame_next_r.argsort()]
-
-    # Some of the pedestrians are missing (trajectories not detected on specific time frames). So, it is better
-    # to iterate over one by one
-    indx = 0
-    ped_ids = frame_data[:, 0]
-    for ped_id in ped_ids:
-        x1 = data_frame_next[data_frame_next[:, 0] == ped_id][0][2]
-        x2 = data_frame_prev[data_frame_prev[:, 0] == ped_id][0][2]
-        y1 = data_frame_next[data_frame_next[:, 0] == ped_id][0][3]
-        y2 = data_frame_prev[data_frame_prev[:, 0] == ped_id][0][3]
-
-        ped_data_frame = data_frame_next[data_frame_next[:, 0] == ped_id]
-        
-        if x1 > x2 and np.abs(x1-x2) < 1:
-            if ped_data_frame.size != 0:
-                try:
-                    velocity[indx] = (np.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)) / delta_t
-                    # if velocity[indx] > 37:
-                    #     print('here',x1, x2, y1, y2, frame_current,delta_t,ped_id,data_frame_next.shape,data_frame_prev.shape)
-                    # if velocity[indx] > 37:
-                        # print(x1, x2, y1, y2, frame_current,delta_t,ped_id,data_frame_next.shape,data_frame_prev.shape)
-                    indx += 1
-                except:
-                    # TODO: some pedestrians' information in the previous and next frame is missing (data extraction
-                    #  error). ERROR: in velocity calculation. For now I will do it like this
-                    velocity[indx] = np.NAN
-                    indx += 1
-            # if ped_id == 27 and frame_current == 3392:
-            #     print(x1, x2, y1, y2, frame_current,delta_t,ped_id,data_frame_next.shape,data_frame_prev.shape)
-        else:
-            # when the pedestrina finish the round and start new
-            velocity[indx] = np.NAN
-            indx += 1
-
-    # 4. If the last ped. in the prev. frame enter the second iteration of the straight setup in the next frame
-    
-    ###IGNORE THIS PART
-    # if data_frame_prev[0, 0] == data_frame_next[-1, 0]:
-    #     if data_frame_prev[0, 0] == frame_data[0, 0]:
-    #         velocity[0] = np.NaN
-    #     else:
-    #         velocity[-1] = np.NaN
-    # elif data_frame_prev[-1, 0] == data_frame_next[0, 0]:  # if the first ped. in the prev. frame walk in the opposite
-    #     # side and become the last ped. in the second iteration in the next frame
-    #     if data_frame_prev[0, 0] == frame_data[0, 0]:
-    #         velocity[-1] = np.NaN
-    #     else:
-    #         velocity[0] = np.NaN
-    # if frame_current == 3392 or frame_current == 3393 or frame_current == 3394:
-    #     print(velocity[27],np.nanmax(velocity))
-    #print(frame_current,velocity[~np.isnan(velocity)].max())
+    :param flag_disp: str. displacement used for the velocity: 'x', 'y', or 'r' (euclidean distance)
+    :param out: numpy array. Optional array to write the velocity into
+    :return: numpy array contain the velocity values of the rows of index.data
+    """
+    if flag_disp not in ('x', 'y', 'r'):
+        raise ValueError('The target should be x, y, or r')
+
+    data = index.data
+
+    # 1. Join each row with the row of the same pedestrian delta frames before and after. Pedestrians without a
+    # previous or next row (start/end of the video or trajectories not detected) get NaN
+    delta_frames = int(delta_t * fps / 2)
+    prev_rows = index.shifted_rows(-delta_frames)
+    next_rows = index.shifted_rows(delta_frames)
+    found = (prev_rows >= 0) & (next_rows >= 0)
+
+    x1 = np.where(found, data[next_rows, 2], np.NaN)
+    x2 = np.where(found, data[prev_rows, 2], np.NaN)
+    y1 = data[next_rows, 3]
+    y2 = data[prev_rows, 3]
+
+    # 2. Calculate the displacement
+    if flag_disp == 'x':
+        displacement = x1 - x2
+    elif flag_disp == 'y':
+        displacement = y1 - y2
+    else:
+        displacement = np.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
+
+    # 3. when the pedestrian finish the round and start new (or walk backwards), the velocity is NaN
+    with np.errstate(invalid='ignore'):
+        forward = (x1 > x2) & (np.abs(x1 - x2) < 1)
+
+    velocity = np.divide(displacement, delta_t, out=out)
+    velocity[~forward] = np.NaN
+
     return velocity
 
-def individual_velocity_side_view(data: npt.NDArray[np.float64], frame_data: npt.NDArray[np.float64], delta_t: float, frame_current: int, fps: int) -> npt.NDArray[np.float64]:
+def individual_velocity_side_view(index: FrameIndex, delta_t: float, fps: int, out: Optional[npt.NDArray[np.float64]] = None) -> npt.NDArray[np.float64]:
     """
-    to calculate the individual velocity for side view experiments (value + direction) of pedestrians
-    :param data: ndarray. Trajectory dataset
-    :param frame_data: the data of a specific frame
+    to calculate the individual velocity for side view experiments of all pedestrians in all frames at once
+    :param index: FrameIndex. Frame index of the trajectory dataset
     :param delta_t: short time constant (to smooth the traj. in order to avoid fluctuations of ped. stepping)
-    :param frame_current: ID of the current camera frame
     :param fps: camera frame per second
-    :return: numpy array contain the velocity values
-    """
-    # order the pedestrians inside the current data frame by the position (0 to 3.14)
-    #frame_data = frame_data[frame_data[:, 2].argsort()]
-    # initialize
-    velocity = np.zeros((len(frame_data[:, 0])))
-    indx = 0
-    ped_ids = frame_data[:, 0]
-
-    # 1. Get the data of the frame previous delta frame and the frame after delta frame
-    data_frame_prev = data[data[:, 1] == (frame_current - int(delta_t * fps / 2) )]
-    data_frame_next = data[data[:, 1] == (frame_current + int(delta_t * fps / 2) )]
-    # 2. iterate over ped. inside the current frame one by one to calculate the velocity
-    for ped_id in ped_ids:
-        ped_data_prev = data_frame_prev[data_frame_prev[:, 0] == ped_id]
-        ped_data_next = data_frame_next[data_frame_next[:, 0] == ped_id]
-
-        # in case no prev. or next frame, take the value of x of minimum frame and maximum frame of pedestrian
-        # respectively
-        ped_data = data[data[:, 0] == ped_id]
-        ped_data_min = min(ped_data[:, 2])
-        ped_data_max = max(ped_data[:, 2])
-
-        if (ped_data_prev.size != 0) and (ped_data_next.size != 0):  # there is frame previous and next
-            velocity[indx] = (data_frame_next[data_frame_next[:, 0] == ped_id][0][2] -
-                              data_frame_prev[data_frame_prev[:, 0] == ped_id][0][2]) / delta_t
-        elif (ped_data_prev.size != 0) and (ped_data_next.size == 0):  # there is frame previous
-            velocity[indx] = (frame_data[frame_data[:, 0] == ped_id][0][2] -
-                              data_frame_prev[data_frame_prev[:, 0] == ped_id][0][2]) / delta_t
-        elif (ped_data_prev.size == 0) and (ped_data_next.size != 0):  # there is frame next
-            velocity[indx] = (data_frame_next[data_frame_next[:, 0] == ped_id][0][2] -
-                              frame_data[frame_data[:, 0] == ped_id][0][2]) / delta_t
-        elif (ped_data_prev.size == 0) and (ped_data_next.size != 0):  # there is no frame previous and next
-            velocity[indx] = (ped_data_max - ped_data_min) / delta_t
-        indx += 1
-        
+    :param out: numpy array. Optional array to write the velocity into
+    :return: numpy array contain the velocity values of the rows of index.data
+    """
+    data = index.data
+
+    # 1. Join each row with the row of the same pedestrian delta frames before and after
+    delta_frames = int(delta_t * fps / 2)
+    prev_rows = index.shifted_rows(-delta_frames)
+    next_rows = index.shifted_rows(delta_frames)
+
+    # 2. in case no prev. or next frame (pedestrian enters or leaves the measurement area), take the position in the
+    # current frame instead:
+    # - there is frame previous and next: (x_next - x_prev) / delta_t
+    # - there is frame previous: (x_current - x_prev) / delta_t
+    # - there is frame next: (x_next - x_current) / delta_t
+    # - there is no frame previous and next: 0
+    x = data[:, 2]
+    x_prev = np.where(prev_rows >= 0, x[prev_rows], x)
+    x_next = np.where(next_rows >= 0, x[next_rows], x)
+
+    velocity = np.subtract(x_next, x_prev, out=out)
+    velocity /= delta_t
+
     return velocity
 
-def individual_headway_side_view(frame_data: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+def individual_headway(index: FrameIndex, c: float, camera_capture: int, out: Optional[npt.NDArray[np.float64]] = None) -> npt.NDArray[np.float64]:
     """
-    Calculate the headway (distance in front) between two successive pedestrians
-    :param frame_data: ndarray. Data of pedestrians inside the frame
+    Calculate the headway (distance in front) between two successive pedestrians in all frames at once
+    :param index: FrameIndex. Frame index of the trajectory dataset (sorted by frame and position)
     :param c: float. circumference of the oval corridor
-    :return: numpy array. Headway
+    :param camera_capture: int. 0 => top_view, 1 => side_view
+    :param out: numpy array. Optional array to write the headway into
+    :return: numpy array. Headway of the rows of index.data
     """
-    # initialize headway array with NaN values
-    headway = np.full((1, len(frame_data)), np.NAN)[0]
-
-    # 1. sort the pedestrians inside the current data frame by the position (0 to Max)
-    frame_data = frame_data[frame_data[:, 2].argsort()]
+    x = index.data[:, 2]
+    first, last = index.bounds()
 
-    if len(frame_data) != 0 or len(frame_data) != 1:
-        # Calculate the Headway between the pedestrians
-        shifted_frame_data = shift(frame_data[:, 2], -1, cval=np.NaN)
-        headway = shifted_frame_data - frame_data[:, 2]
-    # Other cases where we can not calculate the headway::
-    # len(frame_data) == 0, the number of the pedestrians is small = 0
-    # len(frame_data) == 1, the number of the pedestrians is small = 1
+    # Calculate the headway by taking the difference between each row x value and the next one (the differences
+    # over the frame boundaries are overwritten below)
+    headway = np.empty(len(x), dtype=x.dtype) if out is None else out
+    headway[:-1] = np.diff(x)
 
+    if camera_capture == 0:
+        # ... for the last pedestrian of each frame, the pedestrian in front is the first one (oval corridor)
+        headway[last] = (c - x[last]) + x[first]
+    else:
+        # ... the last pedestrian of each frame has no pedestrian in front
+        headway[last] = np.NaN
 
     return headway
 
@@ -301,60 +353,44 @@ def reorder_arr(arr: npt.NDArray[np.float64], col: npt.NDArray[np.float64]) -> n
 
     return arr[order, :]
 
-def voronoi_rho_top_view(headway: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+def voronoi_rho(index: FrameIndex, headway: npt.NDArray[np.float64], camera_capture: int, out: Optional[npt.NDArray[np.float64]] = None) -> npt.NDArray[np.float64]:
     """
-    to calculate the voronoi rho of pedestrians in single-file movement experiments
-    :param headway: ndarray. Headway
+    to calculate the voronoi rho of pedestrians in single-file movement experiments in all frames at once
+    :param index: FrameIndex. Frame index of the trajectory dataset (sorted by frame and position)
+    :param headway: ndarray. Headway of the rows of index.data
+    :param camera_capture: int. 0 => top_view, 1 => side_view
+    :param out: ndarray. Optional array to write the rho into
     :return: ndarray. rho
     """
-    # initialize
-    rho = np.zeros((len(headway)))
+    first, last = index.bounds()
+    neighbour_headway = np.empty(len(headway), dtype=headway.dtype)
 
-    denominator = headway + rotate_array(headway.tolist(), len(headway), 1)
-    rho = 2 / denominator
+    if camera_capture == 0:
+        # the headway of the pedestrian in front (the first pedestrian is in front of the last one)
+        neighbour_headway[:-1] = headway[1:]
+        neighbour_headway[last] = headway[first]
+    else:
+        # the headway of the follower (the first pedestrian has no follower)
+        neighbour_headway[1:] = headway[:-1]
+        neighbour_headway[first] = np.NaN
 
-    return rho
+    # and the add the headway + neighbour headway
+    denominator = headway + neighbour_headway
+    rho = np.divide(2, denominator, out=out)
 
+    return rho
 
-def voronoi_rho_side_view(headway: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]: 
+def compact_array(data: npt.NDArray[np.float64]) -> npt.NDArray[np.float32]:
     """
-    to calculate the voronoi rho of pedestrians in single-file movement experiments
-    :param headway: ndarray. Headway
-    :return: ndarray. rho
+    trajectory data of the compact mode: float32 array (no copy if the data is float32 already). The results of the
+    analysis functions (process_data, calculate_speed_density_headway, extract_steady_state) are float32 as well
+    :param data: numpy array. Trajectory data (id, fr, x, y, z, ...)
+    :return: numpy array. float32 trajectory data
     """
-    # initialize
-    rho = np.zeros((len(headway)))
-
-    # the headway of the follower (shift the headway value to right)
-    shifted_headway = shift(headway, 1, cval=np.NaN, order=0)
-    # and the add the headway + headway_follower
-    # print(headway)
-    # print(shifted_headway)
-    denominator = headway + shifted_headway
-    # print(denominator)
-    rho = 2 / denominator
-    return rho
-
-def rotate_array(arr: npt.NDArray[np.float64], n: int, d: int) -> npt.NDArray[np.float64]:
-    """
-    rotate a numpy array (the last element will be the first)
-    :param arr: list to rotate
-    :param n: length of the arr
-    :param d: number of steps to rotate
-    :return: rotated list
-    """
-    temp = []
-    i = 0
-    while i < d:
-        temp.append(arr[i])
-        i = i + 1
-    i = 0
-    while d < n:
-        arr[i] = arr[d]
-        i = i + 1
-        d = d + 1
-    arr[:] = arr[: i] + temp
-    return arr
+    data = np.asarray(data, dtype=COMPACT_FLOAT)
+    if len(data) and np.abs(data[:, :2]).max() >= COMPACT_MAX_INT:
+        raise ValueError("ERROR: ids and frames have to be smaller than %d in the compact mode." % COMPACT_MAX_INT)
+    return data
 
 def process_data(arr: npt.NDArray[np.float64], experiment_name: str) -> npt.NDArray[np.float64]:
     """
@@ -376,77 +412,307 @@ def process_data(arr: npt.NDArray[np.float64], experiment_name: str) -> npt.NDAr
 
     return arr
 
-def calculate_speed_density_headway(data: npt.NDArray[np.float64], fps: int, c: float, camera_capture: int, delta_t: float, flag_disp = 'x') -> npt.NDArray[np.float64]:
+def delta_t_list(delta_t: Union[float, Sequence[float]]) -> List[float]:
     """
-    calculate the speed and density of pedestrians in the experiment
+    :param delta_t: float or list. time constant(s) to calculate the velocity
+    :return: list. time constants
+    """
+    return [delta_t] if np.isscalar(delta_t) else list(delta_t)
+
+def build_speed_density_headway(data: npt.NDArray[np.float64], fps: int, c: float, camera_capture: int, delta_t: Union[float, Sequence[float]], flag_disp = 'x') -> SpeedDensityHeadway:
+    """
+    calculate the speed and density of pedestrians in the experiment into a preallocated columnar result
     :param data: numpy array. Trajectory data
     :param fps: int. camera frame per second
     :param c: float. circumference of the oval corridor
     :param camera_capture: int. 0 => top_view, 1 => side_view (default=0)
-    :param delta_t: float. short time constant (to smooth the traj. in order to avoid fluctuations of ped. stepping)
-    :param experiment_name: str. experiment name
-    :return: numpy array. speed and density of pedestrians
-    """
-    # 1. For each frame, I need to calculate the speed, rho, and distances of pedestrians inside frame
-    frames = np.sort(np.unique(data[:, 1]))
-    frame_start = frames[0]
-    frame_end = frames[-1]
-
-    new_arr = np.empty((1, 8))
-
-    for fr in frames:
-        # Pedestrians inside the frame
-        frame_data = data[data[:, 1] == fr]
-        # A. Sort the row data by the position of pedestrians to know the order of the pedestrians in the
-        # oval corridor (straight trajectories format)
-        frame_data = frame_data[frame_data[:, 2].argsort()]
-
-        # B. Calculate pedestrian velocity
-        if camera_capture == 0:
-            velocity = individual_velocity_top_view(data, frame_data, delta_t, fr, frame_start,
-                                                    frame_end, fps, c, flag_disp)
-            # C. Calculate pedestrians' headway
-            # Calculate the headway by taking the difference between each row x value and the previous
-            headway = np.diff(frame_data[:, 2])
-            # ... for the last pedestrian, we calculate it as
-            headway_last = (c - frame_data[-1, 2]) + (frame_data[0, 2])
-            headway = np.append(headway, headway_last)
-            # D. Calculate pedestrians' rho
-            rho = voronoi_rho_top_view(headway)
-        else:
-            velocity = individual_velocity_side_view(data, frame_data, delta_t, fr, fps)
-            # C. Calculate pedestrians' headway
-            headway = individual_headway_side_view(frame_data)
-            # D. Calculate pedestrians' rho
-            rho = voronoi_rho_side_view(headway)
-
-        # reshape the velocity, headway, rho
-        velocity = np.reshape(velocity, (velocity.size, 1))
-        headway = np.reshape(headway, (headway.size, 1))
-        rho = np.reshape(rho, (rho.size, 1))
-
-        # id, fr, x, y, z, velocity, headway, rho
-        frame_data = np.append(frame_data, velocity, axis=1)
-        frame_data = np.append(frame_data, headway, axis=1)
-        frame_data = np.append(frame_data, rho, axis=1)
-
-        new_arr = np.concatenate((new_arr, frame_data))
-
-    result = new_arr[1:]
+    :param delta_t: float or list. short time constant (to smooth the traj. in order to avoid fluctuations of ped.
+    stepping). A list of time constants gives one velocity column per delta_t (same index, headway, and rho)
+    :param flag_disp: str. displacement used for the top view velocity: 'x', 'y', or 'r' (default='x')
+    :return: SpeedDensityHeadway. speed and density of pedestrians
+    """
+    # 1. Sort the data once by frame and by the position of pedestrians to know the order of the pedestrians in the
+    # oval corridor (straight trajectories format). The rows of a frame are then a slice of the sorted data
+    with timer("frame_index"):
+        index = build_frame_index(data)
+    delta_ts = delta_t_list(delta_t)
+
+    # id, fr, x, y, z, velocity (one per delta_t), headway, rho (dtype of the data, float32 in the compact mode)
+    result = SpeedDensityHeadway.allocate(len(index.data), len(delta_ts), index.data.dtype)
+    result.buffer[:5] = index.data[:, :5].T
+
+    # 2. Calculate pedestrians' velocity for all frames at once
+    with timer("velocity"):
+        for dt, velocity in zip(delta_ts, result.velocities):
+            if camera_capture == 0:
+                individual_velocity_top_view(index, dt, fps, flag_disp, out=velocity)
+            else:
+                individual_velocity_side_view(index, dt, fps, out=velocity)
+
+    # 3. Calculate pedestrians' headway and rho for all frames at once
+    with timer("headway"):
+        individual_headway(index, c, camera_capture, out=result.headway)
+    with timer("rho"):
+        voronoi_rho(index, result.headway, camera_capture, out=result.rho)
+
     # drop all nan-value rows
-    result = result[~np.isnan(result).any(axis=1)]
+    with timer("drop_nan"):
+        result.drop_nan()
+    return result
+
+def calculate_speed_density_headway(data: npt.NDArray[np.float64], fps: int, c: float, camera_capture: int, delta_t: Union[float, Sequence[float]], flag_disp = 'x') -> npt.NDArray[np.float64]:
+    """
+    calculate the speed and density of pedestrians in the experiment
+    :param data: numpy array. Trajectory data
+    :param fps: int. camera frame per second
+    :param c: float. circumference of the oval corridor
+    :param camera_capture: int. 0 => top_view, 1 => side_view (default=0)
+    :param delta_t: float or list. short time constant (to smooth the traj. in order to avoid fluctuations of ped.
+    stepping). A list of time constants is calculated in a single pass
+    :param flag_disp: str. displacement used for the top view velocity: 'x', 'y', or 'r' (default='x')
+    :return: numpy array. speed and density of pedestrians (id, fr, x, y, z, velocity, headway, rho), one velocity
+    column per delta_t
+    """
+    result = build_speed_density_headway(data, fps, c, camera_capture, delta_t, flag_disp).to_array()
+    add_rows(rows_nan_dropped=len(data) - len(result))
     return result
 
-def extract_steady_state(data: npt.NDArray[np.float64], st: float, en: float) -> npt.NDArray[np.float64]:
+def iter_frames(chunks: Iterable[npt.NDArray[np.float64]]) -> Iterator[npt.NDArray[np.float64]]:
+    """
+    group the rows of frame-sorted chunks of trajectory data into frames (a frame can continue in the next chunk)
+    :param chunks: iterable of numpy arrays. Trajectory data (id, fr, x, y, z) sorted by frame
+    :return: iterator of numpy arrays. Data of one frame
+    """
+    rest = None
+    for chunk in chunks:
+        if rest is not None:
+            chunk = np.concatenate((rest, chunk))
+        if len(chunk) == 0:
+            continue
+
+        frame_steps = np.diff(chunk[:, 1])
+        if (frame_steps < 0).any():
+            raise ValueError('ERROR: the trajectory data has to be sorted by frame.')
+
+        starts = np.concatenate(([0], np.flatnonzero(frame_steps) + 1))
+        for start, end in zip(starts[:-1], starts[1:]):
+            yield chunk[start:end]
+        # the last frame of the chunk can continue in the next chunk
+        rest = chunk[starts[-1]:]
+
+    if rest is not None:
+        yield rest
+
+def stream_speed_density_headway(frames: Iterable[npt.NDArray[np.float64]], fps: int, c: float, camera_capture: int, delta_t: Union[float, Sequence[float]], flag_disp = 'x') -> Iterator[npt.NDArray[np.float64]]:
+    """
+    calculate the speed and density of pedestrians frame by frame with bounded memory. Only a sliding window of the
+    frames (current frame +- delta frames) is kept. The rows are the same as of calculate_speed_density_headway
+    :param frames: iterable of numpy arrays. Data of each frame (id, fr, x, y, z) in ascending frame order
+    :param fps: int. camera frame per second
+    :param c: float. circumference of the oval corridor
+    :param camera_capture: int. 0 => top_view, 1 => side_view (default=0)
+    :param delta_t: float or list. short time constant (to smooth the traj. in order to avoid fluctuations of ped.
+    stepping). A list of time constants gives one velocity column per delta_t
+    :param flag_disp: str. displacement used for the top view velocity: 'x', 'y', or 'r' (default='x')
+    :return: iterator of numpy arrays. speed and density of pedestrians of each frame (nan-value rows are dropped)
+    """
+    frame_shifts = {int(dt * fps / 2) for dt in delta_t_list(delta_t)}
+    delta_frames = max(frame_shifts)
+    window = {}  # frame number -> data of the frame
+    pending = deque()  # frame numbers not calculated yet
+
+    def calculate_frame(fr: int) -> npt.NDArray[np.float64]:
+        # the rows of a frame depend only on the frame itself and the frames +- delta frames
+        window_frames = sorted(({fr + sign * k for k in frame_shifts for sign in (-1, 1)} | {fr}) & window.keys())
+        data = np.concatenate([window[f] for f in window_frames])
+        with timer("stream_frame"):
+            result = build_speed_density_headway(data, fps, c, camera_capture, delta_t, flag_disp).to_array()
+            result = result[result[:, 1] == fr]
+        add_rows(rows_nan_dropped=len(window[fr]) - len(result))
+        return result
+
+    for frame_data in frames:
+        fr = int(frame_data[0, 1])
+        window[fr] = frame_data
+        pending.append(fr)
+
+        # a frame is complete when the frame + delta frames is read (or can not come anymore)
+        while pending and pending[0] + delta_frames <= fr:
+            yield calculate_frame(pending.popleft())
+            # frames before the window of the next frame are not needed anymore
+            for old in [f for f in window if pending and f < pending[0] - delta_frames]:
+                del window[old]
+
+    while pending:
+        yield calculate_frame(pending.popleft())
+
+def frame_aggregates(data: npt.NDArray[np.float64], columns: Sequence[int] = (5, -1)) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.int64], npt.NDArray[np.float64]]:
+    """
+    number of rows and sums of columns of each frame (group reductions over all frames at once). The frames are the
+    complete range from the first to the last frame, frames without rows have count 0
+    :param data: numpy array. speed and density data (id, fr, x, y, z, velocity, headway, rho)
+    :param columns: list. column indices to sum (default: velocity and rho)
+    :return: frames, count (rows of each frame), sums (columns x frames)
+    """
+    offset = data[:, 1].astype(np.int64)
+    first = offset.min()
+    offset -= first
+    n_frames = offset.max() + 1
+
+    count = np.bincount(offset, minlength=n_frames)
+    sums = np.array([np.bincount(offset, weights=data[:, c], minlength=n_frames) for c in columns])
+    return first + np.arange(n_frames, dtype=np.float64), count, sums
+
+def frame_means(data: npt.NDArray[np.float64], columns: Sequence[int] = (5, -1)) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    mean of columns of each frame (e.g. mean speed and density over time)
+    :param data: numpy array. speed and density data (id, fr, x, y, z, velocity, headway, rho)
+    :param columns: list. column indices (default: velocity and rho)
+    :return: frames containing rows, means (columns x frames)
+    """
+    frames, count, sums = frame_aggregates(data, columns)
+    keep = count > 0
+    return frames[keep], sums[:, keep] / count[keep]
+
+def detect_steady_state(data: npt.NDArray[np.float64], fps: int, window: float = 10, k: float = 3, columns: Sequence[int] = (5, -1)) -> Optional[Tuple[float, float]]:
+    """
+    propose the steady state of an experiment from the per-frame speed and density. The rolling mean of each quantity
+    over a time window is compared with its median over the experiment: a frame is steady if the rolling means of all
+    quantities deviate less than k robust standard deviations (1.4826 * median absolute deviation). The steady state
+    is the longest run of steady frames (transit states at the beginning and end deviate from the median). Half a
+    window at the beginning and end of the data is never steady (incomplete windows)
+    :param data: numpy array. speed and density data (id, fr, x, y, z, velocity, headway, rho)
+    :param fps: int. camera frame per second
+    :param window: float. length of the rolling window in seconds (default=10)
+    :param k: float. allowed deviation in robust standard deviations (default=3)
+    :param columns: list. column indices of the quantities (default: velocity and rho)
+    :return: (start frame, end frame) of the steady state, None if no frame is steady
+    """
+    data = data[np.isfinite(data[:, list(columns)]).all(axis=1)]
+    if len(data) == 0:
+        return None
+    frames, count, sums = frame_aggregates(data, columns)
+
+    # rolling sums over the frames [fr - half, fr + half] from cumulative sums
+    half = int(window * fps) // 2
+    i = np.arange(len(frames))
+    lo = np.maximum(i - half, 0)
+    hi = np.minimum(i + half + 1, len(frames))
+    cum_count = np.concatenate(([0], np.cumsum(count)))
+    cum_sums = np.concatenate((np.zeros((len(columns), 1)), np.cumsum(sums, axis=1)), axis=1)
+    rolling_count = cum_count[hi] - cum_count[lo]
+
+    steady = (i >= half) & (i < len(frames) - half) & (rolling_count > 0)
+    if not steady.any():
+        return None
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rolling_means = (cum_sums[:, hi] - cum_sums[:, lo]) / rolling_count
+    for rolling_mean in rolling_means:
+        median = np.median(rolling_mean[steady])
+        mad = 1.4826 * np.median(np.abs(rolling_mean[steady] - median))
+        steady &= np.abs(rolling_mean - median) <= k * mad
+
+    # short fluctuations (less than half a window) between steady frames do not end the steady state
+    starts, ends = _runs(steady)
+    if len(starts) == 0:
+        return None
+    for gap_start, gap_end in zip(ends[:-1] + 1, starts[1:]):
+        if gap_end - gap_start < half:
+            steady[gap_start:gap_end] = True
+
+    # longest run of steady frames
+    starts, ends = _runs(steady)
+    longest = np.argmax(ends - starts)
+    return float(frames[starts[longest]]), float(frames[ends[longest]])
+
+def _runs(mask: npt.NDArray[np.bool_]) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """
+    runs of True values
+    :param mask: numpy array. boolean values
+    :return: first and last index of each run
+    """
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+def extract_steady_state(data: npt.NDArray[np.float64], st: Union[float, Tuple[float, float]], en: Optional[float] = None) -> npt.NDArray[np.float64]:
     """ 
     extract the steady-state data from the dataset  
     :param data: numpy array.
-    :param st: float. start value
-    :param en: float. end value
+    :param st: float. start value, or the (start, end) window of detect_steady_state
+    :param en: float. end value (None if st is a window)
     :return: numpy array.
     """
-    rho_v = data[data[:, 1] > st]
-    rho_v = rho_v[rho_v[:, 1] < en]
+    if en is None:
+        st, en = st
+
+    # one mask of the frame column (the rows are copied once)
+    return data[(data[:, 1] > st) & (data[:, 1] < en)]
 
-    return rho_v
 
+@dataclass
+class BinnedData:
+    """
+    Statistics of the y-values binned by the x-values (e.g. velocity binned by rho or headway):
+    - edges: bin edges (n_bins + 1). The bins are [edges[i], edges[i+1]), the last bin includes its right edge.
+    - count: number of points in each bin.
+    - x_mean, x_std: mean and standard deviation of the x-values in each bin (nan for empty bins).
+    - y_mean, y_std: mean and standard deviation of the y-values in each bin (nan for empty bins).
+    """
+
+    edges: npt.NDArray[np.float64]
+    count: npt.NDArray[np.int64]
+    x_mean: npt.NDArray[np.float64]
+    x_std: npt.NDArray[np.float64]
+    y_mean: npt.NDArray[np.float64]
+    y_std: npt.NDArray[np.float64]
+
+    def nonempty(self) -> "BinnedData":
+        """
+        :return: BinnedData. only the bins containing points (edges are the left edges of the bins + last right edge)
+        """
+        keep = self.count > 0
+        edges = np.append(self.edges[:-1][keep], self.edges[-1])
+        return BinnedData(edges, self.count[keep], self.x_mean[keep], self.x_std[keep], self.y_mean[keep],
+                          self.y_std[keep])
+
+def bin_data(x_values: npt.NDArray[np.float64], y_values: npt.NDArray[np.float64], bin_width: float = 0.2, edges: Optional[npt.NDArray[np.float64]] = None) -> BinnedData:
+    """
+    bin the data by the x-values and calculate count, mean, and standard deviation of x and y of all bins at once
+    (no loop over the bins). Points with nan-values or outside the edges are ignored
+    :param x_values: numpy array. x-axis values (independent variable values)
+    :param y_values: numpy array. y-axis values (dependent variable values)
+    :param bin_width: float. width of the bins starting at the minimum x-value (default=0.2)
+    :param edges: numpy array. explicit bin edges (ascending), replaces bin_width
+    :return: BinnedData
+    """
+    x_values = np.asarray(x_values, dtype=np.float64)
+    y_values = np.asarray(y_values, dtype=np.float64)
+    valid = ~(np.isnan(x_values) | np.isnan(y_values))
+    x_values = x_values[valid]
+    y_values = y_values[valid]
+
+    if edges is None:
+        min_x = x_values.min() if len(x_values) else 0.
+        n_bins = max(int(np.ceil((x_values.max() - min_x) / bin_width)), 1) if len(x_values) else 1
+        edges = min_x + bin_width * np.arange(n_bins + 1)
+        # bin index directly from the width (the last edge belongs to the last bin)
+        bins = np.minimum(((x_values - min_x) / bin_width).astype(np.int64), n_bins - 1)
+    else:
+        edges = np.asarray(edges, dtype=np.float64)
+        n_bins = len(edges) - 1
+        bins = np.searchsorted(edges, x_values, side="right") - 1
+        bins[x_values == edges[-1]] = n_bins - 1
+        inside = (bins >= 0) & (bins < n_bins)
+        bins = bins[inside]
+        x_values = x_values[inside]
+        y_values = y_values[inside]
+
+    count = np.bincount(bins, minlength=n_bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = np.bincount(bins, weights=x_values, minlength=n_bins) / count
+        y_mean = np.bincount(bins, weights=y_values, minlength=n_bins) / count
+        # standard deviation from the deviations of the bin mean (numerically stable)
+        x_std = np.sqrt(np.bincount(bins, weights=(x_values - x_mean[bins]) ** 2, minlength=n_bins) / count)
+        y_std = np.sqrt(np.bincount(bins, weights=(y_values - y_mean[bins]) ** 2, minlength=n_bins) / count)
+
+    return BinnedData(edges, count, x_mean, x_std, y_mean, y_std)
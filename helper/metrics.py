@@ -0,0 +1,200 @@
+"""
+©Rudina Subaih
+Instrumentation of the analysis stages with machine-readable run metrics:
+- stage_metrics measures one stage run of one file: wall time, CPU time, rows in/out, rows dropped by the nan-value
+  filtering, peak memory of the run (tracemalloc, optional), the peak RSS of the process, and the hot-path timers.
+- the helper functions report rows and time their hot paths (e.g. velocity, headway, rho) with add_rows and timer.
+  Both do nothing if no stage is measured.
+- the metrics of each stage run are appended as one JSON line to a metrics file, so the files of several (batch) runs
+  can be concatenated and aggregated (aggregate_metrics).
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+@dataclass
+class StageMetrics:
+    """
+    Metrics of one stage run of one file:
+    - stage: name of the stage, e.g. "00_cal_vel_rho_headway".
+    - file: path of the input file.
+    - wall_time: wall time in seconds.
+    - cpu_time: CPU time of the process in seconds.
+    - rows_in: number of rows read.
+    - rows_out: number of rows written.
+    - rows_nan_dropped: number of rows dropped because of nan-values.
+    - peak_memory_mb: peak memory allocated during the run (MB, tracemalloc; None if not traced).
+    - process_peak_rss_mb: peak resident memory of the whole process so far (MB, ru_maxrss; None if not available).
+      It is not a per-file value: the later runs of a process (serial batches) report the largest peak of the runs
+      before them.
+    - timers: hot-path timers, name -> {"seconds": total time, "calls": number of calls}.
+    - status: "ok" or the error of a failed run.
+    - started: start time (unix time).
+    - pid: process id (runs in a process pool).
+    """
+
+    stage: str
+    file: str
+    wall_time: float = 0
+    cpu_time: float = 0
+    rows_in: int = 0
+    rows_out: int = 0
+    rows_nan_dropped: int = 0
+    peak_memory_mb: Optional[float] = None
+    process_peak_rss_mb: Optional[float] = None
+    timers: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    status: str = "ok"
+    started: float = 0
+    pid: int = 0
+
+
+_active: List[StageMetrics] = []  # stage runs measured at the moment (innermost last)
+
+
+def process_peak_rss_mb() -> Optional[float]:
+    """
+    :return: float. peak resident memory of the process in MB (None if not available)
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def write_metrics(path: str, metrics: StageMetrics) -> None:
+    """
+    append the metrics of a stage run as one JSON line to a metrics file
+    :param path: str. path of the metrics file (JSON lines)
+    :param metrics: StageMetrics
+    """
+    line = json.dumps(asdict(metrics)) + "\n"
+    # one write of the whole line, so the lines of parallel processes are not mixed
+    with open(path, "a") as metrics_file:
+        metrics_file.write(line)
+
+
+@contextmanager
+def stage_metrics(stage: str, file: str, path: Optional[str] = None,
+                  trace_memory: bool = False) -> Iterator[StageMetrics]:
+    """
+    measure one stage run of one file. The metrics are appended to the metrics file when the run is done (also if it
+    fails)
+    :param stage: str. name of the stage
+    :param file: str. path of the input file
+    :param path: str. path of the metrics file (None => the metrics are not saved)
+    :param trace_memory: bool. True => trace the peak memory with tracemalloc (slows the allocations down)
+    :return: StageMetrics of the run (rows_in and rows_out can be set by the stage)
+    """
+    metrics = StageMetrics(stage, file, started=time.time(), pid=os.getpid())
+    # tracemalloc can only be started once, an outer measured run keeps tracing
+    tracing = trace_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    _active.append(metrics)
+    try:
+        yield metrics
+    except BaseException as err:
+        metrics.status = repr(err)
+        raise
+    finally:
+        _active.remove(metrics)
+        metrics.wall_time = time.perf_counter() - wall_start
+        metrics.cpu_time = time.process_time() - cpu_start
+        if tracing:
+            metrics.peak_memory_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+            tracemalloc.stop()
+        metrics.process_peak_rss_mb = process_peak_rss_mb()
+        if path is not None:
+            write_metrics(path, metrics)
+
+
+def current_metrics() -> Optional[StageMetrics]:
+    """
+    :return: StageMetrics of the innermost measured stage run (None if no stage is measured)
+    """
+    return _active[-1] if _active else None
+
+
+def add_rows(rows_in: int = 0, rows_out: int = 0, rows_nan_dropped: int = 0) -> None:
+    """
+    count rows of the measured stage run (nothing if no stage is measured)
+    :param rows_in: int. number of rows read
+    :param rows_out: int. number of rows written
+    :param rows_nan_dropped: int. number of rows dropped because of nan-values
+    """
+    if _active:
+        metrics = _active[-1]
+        metrics.rows_in += rows_in
+        metrics.rows_out += rows_out
+        metrics.rows_nan_dropped += rows_nan_dropped
+
+
+@contextmanager
+def timer(name: str) -> Iterator[None]:
+    """
+    hot-path timer: add the time of the block to the timer of the measured stage run (nothing if no stage is
+    measured)
+    :param name: str. name of the timer
+    """
+    if not _active:
+        yield
+        return
+
+    metrics = _active[-1]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        total = metrics.timers.setdefault(name, {"seconds": 0., "calls": 0})
+        total["seconds"] += time.perf_counter() - start
+        total["calls"] += 1
+
+
+def read_metrics(path: str) -> List[dict]:
+    """
+    read the metrics of a metrics file (JSON lines)
+    :param path: str. path of the metrics file
+    :return: list of the metrics (dict) of each stage run
+    """
+    with open(path) as metrics_file:
+        return [json.loads(line) for line in metrics_file if line.strip()]
+
+
+def aggregate_metrics(records: List[dict]) -> Dict[str, dict]:
+    """
+    aggregate the metrics of the stage runs (e.g. of several batch jobs) per stage
+    :param records: list. metrics of the stage runs (read_metrics)
+    :return: dict. stage -> runs, failed runs, sums of the times and rows, max of the peak memory (of the runs and of
+    the processes), summed timers
+    """
+    stages: Dict[str, dict] = {}
+    for record in records:
+        total = stages.setdefault(record["stage"], {
+            "runs": 0, "failed": 0, "wall_time": 0., "cpu_time": 0., "rows_in": 0, "rows_out": 0,
+            "rows_nan_dropped": 0, "peak_memory_mb": None, "process_peak_rss_mb": None, "timers": {}})
+        total["runs"] += 1
+        total["failed"] += record["status"] != "ok"
+        for key in ("wall_time", "cpu_time", "rows_in", "rows_out", "rows_nan_dropped"):
+            total[key] += record[key]
+        for key in ("peak_memory_mb", "process_peak_rss_mb"):
+            if record.get(key) is not None:
+                total[key] = max(total[key] or 0., record[key])
+        for name, timer_total in record["timers"].items():
+            summed = total["timers"].setdefault(name, {"seconds": 0., "calls": 0})
+            summed["seconds"] += timer_total["seconds"]
+            summed["calls"] += timer_total["calls"]
+    return stages
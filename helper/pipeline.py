@@ -0,0 +1,306 @@
+"""
+©Rudina Subaih
+Running the analysis stages as a dependency graph with a content-hash cache:
+- each task runs one stage (e.g. 02_transformation_straight_traj) on the outputs of the tasks it depends on and/or
+  on source files.
+- the cache key of a task is the hash of the stage name, the code of the stage (content hash of the module of the
+  stage function and of the code files of the task, e.g. the stage script and the helper modules), the hashes of its
+  inputs (content hash of the source files, cache key of the dependencies), the experiment (key and data of
+  EXPERIMENTS), and the stage parameters. A task whose output is in the cache is not run again, an edited stage is
+  run again.
+- independent tasks (e.g. the files of an experiment) run in parallel in a process pool.
+- the oldest cache entries are removed when the cache is larger than the disk budget.
+- the run metrics of the stages which are run (not cached) can be appended to a metrics file (see metrics.py).
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from experiments import EXPERIMENTS
+from metrics import stage_metrics
+
+ENTRY_FILE = "entry.json"
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+@dataclass
+class Task:
+    """
+    One stage run of the pipeline:
+    - name: unique name of the task, e.g. "00_cal_vel_rho_headway:croma_female_24_1".
+    - stage: function stage(inputs, path_output, **params) -> path of the output (exp_key is passed as parameter too,
+      if not None). It has to be a module-level function (it is sent to the worker processes).
+    - depends: names of the tasks whose outputs are the first inputs of the stage.
+    - sources: paths of the source files, the inputs after the outputs of the dependencies.
+    - exp_key: experiment key of EXPERIMENTS (None => the stage does not depend on the experiment).
+    - params: parameters of the stage (e.g. delta_t), passed as keyword arguments.
+    - code: paths of the code files of the stage besides the module of the stage function (e.g. the stage script and
+      the helper modules it uses). Their content is part of the cache key.
+    """
+
+    name: str
+    stage: Callable[..., str]
+    depends: Tuple[str, ...] = ()
+    sources: Tuple[str, ...] = ()
+    exp_key: Optional[str] = None
+    params: Dict[str, Any] = field(default_factory=dict)
+    code: Tuple[str, ...] = ()
+
+
+@dataclass
+class TaskResult:
+    """
+    Result of a task:
+    - task: the task.
+    - key: cache key of the task (None if it could not be computed).
+    - output: path of the output in the cache (None if the task failed).
+    - cached: True => the output was in the cache and the stage was not run.
+    - error: error message (None if the task did not fail).
+    """
+
+    task: Task
+    key: Optional[str] = None
+    output: Optional[str] = None
+    cached: bool = False
+    error: Optional[str] = None
+
+
+def path_hash(path: str) -> str:
+    """
+    hash the content of a file, or of all files of a directory (e.g. binary columnar *.cols files)
+    :param path: str. path of the file or the directory
+    :return: str. hex digest
+    """
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    else:
+        paths = [path]
+
+    for p in paths:
+        digest.update(os.path.relpath(p, path).encode())
+        with open(p, "rb") as data_file:
+            for block in iter(lambda: data_file.read(HASH_BLOCK_BYTES), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def code_paths(function: Callable[..., Any], code: Sequence[str] = ()) -> List[str]:
+    """
+    paths of the code of a stage (or plot) function
+    :param function: module-level function
+    :param code: list. paths of the other code files of the function (e.g. the script it runs)
+    :return: list. source file of the module of the function (if it has one) followed by the code files
+    """
+    p_module = getattr(sys.modules.get(function.__module__), "__file__", None)
+    return ([p_module] if p_module else []) + list(code)
+
+
+def task_key(task: Task, input_keys: Sequence[str], code_keys: Sequence[str] = ()) -> str:
+    """
+    cache key of a task
+    :param task: Task
+    :param input_keys: list. cache keys of the dependencies followed by the content hashes of the sources
+    :param code_keys: list. content hashes of the code of the stage (code_paths)
+    :return: str. hex digest
+    """
+    experiment = None
+    if task.exp_key is not None:
+        experiment = [task.exp_key, asdict(EXPERIMENTS[task.exp_key])]
+
+    key = {
+        "stage": "%s.%s" % (task.stage.__module__, task.stage.__qualname__),
+        "code": list(code_keys),
+        "inputs": list(input_keys),
+        "experiment": experiment,
+        "params": task.params,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def cache_lookup(cache_dir: str, key: str) -> Optional[str]:
+    """
+    path of the output of a cache entry. A hit marks the entry as recently used
+    :param cache_dir: str. path of the cache directory
+    :param key: str. cache key
+    :return: str. path of the output (None if the entry is not in the cache)
+    """
+    p_entry = os.path.join(cache_dir, key)
+    try:
+        with open(os.path.join(p_entry, ENTRY_FILE)) as entry_file:
+            entry = json.load(entry_file)
+    except (OSError, ValueError):
+        return None
+
+    output = os.path.join(p_entry, entry["output"])
+    if not os.path.exists(output):
+        return None
+    os.utime(os.path.join(p_entry, ENTRY_FILE))
+    return output
+
+
+def run_task(task: Task, inputs: List[str], cache_dir: str, key: str, metrics_file: Optional[str] = None,
+             trace_memory: bool = False) -> str:
+    """
+    run the stage of a task into a temporary directory and move it to the cache as one entry
+    :param task: Task
+    :param inputs: list. paths of the inputs of the stage
+    :param cache_dir: str. path of the cache directory
+    :param key: str. cache key
+    :param metrics_file: str. path of the file to append the run metrics of the stage (None => not saved)
+    :param trace_memory: bool. True => trace the peak memory of the stage with tracemalloc
+    :return: str. path of the output in the cache
+    """
+    p_entry = os.path.join(cache_dir, key)
+    p_tmp = "%s.tmp-%d" % (p_entry, os.getpid())
+    shutil.rmtree(p_tmp, ignore_errors=True)
+    os.makedirs(p_tmp)
+    try:
+        params = dict(task.params) if task.exp_key is None else dict(task.params, exp_key=task.exp_key)
+        # the stage name without the file name, e.g. "00_cal_vel_rho_headway:0.4"
+        with stage_metrics(task.name.rsplit(":", 1)[0], inputs[0] if inputs else "", metrics_file, trace_memory):
+            output = task.stage(inputs, p_tmp, **params)
+        entry = {"task": task.name, "output": os.path.relpath(output, p_tmp), "created": time.time()}
+        with open(os.path.join(p_tmp, ENTRY_FILE), "w") as entry_file:
+            json.dump(entry, entry_file)
+        try:
+            os.rename(p_tmp, p_entry)
+        except OSError:  # the same entry was stored meanwhile (e.g. by another run)
+            shutil.rmtree(p_tmp)
+    except BaseException:
+        shutil.rmtree(p_tmp, ignore_errors=True)
+        raise
+    return os.path.join(p_entry, entry["output"])
+
+
+def entry_size(p_entry: str) -> int:
+    """
+    :param p_entry: str. path of a cache entry
+    :return: int. size of the files of the entry (bytes)
+    """
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(p_entry) for name in names)
+
+
+def evict_cache(cache_dir: str, budget_bytes: int, keep: Sequence[str] = ()) -> List[str]:
+    """
+    remove the least recently used cache entries until the cache is not larger than the disk budget
+    :param cache_dir: str. path of the cache directory
+    :param budget_bytes: int. disk budget of the cache (bytes)
+    :param keep: list. cache keys which are not removed (e.g. the entries of the current run)
+    :return: list. removed cache keys
+    """
+    entries = []
+    for key in os.listdir(cache_dir):
+        p_entry = os.path.join(cache_dir, key)
+        p_file = os.path.join(p_entry, ENTRY_FILE)
+        if os.path.isfile(p_file):
+            entries.append((os.path.getmtime(p_file), key, entry_size(p_entry)))
+
+    total = sum(size for _, _, size in entries)
+    removed = []
+    for _, key, size in sorted(entries):
+        if total <= budget_bytes:
+            break
+        if key in keep:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+        total -= size
+        removed.append(key)
+    return removed
+
+
+def run_tasks(tasks: Sequence[Task], cache_dir: str, workers: int = 1, metrics_file: Optional[str] = None,
+              trace_memory: bool = False) -> Iterator[TaskResult]:
+    """
+    run the tasks in the order of their dependencies. Tasks whose output is in the cache are skipped, the tasks whose
+    dependencies are done run in parallel. A failing task does not stop the tasks which do not depend on it
+    :param tasks: list. Tasks (the dependencies of a task have to be in the list)
+    :param cache_dir: str. path of the cache directory
+    :param workers: int. Number of worker processes (1 => no process pool, 0 => all CPUs)
+    :param metrics_file: str. path of the file to append the run metrics of each stage run (None => not saved)
+    :param trace_memory: bool. True => trace the peak memory of each stage run with tracemalloc
+    :return: iterator of TaskResult as soon as each task is done
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    by_name = {task.name: task for task in tasks}
+    for task in tasks:
+        for name in task.depends:
+            if name not in by_name:
+                raise ValueError("ERROR: the dependency %s of the task %s is not a task." % (name, task.name))
+
+    source_keys: Dict[str, str] = {}
+    keys: Dict[str, str] = {}
+    outputs: Dict[str, str] = {}
+    failed: Dict[str, str] = {}
+    waiting = list(tasks)
+
+    executor = ProcessPoolExecutor(max_workers=workers or None) if workers != 1 else None
+    running: Dict[Future, Task] = {}
+    try:
+        while waiting or running:
+            ready = [task for task in waiting if all(name in outputs or name in failed for name in task.depends)]
+            for task in ready:
+                waiting.remove(task)
+                failed_depends = [name for name in task.depends if name in failed]
+                if failed_depends:
+                    failed[task.name] = "dependency failed: %s" % ", ".join(failed_depends)
+                    yield TaskResult(task, error=failed[task.name])
+                    continue
+
+                try:
+                    code = code_paths(task.stage, task.code)
+                    for source in list(task.sources) + code:
+                        if source not in source_keys:
+                            source_keys[source] = path_hash(source)
+                    keys[task.name] = task_key(task, [keys[name] for name in task.depends] +
+                                               [source_keys[source] for source in task.sources],
+                                               [source_keys[p_code] for p_code in code])
+                except Exception as err:
+                    failed[task.name] = repr(err)
+                    yield TaskResult(task, error=failed[task.name])
+                    continue
+                key = keys[task.name]
+
+                output = cache_lookup(cache_dir, key)
+                if output is not None:
+                    outputs[task.name] = output
+                    yield TaskResult(task, key, output, cached=True)
+                    continue
+
+                inputs = [outputs[name] for name in task.depends] + list(task.sources)
+                if executor is None:
+                    try:
+                        outputs[task.name] = run_task(task, inputs, cache_dir, key, metrics_file, trace_memory)
+                        yield TaskResult(task, key, outputs[task.name])
+                    except Exception as err:
+                        failed[task.name] = repr(err)
+                        yield TaskResult(task, key, error=failed[task.name])
+                else:
+                    running[executor.submit(run_task, task, inputs, cache_dir, key, metrics_file,
+                                            trace_memory)] = task
+
+            if not running:
+                if waiting and not ready:
+                    raise ValueError("ERROR: the dependencies of the tasks are cyclic: %s" %
+                                     ", ".join(task.name for task in waiting))
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                try:
+                    outputs[task.name] = future.result()
+                    yield TaskResult(task, keys[task.name], outputs[task.name])
+                except Exception as err:
+                    failed[task.name] = repr(err)
+                    yield TaskResult(task, keys[task.name], error=failed[task.name])
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
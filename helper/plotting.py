@@ -0,0 +1,124 @@
+"""
+©Rudina Subaih
+Aggregated rendering of many trajectory points (long runs, millions of points):
+- points: all points in one scatter layer.
+- lines: all trajectories in one LineCollection (one segment between consecutive frames of a pedestrian).
+- density: the points binned into a 2D density raster (vectorized with bincount), shown as one image.
+The heavy layers are rasterized, so vector outputs (pdf) contain one image instead of millions of paths.
+Only numpy is imported with the module, matplotlib when a layer is plotted.
+"""
+from typing import TYPE_CHECKING, Optional, Sequence, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
+PLOT_MODES = ("points", "lines", "density")
+
+
+def density_raster(x: npt.NDArray[np.float64], y: npt.NDArray[np.float64], bins: Tuple[int, int] = (400, 400),
+                   extent: Optional[Sequence[float]] = None) -> Tuple[npt.NDArray[np.int64], Tuple[float, ...]]:
+    """
+    count the points in a regular 2D grid
+    :param x: numpy array. x values
+    :param y: numpy array. y values
+    :param bins: (number of bins in x, number of bins in y)
+    :param extent: (x min, x max, y min, y max) of the grid (default: range of the data). Points outside are ignored
+    :return: counts (y bins x x bins, for imshow with origin="lower"), extent of the grid
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y = x[finite], y[finite]
+    if extent is None:
+        extent = (x.min(), x.max(), y.min(), y.max()) if len(x) else (0., 1., 0., 1.)
+    x_min, x_max, y_min, y_max = extent
+    nx, ny = bins
+
+    # bin index of each point (the last bin is closed)
+    ix = np.floor((x - x_min) / ((x_max - x_min) or 1.) * nx).astype(np.int64)
+    iy = np.floor((y - y_min) / ((y_max - y_min) or 1.) * ny).astype(np.int64)
+    ix[x == x_max] = nx - 1
+    iy[y == y_max] = ny - 1
+    inside = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+
+    counts = np.bincount(iy[inside] * nx + ix[inside], minlength=nx * ny).reshape(ny, nx)
+    return counts, tuple(extent)
+
+
+def trajectory_segments(ids: npt.NDArray[np.float64], frames: npt.NDArray[np.float64], x: npt.NDArray[np.float64],
+                        y: npt.NDArray[np.float64], max_jump: Optional[float] = None) -> npt.NDArray[np.float64]:
+    """
+    line segments between the consecutive frames of each pedestrian
+    :param ids: numpy array. pedestrian ids
+    :param frames: numpy array. frames
+    :param x: numpy array. x values
+    :param y: numpy array. y values
+    :param max_jump: float. no segment if x jumps more than max_jump (e.g. periodic boundary of the straight
+    trajectories, None => no limit)
+    :return: numpy array. segments (number of segments x 2 points x (x, y))
+    """
+    order = np.lexsort((frames, ids))
+    ids, frames, x, y = ids[order], frames[order], x[order], y[order]
+
+    # a segment connects a row with the next row of the same pedestrian in the next frame
+    connected = (ids[1:] == ids[:-1]) & (frames[1:] - frames[:-1] == 1)
+    if max_jump is not None:
+        connected &= np.abs(x[1:] - x[:-1]) <= max_jump
+    start = np.flatnonzero(connected)
+
+    segments = np.empty((len(start), 2, 2))
+    segments[:, 0, 0] = x[start]
+    segments[:, 0, 1] = y[start]
+    segments[:, 1, 0] = x[start + 1]
+    segments[:, 1, 1] = y[start + 1]
+    return segments
+
+
+def plot_trajectories(ax: "plt.Axes", ids: npt.NDArray[np.float64], frames: npt.NDArray[np.float64],
+                      x: npt.NDArray[np.float64], y: npt.NDArray[np.float64], mode: str = "lines",
+                      color: str = "black", size: float = 0.1, bins: Tuple[int, int] = (400, 400),
+                      extent: Optional[Sequence[float]] = None, max_jump: Optional[float] = None,
+                      cmap: str = "Greys", marker: str = ".", edge_width: Optional[float] = None):
+    """
+    plot the trajectories of all pedestrians as one rasterized layer
+    :param ax: matplotlib axes
+    :param ids: numpy array. pedestrian ids
+    :param frames: numpy array. frames
+    :param x: numpy array. x values to plot
+    :param y: numpy array. y values to plot (e.g. y or time)
+    :param mode: str. "points" (one scatter), "lines" (one LineCollection), or "density" (2D density raster)
+    :param color: str. color of the points or lines
+    :param size: float. marker area (points, scatter s) or line width (lines)
+    :param bins: (number of bins in x, number of bins in y) of the density raster
+    :param extent: (x min, x max, y min, y max) of the density raster (default: range of the data)
+    :param max_jump: float. no line if x jumps more than max_jump (lines)
+    :param cmap: str. color map of the density raster
+    :param marker: str. marker of the points
+    :param edge_width: float. width of the marker edges in the color of the points (None => matplotlib default). The
+    edges make the small points visible
+    :return: the plotted artist
+    """
+    from matplotlib.collections import LineCollection
+    from matplotlib.colors import LogNorm
+
+    if mode == "points":
+        return ax.scatter(x, y, s=size, c=color, marker=marker, edgecolors=color, linewidths=edge_width,
+                          rasterized=True)
+
+    if mode == "lines":
+        lines = LineCollection(trajectory_segments(ids, frames, x, y, max_jump), colors=color, linewidths=size,
+                               rasterized=True)
+        ax.add_collection(lines)
+        ax.autoscale_view()
+        return lines
+
+    if mode == "density":
+        counts, extent = density_raster(x, y, bins, extent)
+        # empty bins are transparent
+        return ax.imshow(np.ma.masked_equal(counts, 0), origin="lower", extent=extent, aspect="auto", cmap=cmap,
+                         norm=LogNorm(vmin=1, vmax=max(counts.max(), 1)), interpolation="nearest", rasterized=True)
+
+    raise ValueError("ERROR: unknown plot mode %s (%s)." % (mode, ", ".join(PLOT_MODES)))
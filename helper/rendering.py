@@ -0,0 +1,214 @@
+"""
+©Rudina Subaih
+Batch rendering of figures (many files and experiments) in a process pool:
+- each figure job runs one plot function on its input files and returns the paths of the saved figures.
+- the workers use the non-interactive Agg backend and load the plot style (plotsettings.mplystyle) once per worker.
+- a manifest in the output directory stores for each figure the key of the last rendering (hash of the plot function,
+  the content of its code (module of the plot function, plot script, helper modules), the content of the inputs, the
+  parameters, and the style). A figure whose key did not change and whose outputs
+  exist is not rendered again. The content hash of an input is only recomputed if its size or modification time
+  changed.
+"""
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from pipeline import code_paths, path_hash
+
+MANIFEST_FILE = ".figures.json"
+STYLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plotsettings.mplystyle")
+
+
+@dataclass
+class FigureJob:
+    """
+    One figure (or one group of figures of the same plot) to render:
+    - name: unique name of the job, e.g. "05_plot_x_t:croma_female_24_1".
+    - render: function render(inputs, path_output, **params) -> paths of the saved figures. It has to be a
+      module-level function (it is sent to the worker processes).
+    - inputs: paths of the input files.
+    - path_output: path of the directory to save the figures.
+    - params: parameters of the plot (e.g. title, mode), passed as keyword arguments.
+    - code: paths of the code files of the plot besides the module of the render function (e.g. the plot script and
+      the helper modules it uses). Their content is part of the key of the figure.
+    """
+
+    name: str
+    render: Callable[..., List[str]]
+    inputs: Sequence[str] = ()
+    path_output: str = "."
+    params: Dict[str, Any] = field(default_factory=dict)
+    code: Sequence[str] = ()
+
+
+@dataclass
+class FigureResult:
+    """
+    Result of a figure job:
+    - job: the job.
+    - outputs: paths of the figures.
+    - skipped: True => the inputs did not change and the figures were not rendered again.
+    - error: error message (None if the job did not fail).
+    """
+
+    job: FigureJob
+    outputs: List[str] = field(default_factory=list)
+    skipped: bool = False
+    error: Optional[str] = None
+
+
+def read_manifest(path: str) -> dict:
+    """
+    read the manifest of the rendered figures
+    :param path: str. path of the manifest (JSON)
+    :return: dict. {"inputs": path -> size, mtime, hash; "figures": job name -> key, outputs}
+    """
+    try:
+        with open(path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        manifest = {}
+    manifest.setdefault("inputs", {})
+    manifest.setdefault("figures", {})
+    return manifest
+
+
+def write_manifest(path: str, manifest: dict) -> None:
+    """
+    save the manifest (replaced in one step, so an interrupted run does not leave a broken manifest)
+    :param path: str. path of the manifest (JSON)
+    :param manifest: dict. manifest (read_manifest)
+    """
+    p_tmp = "%s.tmp-%d" % (path, os.getpid())
+    with open(p_tmp, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(p_tmp, path)
+
+
+def input_hash(path: str, inputs: Dict[str, dict]) -> str:
+    """
+    content hash of an input file. The hash of the manifest is reused if the size and modification time of the file
+    did not change
+    :param path: str. path of the input file (or directory)
+    :param inputs: dict. inputs of the manifest (updated with the new hash)
+    :return: str. hex digest
+    """
+    stat = os.stat(path)
+    p_abs = os.path.abspath(path)
+    known = inputs.get(p_abs)
+    if known is not None and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime_ns:
+        return known["hash"]
+
+    digest = path_hash(path)
+    inputs[p_abs] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": digest}
+    return digest
+
+
+def job_key(job: FigureJob, input_keys: Sequence[str], style: Optional[str], code_keys: Sequence[str] = ()) -> str:
+    """
+    key of a figure job
+    :param job: FigureJob
+    :param input_keys: list. content hashes of the inputs
+    :param style: str. path of the plot style (None => default style of matplotlib)
+    :param code_keys: list. content hashes of the code of the plot (code_paths)
+    :return: str. hex digest
+    """
+    key = {
+        "render": "%s.%s" % (job.render.__module__, job.render.__qualname__),
+        "code": list(code_keys),
+        "inputs": list(input_keys),
+        "params": job.params,
+        "style": path_hash(style) if style else None,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def init_worker(style: Optional[str]) -> None:
+    """
+    set up a worker process: Agg backend (no display) and the plot style, once per worker
+    :param style: str. path of the plot style (None => default style of matplotlib)
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    if style:
+        plt.style.use(style)
+
+
+def run_job(job: FigureJob) -> List[str]:
+    """
+    render the figures of a job
+    :param job: FigureJob
+    :return: list. paths of the saved figures
+    """
+    os.makedirs(job.path_output, exist_ok=True)
+    return list(job.render(list(job.inputs), job.path_output, **job.params))
+
+
+def render_figures(jobs: Sequence[FigureJob], manifest_path: str, workers: int = 0, style: Optional[str] = STYLE_FILE,
+                   force: bool = False) -> Iterator[FigureResult]:
+    """
+    render the figure jobs in parallel. Jobs whose code, inputs, parameters, and style did not change since the last
+    rendering (manifest) are skipped. A failing job does not stop the other jobs
+    :param jobs: list. FigureJobs (unique names)
+    :param manifest_path: str. path of the manifest (JSON, e.g. <output directory>/.figures.json)
+    :param workers: int. Number of worker processes (1 => no process pool, 0 => all CPUs)
+    :param style: str. path of the plot style (None => default style of matplotlib)
+    :param force: bool. True => render all jobs
+    :return: iterator of FigureResult as soon as each job is done
+    """
+    manifest = read_manifest(manifest_path)
+    figures = manifest["figures"]
+
+    todo = []
+    for job in jobs:
+        try:
+            key = job_key(job, [input_hash(p_input, manifest["inputs"]) for p_input in job.inputs], style,
+                          [input_hash(p_code, manifest["inputs"]) for p_code in code_paths(job.render, job.code)])
+        except Exception as err:
+            yield FigureResult(job, error=repr(err))
+            continue
+
+        entry = figures.get(job.name)
+        if not force and entry is not None and entry["key"] == key and all(map(os.path.exists, entry["outputs"])):
+            yield FigureResult(job, entry["outputs"], skipped=True)
+            continue
+        todo.append((job, key))
+
+    def done(job: FigureJob, key: str, outputs: List[str]) -> FigureResult:
+        # the manifest is saved after each job, so an interrupted run keeps the figures done so far
+        figures[job.name] = {"key": key, "outputs": outputs}
+        write_manifest(manifest_path, manifest)
+        return FigureResult(job, outputs)
+
+    if workers == 1:
+        init_worker(style)
+        for job, key in todo:
+            try:
+                outputs = run_job(job)
+            except Exception as err:
+                yield FigureResult(job, error=repr(err))
+                continue
+            yield done(job, key, outputs)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers or None, initializer=init_worker, initargs=(style,))
+    try:
+        running: Dict[Future, tuple] = {executor.submit(run_job, job): (job, key) for job, key in todo}
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                job, key = running.pop(future)
+                try:
+                    outputs = future.result()
+                except Exception as err:
+                    yield FigureResult(job, error=repr(err))
+                    continue
+                yield done(job, key, outputs)
+    finally:
+        executor.shutdown(cancel_futures=True)
@@ -0,0 +1,207 @@
+"""
+©Rudina Subaih
+Synthetic single-file trajectories in an oval corridor (or its straight part for side-view experiments) with known
+velocities, e.g. to test the analysis with large data:
+- the pedestrians walk in a velocity field v(s, t) along the corridor position s: the free speed times a speed
+  profile over time (transit states) times a stop-and-go wave travelling backwards. All pedestrians follow the same
+  field, so nobody overtakes.
+- missing detections (dropped rows) and ID breaks (a pedestrian gets a new id) can be injected at given rates.
+- the rows are in the unified format (id, fr, x, y, z, gender, time) in the coordinate system of the analysis (after
+  01_transformation_additional), generated frame by frame in chunks.
+"""
+import math
+import os
+import sys
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from experiments import ExperimentData
+
+
+@dataclass
+class SyntheticConfig:
+    """
+    Parameters of the synthetic trajectories:
+    - n_peds: number of pedestrians (evenly spaced along the corridor at the beginning).
+    - duration: duration of the experiment in seconds.
+    - speed: free speed in m/s.
+    - ramp: duration of the acceleration at the beginning and the deceleration at the end in seconds (transit states).
+    - speed_profile: optional factor of the speed over time, f(t in seconds) (replaces the ramps).
+    - stop_go_amplitude: relative speed reduction of the stop-and-go wave (0 => no wave, 1 => full stop).
+    - stop_go_period: period of the stop-and-go wave in seconds.
+    - stop_go_wavelength: wavelength of the stop-and-go wave in meters (default: corridor length).
+    - missing_rate: fraction of the detections that are dropped.
+    - id_break_rate: rate of ID breaks per pedestrian and second (the pedestrian gets a new id).
+    - noise: standard deviation of the position noise in meters.
+    - corridor_length: length of the closed corridor (default: 2 * length + 2 * pi * radius, circumference if the
+      radius is 0).
+    - seed: seed of the random numbers.
+    """
+
+    n_peds: int = 20
+    duration: float = 60
+    speed: float = 1.0
+    ramp: float = 5
+    speed_profile: Optional[Callable[[float], float]] = None
+    stop_go_amplitude: float = 0
+    stop_go_period: float = 20
+    stop_go_wavelength: Optional[float] = None
+    missing_rate: float = 0
+    id_break_rate: float = 0
+    noise: float = 0
+    corridor_length: Optional[float] = None
+    seed: Optional[int] = None
+
+
+def corridor_length(e: ExperimentData, config: SyntheticConfig) -> float:
+    """
+    :param e: ExperimentData. geometry of the experiment
+    :param config: SyntheticConfig
+    :return: float. length of the closed corridor
+    """
+    if config.corridor_length is not None:
+        return config.corridor_length
+    if e.radius:
+        return 2 * e.length + 2 * math.pi * e.radius
+    return e.circumference
+
+
+def oval_coordinates(s: npt.NDArray[np.float64], w: npt.NDArray[np.float64], length: float,
+                     r: float) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    coordinates in the oval corridor of positions along the corridor (inverse of transformation_coord)
+    :param s: numpy array. position along the corridor in [0, 2 * length + 2 * pi * r)
+    :param w: numpy array. lateral offset from the middle line of the corridor (positive outwards)
+    :param length: float. length of the straight part of the oval corridor in meter (ExperimentData.length)
+    :param r: float. Radius (ExperimentData.radius)
+    :return: x and y-coordinate
+    """
+    x = np.empty_like(s)
+    y = np.empty_like(s)
+    dist = r + w
+
+    # 1. lower straight part (walking forward)
+    lower = s <= length
+    x[lower] = s[lower]
+    y[lower] = 0 - w[lower]  # no -0.0 in the text files
+
+    # 2. right arc
+    right = (s > length) & (s <= length + math.pi * r)
+    angle = (s[right] - length) / r
+    x[right] = length + dist[right] * np.sin(angle)
+    y[right] = r - dist[right] * np.cos(angle)
+
+    # 3. upper straight part (walking backward)
+    upper = (s > length + math.pi * r) & (s <= 2 * length + math.pi * r)
+    x[upper] = 2 * length + math.pi * r - s[upper]
+    y[upper] = 2 * r + w[upper]
+
+    # 4. left arc
+    left = s > 2 * length + math.pi * r
+    angle = (s[left] - 2 * length - math.pi * r) / r
+    x[left] = -dist[left] * np.sin(angle)
+    y[left] = r + dist[left] * np.cos(angle)
+
+    return x, y
+
+
+def speed_field(s: npt.NDArray[np.float64], t: float, config: SyntheticConfig, c: float) -> npt.NDArray[np.float64]:
+    """
+    speed of the pedestrians at their positions
+    :param s: numpy array. position along the corridor
+    :param t: float. time in seconds
+    :param config: SyntheticConfig
+    :param c: float. length of the closed corridor
+    :return: numpy array. speed in m/s
+    """
+    if config.speed_profile is not None:
+        profile = config.speed_profile(t)
+    elif config.ramp > 0:
+        profile = min(1., t / config.ramp, (config.duration - t) / config.ramp)
+    else:
+        profile = 1.
+    speed = config.speed * max(profile, 0.)
+
+    if config.stop_go_amplitude:
+        wavelength = config.stop_go_wavelength or c
+        # the phase is constant for decreasing s over time => the wave travels backwards
+        wave = 0.5 * (1 + np.sin(2 * math.pi * (s / wavelength + t / config.stop_go_period)))
+        return speed * (1 - config.stop_go_amplitude * wave)
+    return np.full_like(s, speed)
+
+
+def iter_synthetic(e: ExperimentData, config: SyntheticConfig,
+                   chunk_frames: int = 1000) -> Iterator[Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]]:
+    """
+    generate synthetic trajectories frame by frame in chunks (sorted by frame). Side-view experiments
+    (camera_capture=1) only contain the rows inside the measurement area (Min, Max or the straight part)
+    :param e: ExperimentData. geometry and fps of the experiment
+    :param config: SyntheticConfig
+    :param chunk_frames: int. number of frames of each chunk
+    :return: iterator of (trajectory data (id, fr, x, y, z, gender, time), true speed of each row in m/s)
+    """
+    rng = np.random.default_rng(config.seed)
+    c = corridor_length(e, config)
+    n_frames = int(round(config.duration * e.fps))
+    n = config.n_peds
+
+    s = np.arange(n) * c / n  # position along the corridor
+    breaks = np.zeros(n, dtype=np.int64)  # number of ID breaks of each pedestrian
+
+    for start in range(0, n_frames, chunk_frames):
+        frames = np.arange(start, min(start + chunk_frames, n_frames))
+        positions = np.empty((len(frames), n))
+        speeds = np.empty((len(frames), n))
+        for i, fr in enumerate(frames):
+            speeds[i] = speed_field(s, fr / e.fps, config, c)
+            positions[i] = s
+            s = (s + speeds[i] / e.fps) % c
+
+        # ids: pedestrian + n * number of ID breaks so far (new ids never collide)
+        chunk_breaks = rng.random((len(frames), n)) < config.id_break_rate / e.fps
+        ids = np.arange(1, n + 1) + n * (breaks + np.cumsum(chunk_breaks, axis=0))
+        breaks += chunk_breaks.sum(axis=0)
+
+        positions = positions.ravel()
+        lateral = rng.normal(0, config.noise, positions.shape) if config.noise else np.zeros_like(positions)
+        if e.camera_capture == 0:
+            x, y = oval_coordinates(positions, lateral, e.length, e.radius)
+        else:
+            x, y = positions.copy(), lateral
+        if config.noise:
+            x += rng.normal(0, config.noise, x.shape)
+
+        rows = np.empty((len(positions), 7))
+        rows[:, 0] = ids.ravel()
+        rows[:, 1] = np.repeat(frames, n)
+        rows[:, 2] = x
+        rows[:, 3] = y
+        rows[:, 4] = 0
+        rows[:, 5] = 0
+        rows[:, 6] = rows[:, 1] / e.fps
+
+        keep = rng.random(len(rows)) >= config.missing_rate
+        if e.camera_capture == 1:
+            area_min = e.Min if e.Min is not None else 0
+            area_max = e.Max if e.Max is not None else e.length
+            keep &= (positions >= area_min) & (positions <= area_max)
+
+        yield rows[keep], speeds.ravel()[keep]
+
+
+def generate_synthetic(e: ExperimentData,
+                       config: SyntheticConfig) -> Tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    generate synthetic trajectories (see iter_synthetic)
+    :param e: ExperimentData. geometry and fps of the experiment
+    :param config: SyntheticConfig
+    :return: trajectory data (id, fr, x, y, z, gender, time) sorted by frame, true speed of each row in m/s
+    """
+    chunks = list(iter_synthetic(e, config))
+    if not chunks:
+        return np.empty((0, 7)), np.empty(0)
+    return np.concatenate([rows for rows, _ in chunks]), np.concatenate([speeds for _, speeds in chunks])
@@ -0,0 +1,734 @@
+"""
+©Rudina Subaih
+Reading and writing the data files of the analysis stages:
+- text files: whitespace (or delimiter) separated values with '#' comment header lines, e.g. PeTrack exports or
+  the unified format (#id	fr	x	y	z	gender	time). Files larger than CHUNK_BYTES are parsed in
+  parallel chunks (one thread per CPU by default)
+- binary columnar files: a directory (*.cols) with one .npy file per column and a small JSON schema sidecar. The
+  columns are opened memory-mapped, so a stage only reads the columns and rows it needs. Compact files store id and
+  fr as int32, gender as int8, and the other columns as float32 (half the size of float64 columns)
+- frame windows (e.g. steady state) of frame-sorted files are read without loading the whole file: binary search
+  on the memory-mapped frame column (binary columnar files), or the byte offsets of the frames in a sidecar index
+  (<file>.frames.npz, text files)
+- SQLite files (JuPedSim): read in chunks directly into numpy over a read-only connection (reused for all queries of
+  the file in a process). The frame and x ranges are filtered in the query. The index on frame, which speeds up
+  these queries, is only written into the file on request (create_index)
+Only numpy is imported with the module, pandas (C parser of the text files) is imported when a text file is parsed.
+"""
+import io
+import json
+import os
+import re
+import sqlite3
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, IO, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+BINARY_SUFFIX = ".cols"
+SCHEMA_FILE = "schema.json"
+FRAME_INDEX_SUFFIX = ".frames.npz"
+
+# size of the chunks of a text file parsed in parallel (bytes), and of the rows formatted at once when writing
+CHUNK_BYTES = 32 * 1024 * 1024
+CHUNK_ROWS = 100000
+
+TRAJ_HEADER = "#id\tfr\tx\ty\tz\tgender\ttime"
+TRAJ_FMT = "%d\t%d\t%.4f\t%.4f\t%.4f\t%d\t%.4f"
+VEL_H_RHO_HEADER = "#id\tfr\tx\ty\tz\tvelocity\theadway\trho"
+VEL_H_RHO_FMT = "%d\t%d\t%.4f\t%.4f\t%.4f\t%.4f\t%.4f\t%.4f"
+# columns saved as integers in the text files
+INT_COLUMNS = ("id", "fr", "gender")
+# dtypes of the columns of compact binary columnar files (the other columns are COMPACT_FLOAT)
+COMPACT_FLOAT = np.float32
+COMPACT_DTYPES = {"id": np.int32, "fr": np.int32, "gender": np.int8}
+
+# trajectory data of SQLite files (JuPedSim) in the unified order of TRAJ_HEADER (id, fr, x, y, z, gender, time; no z,
+# gender, and time in the file), and the columns of the trajectory_data table in the table order (frame, id, ...) for
+# the explicit column indices of 00_traj_file_format
+SQLITE_TRAJ_COLUMNS = ("id", "frame", "pos_x", "pos_y", "0", "0", "0")
+SQLITE_RAW_COLUMNS = ("frame", "id", "pos_x", "pos_y", "ori_x", "ori_y")
+SQLITE_INDEX = "create index if not exists trajectory_data_frame_id on trajectory_data (frame, id)"
+
+# open (read-only) SQLite connections: (process id, absolute path) -> connection. A forked worker process does not
+# reuse the connections of its parent
+_sqlite_connections: Dict[Tuple[int, str], sqlite3.Connection] = {}
+
+
+@dataclass
+class TextHeader:
+    """
+    Comment header of a text data file:
+    - framerate: frame per second (None if not in the header, e.g. "# framerate: 25 fps").
+    - columns: column names (the last comment line before the data, e.g. "# id frame x/m y/m z/m markerID").
+    - data_start: byte offset of the first data line.
+    """
+
+    framerate: Optional[float] = None
+    columns: List[str] = field(default_factory=list)
+    data_start: int = 0
+
+
+def read_header(path: str, skiprows: int = 0) -> TextHeader:
+    """
+    parse the comment header of a text data file
+    :param path: str. path of the text file
+    :param skiprows: int. number of lines to skip at the beginning of the file (e.g. header line without '#')
+    :return: TextHeader
+    """
+    header = TextHeader()
+    with open(path, "rb") as text_file:
+        for _ in range(skiprows):
+            text_file.readline()
+
+        last_comment = None
+        while True:
+            start = text_file.tell()
+            line = text_file.readline()
+            stripped = line.strip()
+            if line and (not stripped or stripped.startswith(b"#")):
+                if stripped:
+                    last_comment = stripped.lstrip(b"#").decode(errors="replace").strip()
+                    framerate = re.match(r"framerate:\s*([0-9.]+)", last_comment)
+                    if framerate:
+                        header.framerate = float(framerate.group(1))
+                continue
+            header.data_start = start
+            break
+
+    if last_comment is not None and ":" not in last_comment:
+        header.columns = last_comment.split()
+
+    return header
+
+
+def _chunk_ranges(path: str, start: int, chunk_bytes: int) -> List[Tuple[int, int]]:
+    """
+    split a text file from the byte offset start into byte ranges of about chunk_bytes ending at line ends
+    :param path: str. path of the text file
+    :param start: int. byte offset of the first data line
+    :param chunk_bytes: int. size of the chunks
+    :return: list of (start, end) byte offsets
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as text_file:
+        while start < size:
+            text_file.seek(min(start + chunk_bytes, size))
+            text_file.readline()  # move to the end of the line
+            end = min(text_file.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _parse_chunk(path: str, start: int, end: int, usecols: Optional[Sequence[int]],
+                 dtypes: Union[Dict[int, Any], Any], delimiter: Optional[str]) -> List[npt.NDArray[Any]]:
+    """
+    parse the data lines between the byte offsets start and end of a text file
+    :return: list of columns
+    """
+    with open(path, "rb") as text_file:
+        text_file.seek(start)
+        chunk = text_file.read(end - start)
+    return _parse_bytes(chunk, usecols, dtypes, delimiter)
+
+
+def _parse_bytes(chunk: bytes, usecols: Optional[Sequence[int]], dtypes: Union[Dict[int, Any], Any],
+                 delimiter: Optional[str]) -> List[npt.NDArray[Any]]:
+    """
+    parse data lines of a text file
+    :return: list of columns
+    """
+    import pandas as pd
+
+    try:
+        # the C parser of pandas releases the GIL, so the chunks can be parsed in threads
+        frame = pd.read_csv(io.BytesIO(chunk), sep=delimiter or r"\s+", header=None, comment="#", usecols=usecols,
+                            dtype=dtypes, engine="c", float_precision="round_trip")
+    except pd.errors.EmptyDataError:
+        return []
+
+    if usecols is not None:
+        frame = frame[list(usecols)]
+    return [frame[col].to_numpy() for col in frame.columns]
+
+
+def read_text_columns(path: str, usecols: Optional[Sequence[int]] = None, dtypes: Union[Sequence[Any], Any] = None,
+                      delimiter: Optional[str] = None, skiprows: int = 0, workers: int = 0,
+                      chunk_bytes: int = CHUNK_BYTES) -> List[npt.NDArray[Any]]:
+    """
+    parse the columns of a text data file. Only the requested columns are converted, each with its own dtype
+    :param path: str. path of the text file
+    :param usecols: list of column indices to read (default: all columns)
+    :param dtypes: list of dtypes of the read columns, e.g. (np.int32, np.int32, np.float32, ...), or one dtype of all
+    columns (default: float64)
+    :param delimiter: str. delimiter of the columns (default: any whitespace)
+    :param skiprows: int. number of lines to skip at the beginning of the file (e.g. header line without '#')
+    :param workers: int. number of threads to parse the chunks of files larger than chunk_bytes in parallel (0 => one
+    per CPU, 1 => no parallel parsing)
+    :param chunk_bytes: int. size of the chunks in bytes
+    :return: list of columns (numpy arrays)
+    """
+    header = read_header(path, skiprows)
+    workers = workers or os.cpu_count() or 1
+
+    if dtypes is None:
+        dtypes = np.float64
+    elif isinstance(dtypes, (list, tuple)):
+        dtypes = dict(zip(usecols, dtypes)) if usecols is not None else dict(enumerate(dtypes))
+
+    ranges = _chunk_ranges(path, header.data_start, chunk_bytes if workers > 1 else os.path.getsize(path))
+    if workers > 1 and len(ranges) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(lambda r: _parse_chunk(path, r[0], r[1], usecols, dtypes, delimiter), ranges))
+    else:
+        chunks = [_parse_chunk(path, start, end, usecols, dtypes, delimiter) for start, end in ranges]
+
+    chunks = [chunk for chunk in chunks if len(chunk)]
+    if len(chunks) == 0:
+        n_cols = len(usecols) if usecols is not None else len(header.columns)
+        return [np.empty(0) for _ in range(n_cols)]
+    return [np.concatenate(columns) for columns in zip(*chunks)]
+
+
+def read_text(path: str, usecols: Optional[Sequence[int]] = None, delimiter: Optional[str] = None,
+              skiprows: int = 0, workers: int = 0, dtype: Any = np.float64) -> npt.NDArray[np.float64]:
+    """
+    parse a text data file to a float64 numpy array (fast replacement of np.loadtxt)
+    :param path: str. path of the text file
+    :param usecols: list of column indices to read (default: all columns)
+    :param delimiter: str. delimiter of the columns (default: any whitespace)
+    :param skiprows: int. number of lines to skip at the beginning of the file (e.g. header line without '#')
+    :param workers: int. number of threads to parse the chunks of large files in parallel (0 => one per CPU)
+    :param dtype: dtype of the array (e.g. COMPACT_FLOAT, default: float64)
+    :return: numpy array (rows x columns)
+    """
+    columns = read_text_columns(path, usecols, dtype, delimiter=delimiter, skiprows=skiprows, workers=workers)
+    if len(columns) == 0:
+        return np.empty((0, 0), dtype=dtype)
+    return np.column_stack(columns).astype(dtype, copy=False)
+
+
+def write_text(path: str, data: npt.NDArray[np.float64], header: str, fmt: str, newline: str = "\r\n") -> None:
+    """
+    save the data as text file (fast replacement of np.savetxt, same output). The rows are formatted in chunks with
+    one format operation instead of one per row
+    :param path: str. path of the text file
+    :param data: numpy array. Data (rows x columns)
+    :param header: str. header line
+    :param fmt: str. format of a row, e.g. "%d\t%d\t%.4f"
+    :param newline: str. line end
+    """
+    with open(path, "w", newline="") as text_file:
+        text_file.write(header + newline)
+        write_text_rows(text_file, data, fmt, newline)
+
+
+def write_text_rows(text_file: IO[str], data: npt.NDArray[np.float64], fmt: str, newline: str = "\r\n") -> None:
+    """
+    append rows to an open text file (opened with newline="")
+    :param text_file: open text file
+    :param data: numpy array. Data (rows x columns)
+    :param fmt: str. format of a row, e.g. "%d\t%d\t%.4f"
+    :param newline: str. line end
+    """
+    row_fmt = fmt + newline
+    for start in range(0, len(data), CHUNK_ROWS):
+        chunk = data[start:start + CHUNK_ROWS]
+        text_file.write((row_fmt * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+
+def header_columns(header: str) -> List[str]:
+    """
+    column names of a header line
+    :param header: str. header line (e.g. #id	fr	x	y	z)
+    :return: list of column names
+    """
+    return header.lstrip("#").split("\t")
+
+
+def vel_h_rho_columns(delta_ts: Sequence[float]) -> List[str]:
+    """
+    column names of a velocity, headway, and rho file with one velocity column per delta_t
+    :param delta_ts: list of the time constants of the velocity columns
+    :return: list of column names (velocity for a single delta_t, otherwise velocity_<delta_t>)
+    """
+    velocities = ["velocity"] if len(delta_ts) == 1 else ["velocity_%g" % delta_t for delta_t in delta_ts]
+    return ["id", "fr", "x", "y", "z"] + velocities + ["headway", "rho"]
+
+
+def columns_format(columns: Sequence[str]) -> Tuple[str, str]:
+    """
+    header line and row format of a text file with the given columns
+    :param columns: list of column names
+    :return: header line, row format (integers for id, fr, and gender, otherwise 4 decimals)
+    """
+    header = "#" + "\t".join(columns)
+    fmt = "\t".join("%d" if name in INT_COLUMNS else "%.4f" for name in columns)
+    return header, fmt
+
+
+def is_binary(path: str) -> bool:
+    """
+    check if the path is a binary columnar data file
+    :param path: str. path of the data file
+    :return: bool
+    """
+    return os.path.isfile(os.path.join(path, SCHEMA_FILE))
+
+
+def read_schema(path: str) -> Dict[str, Any]:
+    """
+    read the JSON schema of a binary columnar data file
+    :param path: str. path of the binary data file (directory)
+    :return: dict. columns, dtypes, and number of rows
+    """
+    with open(os.path.join(path, SCHEMA_FILE)) as schema_file:
+        return json.load(schema_file)
+
+
+def compact_dtype(name: str) -> np.dtype:
+    """
+    dtype of a column of compact binary columnar files
+    :param name: str. column name
+    :return: numpy dtype (int32 for id and fr, int8 for gender, otherwise COMPACT_FLOAT)
+    """
+    return np.dtype(COMPACT_DTYPES.get(name, COMPACT_FLOAT))
+
+
+def save_columns(path: str, data: npt.NDArray[np.float64], columns: Sequence[str],
+                 sorted_by: Optional[str] = None, compact: bool = False) -> None:
+    """
+    save the data as binary columnar data file (one .npy file per column + JSON schema)
+    :param path: str. path of the binary data file (directory)
+    :param data: numpy array. Data (rows x columns)
+    :param columns: list of column names
+    :param sorted_by: str. name of the column the rows are sorted by (e.g. "fr"), saved in the schema
+    :param compact: bool. True => columns saved with the compact dtypes (compact_dtype), False => dtype of the data
+    """
+    if data.shape[1] != len(columns):
+        raise ValueError("ERROR: %d columns in the data but %d column names." % (data.shape[1], len(columns)))
+
+    dtypes = [compact_dtype(name) if compact else data.dtype for name in columns]
+    os.makedirs(path, exist_ok=True)
+    for i, (name, dtype) in enumerate(zip(columns, dtypes)):
+        np.save(os.path.join(path, "%s.npy" % name), np.ascontiguousarray(data[:, i], dtype=dtype))
+
+    # the schema is written last, a file without schema is incomplete
+    schema = {
+        "columns": list(columns),
+        "dtypes": {name: dtype.str for name, dtype in zip(columns, dtypes)},
+        "rows": int(data.shape[0]),
+    }
+    if sorted_by is not None:
+        schema["sorted_by"] = sorted_by
+    with open(os.path.join(path, SCHEMA_FILE), "w") as schema_file:
+        json.dump(schema, schema_file, indent=2)
+
+
+def open_column(path: str, name: str) -> np.memmap:
+    """
+    open one column of a binary columnar data file memory-mapped (read only)
+    :param path: str. path of the binary data file (directory)
+    :param name: str. column name
+    :return: numpy memmap
+    """
+    return np.load(os.path.join(path, "%s.npy" % name), mmap_mode="r")
+
+
+def load_columns(path: str, columns: Optional[Sequence[str]] = None,
+                 rows: Union[slice, npt.NDArray[Any], None] = None, dtype: Any = None) -> npt.NDArray[np.float64]:
+    """
+    read columns of a binary columnar data file. Only the requested columns and rows are read from the disk
+    :param path: str. path of the binary data file (directory)
+    :param columns: list of column names (default: all columns of the schema)
+    :param rows: slice, boolean mask, or row indices to read (default: all rows)
+    :param dtype: dtype of the array, the columns are converted while they are copied into it (default: common dtype
+    of the columns, float64 for the int32 and float32 columns of compact files)
+    :return: numpy array (rows x columns)
+    """
+    if columns is None:
+        columns = read_schema(path)["columns"]
+
+    arrays = []
+    for name in columns:
+        column = open_column(path, name)
+        arrays.append(column if rows is None else column[rows])
+
+    if dtype is None:
+        return np.column_stack([np.asarray(array) for array in arrays])
+
+    data = np.empty((len(arrays[0]) if arrays else 0, len(arrays)), dtype=dtype)
+    for i, array in enumerate(arrays):
+        data[:, i] = array
+    return data
+
+
+def read_data(path: str, usecols: Optional[Sequence[int]] = None, dtype: Any = np.float64,
+              workers: int = 0) -> npt.NDArray[np.float64]:
+    """
+    read a data file of an analysis stage (text or binary columnar)
+    :param path: str. path of the data file
+    :param usecols: list of column indices to read (default: all columns)
+    :param dtype: dtype of the array (e.g. COMPACT_FLOAT, default: float64)
+    :param workers: int. number of threads to parse the chunks of large text files in parallel (0 => one per CPU)
+    :return: numpy array
+    """
+    if is_binary(path):
+        columns = read_schema(path)["columns"]
+        if usecols is not None:
+            columns = [columns[i] for i in usecols]
+        return load_columns(path, columns, dtype=dtype)
+
+    return read_text(path, usecols, workers=workers, dtype=dtype)
+
+
+def write_data(path_base: str, data: npt.NDArray[np.float64], header: str, fmt: str, binary: bool = False,
+               sorted_by: Optional[str] = None, compact: bool = False) -> str:
+    """
+    save the data file of an analysis stage
+    :param path_base: str. path of the output file without extension
+    :param data: numpy array. Data to save
+    :param header: str. header line (column names)
+    :param fmt: str. format of the text file rows
+    :param binary: bool. True => binary columnar data file (*.cols), False => text file (*.txt)
+    :param sorted_by: str. name of the column the rows are sorted by, e.g. "fr" (binary columnar data file)
+    :param compact: bool. True => compact dtypes of the columns (binary columnar data file)
+    :return: str. path of the saved file
+    """
+    if binary:
+        path = path_base + BINARY_SUFFIX
+        save_columns(path, data, header_columns(header), sorted_by, compact)
+    else:
+        path = path_base + ".txt"
+        write_text(path, data, header, fmt)
+
+    return path
+
+
+@dataclass
+class FrameOffsets:
+    """
+    Frame index of a text data file sorted by frame (sidecar <file>.frames.npz):
+    - frames: frame numbers (ascending).
+    - starts: byte offset of the first row of each frame.
+    - ends: byte offset after the last row of each frame.
+    """
+
+    frames: npt.NDArray[np.float64]
+    starts: npt.NDArray[np.int64]
+    ends: npt.NDArray[np.int64]
+
+    def window(self, st: float, en: float) -> Tuple[int, int]:
+        """
+        byte range of the rows with st < frame < en (same window as extract_steady_state)
+        :param st: float. start frame
+        :param en: float. end frame
+        :return: (start, end) byte offsets (start == end if there are no rows)
+        """
+        first = np.searchsorted(self.frames, st, side="right")
+        last = np.searchsorted(self.frames, en, side="left")
+        if first >= last:
+            return 0, 0
+        return int(self.starts[first]), int(self.ends[last - 1])
+
+
+def _scan_frame_offsets(path: str, fr_col: int = 1) -> Optional[FrameOffsets]:
+    """
+    scan the frame column of a text data file chunk by chunk for the byte offsets of the frames
+    :param path: str. path of the text file
+    :param fr_col: int. column index of the frame
+    :return: FrameOffsets (None if the rows are not sorted by frame, or the data has comment or empty lines)
+    """
+    header = read_header(path)
+    frames = []
+    starts = []
+    last_frame = None
+    end = header.data_start
+    with open(path, "rb") as text_file:
+        for start, end in _chunk_ranges(path, header.data_start, CHUNK_BYTES):
+            text_file.seek(start)
+            chunk = text_file.read(end - start)
+            columns = _parse_bytes(chunk, [fr_col], np.float64, None)
+            if not columns:
+                return None
+            fr = columns[0]
+            line_starts = np.concatenate(([0], np.flatnonzero(np.frombuffer(chunk, np.uint8) == ord("\n")) + 1))
+            line_starts = line_starts[line_starts < len(chunk)]
+            if len(line_starts) != len(fr) or (np.diff(fr) < 0).any() or \
+                    (last_frame is not None and fr[0] < last_frame):
+                return None
+
+            # the first row of each frame (a frame can continue from the previous chunk)
+            first_rows = np.concatenate(([0], np.flatnonzero(np.diff(fr)) + 1))
+            if fr[0] == last_frame:
+                first_rows = first_rows[1:]
+            frames.append(fr[first_rows])
+            starts.append(start + line_starts[first_rows])
+            last_frame = fr[-1]
+
+    if not frames:
+        return FrameOffsets(np.empty(0), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    starts = np.concatenate(starts).astype(np.int64)
+    return FrameOffsets(np.concatenate(frames), starts, np.append(starts[1:], end))
+
+
+def frame_offsets(path: str) -> Optional[FrameOffsets]:
+    """
+    frame index of a text data file sorted by frame. The index is saved as sidecar file (<file>.frames.npz) at the
+    first call and used while the data file is not changed
+    :param path: str. path of the text file
+    :return: FrameOffsets (None if the rows are not sorted by frame)
+    """
+    p_index = path + FRAME_INDEX_SUFFIX
+    stat = os.stat(path)
+    try:
+        with np.load(p_index) as index:
+            if index["size"] == stat.st_size and index["mtime"] == stat.st_mtime_ns:
+                if not index["sorted"]:
+                    return None
+                return FrameOffsets(index["frames"], index["starts"], index["ends"])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    offsets = _scan_frame_offsets(path)
+    try:
+        with open(p_index, "wb") as index_file:
+            if offsets is None:
+                np.savez(index_file, size=stat.st_size, mtime=stat.st_mtime_ns, sorted=False)
+            else:
+                np.savez(index_file, size=stat.st_size, mtime=stat.st_mtime_ns, sorted=True, frames=offsets.frames,
+                         starts=offsets.starts, ends=offsets.ends)
+    except OSError:  # e.g. read-only directory: the index is not saved
+        pass
+    return offsets
+
+
+def _merge_ranges(ranges: Sequence[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    merge overlapping (start, end) ranges
+    :param ranges: list of (start, end)
+    :return: sorted list of (start, end) without overlaps
+    """
+    merged = []
+    for start, end in sorted(r for r in ranges if r[0] < r[1]):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def read_frame_windows(path: str, windows: Sequence[Tuple[float, float]], usecols: Optional[Sequence[int]] = None,
+                       dtype: Any = np.float64) -> List[npt.NDArray[np.float64]]:
+    """
+    read only the rows of frame windows (st < frame < en, e.g. steady states) of a data file. The rows of files sorted
+    by frame are found by binary search (binary columnar files) or the frame index (text files), overlapping windows
+    are read once. Other files are read completely once
+    :param path: str. path of the data file (the frame is the second column, "fr")
+    :param windows: list of (start frame, end frame)
+    :param usecols: list of column indices to read (default: all columns)
+    :param dtype: dtype of the arrays (e.g. COMPACT_FLOAT, default: float64)
+    :return: list of numpy arrays, the rows of each window
+    """
+    if is_binary(path):
+        schema = read_schema(path)
+        columns = schema["columns"]
+        if usecols is not None:
+            columns = [columns[i] for i in usecols]
+        fr = open_column(path, "fr")
+        if schema.get("sorted_by") == "fr":
+            return [load_columns(path, columns, rows=slice(np.searchsorted(fr, st, side="right"),
+                                                           np.searchsorted(fr, en, side="left")), dtype=dtype)
+                    for st, en in windows]
+        return [load_columns(path, columns, rows=(fr > st) & (fr < en), dtype=dtype) for st, en in windows]
+
+    # the frame column is read too, to split the read rows into the windows
+    cols = list(usecols) if usecols is not None else None
+    fr_pos = 1
+    if cols is not None:
+        if 1 not in cols:
+            cols.append(1)
+        fr_pos = cols.index(1)
+    n_out = len(usecols) if usecols is not None else None
+
+    offsets = frame_offsets(path)
+    if offsets is None:
+        parts = [read_text(path, cols, dtype=dtype)]
+    else:
+        parts = []
+        with open(path, "rb") as text_file:
+            for start, end in _merge_ranges([offsets.window(st, en) for st, en in windows]):
+                text_file.seek(start)
+                columns = _parse_bytes(text_file.read(end - start), cols, dtype, None)
+                if columns:
+                    parts.append(np.column_stack(columns))
+
+    n_cols = len(cols) if cols is not None else len(read_header(path).columns)
+    parts = [part for part in parts if part.ndim == 2 and len(part)] or [np.empty((0, n_cols), dtype=dtype)]
+    results = []
+    for st, en in windows:
+        window_rows = np.concatenate([part[(part[:, fr_pos] > st) & (part[:, fr_pos] < en)] for part in parts])
+        results.append(window_rows[:, :n_out] if n_out is not None else window_rows)
+    return results
+
+
+def create_sqlite_index(path: str) -> bool:
+    """
+    create the index on frame (and id) of the trajectory_data table if the SQLite file does not have it yet. This
+    changes the file, it is only done on request (e.g. -index of the stage scripts)
+    :param path: str. path of the SQLite file
+    :return: bool. True => the file has the index (False => read-only file, it is queried without index)
+    """
+    if not os.path.isfile(path):  # sqlite3.connect would create an empty database
+        raise ValueError("ERROR: the SQLite file %s does not exist." % path)
+    con = sqlite3.connect(path)
+    try:
+        con.execute(SQLITE_INDEX)
+        con.commit()
+        return True
+    except sqlite3.OperationalError:  # read-only file
+        return False
+    finally:
+        con.close()
+
+
+def sqlite_connection(path: str, create_index: bool = False) -> sqlite3.Connection:
+    """
+    read-only connection to a SQLite file (the file is not changed). The connection is opened once per process and
+    reused for all queries of the file
+    :param path: str. path of the SQLite file
+    :param create_index: bool. True => create the index on frame (and id) first if the file does not have it yet (the
+    file is changed once, see create_sqlite_index)
+    :return: sqlite3.Connection
+    """
+    p_abs = os.path.abspath(path)
+    if create_index:
+        create_sqlite_index(p_abs)
+    key = (os.getpid(), p_abs)
+    con = _sqlite_connections.get(key)
+    if con is None:
+        if not os.path.isfile(p_abs):
+            raise ValueError("ERROR: the SQLite file %s does not exist." % path)
+        con = sqlite3.connect("%s?mode=ro" % Path(p_abs).as_uri(), uri=True)
+        _sqlite_connections[key] = con
+    return con
+
+
+def close_sqlite_connections() -> None:
+    """
+    close the open SQLite connections of this process (the connections inherited from a parent process are left to
+    the parent)
+    """
+    pid = os.getpid()
+    for key in [key for key in _sqlite_connections if key[0] == pid]:
+        _sqlite_connections.pop(key).close()
+
+
+def sqlite_query(columns: Sequence[str], frame_range: Optional[Tuple[float, float]] = None,
+                 x_range: Optional[Tuple[float, float]] = None) -> Tuple[str, List[float]]:
+    """
+    query of the trajectory data of a SQLite file sorted by frame and id
+    :param columns: list. column names (or SQL expressions) of the trajectory_data table
+    :param frame_range: (first frame, last frame) to read (None => all frames)
+    :param x_range: (min x, max x) to read, e.g. the measurement area (None => all positions)
+    :return: str. query, list. parameters of the query
+    """
+    conditions = []
+    params = []
+    if frame_range is not None:
+        conditions.append("frame between ? and ?")
+        params.extend(frame_range)
+    if x_range is not None:
+        conditions.append("pos_x between ? and ?")
+        params.extend(x_range)
+
+    where = " where " + " and ".join(conditions) if conditions else ""
+    return "select %s from trajectory_data%s order by frame, id" % (", ".join(columns), where), params
+
+
+def iter_sqlite_chunks(path: str, chunk_rows: int = CHUNK_ROWS, columns: Sequence[str] = SQLITE_TRAJ_COLUMNS,
+                       frame_range: Optional[Tuple[float, float]] = None, x_range: Optional[Tuple[float, float]] = None,
+                       create_index: bool = False) -> Iterator[npt.NDArray[np.float64]]:
+    """
+    read the trajectory data of a SQLite file sorted by frame in chunks of rows. Only the rows inside the frame and x
+    ranges are read
+    :param path: str. path of the SQLite file
+    :param chunk_rows: int. number of rows of a chunk
+    :param columns: list. column names of the trajectory_data table (default: id, fr, x, y, z, gender, time)
+    :param frame_range: (first frame, last frame) to read (None => all frames)
+    :param x_range: (min x, max x) to read (None => all positions)
+    :param create_index: bool. True => create the index on frame (and id) if the file does not have it yet (the file
+    is changed)
+    :return: iterator of numpy arrays
+    """
+    query, params = sqlite_query(columns, frame_range, x_range)
+    cursor = sqlite_connection(path, create_index).execute(query, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            # the values of the rows go directly into the array without a list of rows in between
+            yield np.fromiter(chain.from_iterable(rows), dtype=np.float64,
+                              count=len(rows) * len(columns)).reshape(len(rows), len(columns))
+    finally:
+        cursor.close()
+
+
+def read_sqlite(path: str, columns: Sequence[str] = SQLITE_TRAJ_COLUMNS, frame_range: Optional[Tuple[float, float]] = None,
+                x_range: Optional[Tuple[float, float]] = None, create_index: bool = False) -> npt.NDArray[np.float64]:
+    """
+    read the trajectory data of a SQLite file sorted by frame (see iter_sqlite_chunks)
+    :param path: str. path of the SQLite file
+    :param columns: list. column names of the trajectory_data table (default: id, fr, x, y, z, gender, time)
+    :param frame_range: (first frame, last frame) to read (None => all frames)
+    :param x_range: (min x, max x) to read (None => all positions)
+    :param create_index: bool. True => create the index on frame (and id) if the file does not have it yet (the file
+    is changed)
+    :return: numpy array
+    """
+    chunks = list(iter_sqlite_chunks(path, columns=columns, frame_range=frame_range, x_range=x_range,
+                                     create_index=create_index))
+    if not chunks:
+        return np.empty((0, len(columns)))
+    return np.concatenate(chunks)
+
+
+def iter_chunks(path: str, usecols: Optional[Sequence[int]] = None,
+                chunk_rows: int = CHUNK_ROWS) -> Iterator[npt.NDArray[np.float64]]:
+    """
+    read a data file (text, binary columnar, or SQLite) in chunks of rows, without loading the whole file
+    :param path: str. path of the data file
+    :param usecols: list of column indices to read (default: all columns, SQLite files: of SQLITE_TRAJ_COLUMNS)
+    :param chunk_rows: int. number of rows of a chunk
+    :return: iterator of numpy arrays
+    """
+    if is_binary(path):
+        schema = read_schema(path)
+        columns = schema["columns"]
+        if usecols is not None:
+            columns = [columns[i] for i in usecols]
+        mapped = [open_column(path, name) for name in columns]
+        for start in range(0, schema["rows"], chunk_rows):
+            yield np.column_stack([column[start:start + chunk_rows] for column in mapped])
+    elif os.path.splitext(path)[1] == ".sqlite":
+        columns = SQLITE_TRAJ_COLUMNS if usecols is None else [SQLITE_TRAJ_COLUMNS[i] for i in usecols]
+        yield from iter_sqlite_chunks(path, chunk_rows, columns)
+    else:
+        import pandas as pd
+
+        header = read_header(path)
+        with open(path, "rb") as text_file:
+            text_file.seek(header.data_start)
+            for frame in pd.read_csv(text_file, sep=r"\s+", header=None, comment="#", usecols=usecols,
+                                     dtype=np.float64, chunksize=chunk_rows, engine="c",
+                                     float_precision="round_trip"):
+                if usecols is not None:
+                    frame = frame[list(usecols)]
+                yield frame.to_numpy()
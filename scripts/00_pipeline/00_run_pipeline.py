@@ -0,0 +1,332 @@
+"""
+©Rudina Subaih
+Run the preprocessing stages from the raw trajectory files to the (steady-state) velocity, headway, and rho files:
+00_traj_file_format -> 01_transformation_additional -> 02_transformation_straight_traj -> 00_cal_vel_rho_headway ->
+01_extract_steady_state_data
+The stages of each file (and of each delta_t) run in parallel. The outputs of the stages are cached by the hash of
+the input file, the experiment, the stage parameters, and the code (this script, the stage script, and the helper
+modules), so only the stages affected by a change are run again
+"""
+import argparse
+import glob
+import importlib.util
+import os
+import shutil
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from experiments import EXPERIMENTS
+from pipeline import Task, evict_cache, run_tasks
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# code of all stages (part of the cache key of each task, besides the stage script)
+HELPER_CODE = tuple(sorted(glob.glob(os.path.join(os.path.dirname(SCRIPTS_DIR), "helper", "*.py"))))
+
+
+def load_script(path: str, name: str):
+    """
+    import a stage script (the file names of the scripts are not valid module names)
+    :param path: str. path of the script relative to the scripts directory
+    :param name: str. module name
+    :return: module
+    """
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS_DIR, path))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+traj_file_format = load_script("01_trajectory_data_preperation/00_traj_file_format.py", "traj_file_format")
+transformation_additional = load_script("01_trajectory_data_preperation/01_transformation_additional.py",
+                                        "transformation_additional")
+transformation_straight_traj = load_script("01_trajectory_data_preperation/02_transformation_straight_traj.py",
+                                           "transformation_straight_traj")
+cal_vel_rho_headway = load_script("02_calculate_vel_rho_headway/00_cal_vel_rho_headway.py", "cal_vel_rho_headway")
+extract_steady_state_data = load_script("02_calculate_vel_rho_headway/01_extract_steady_state_data.py",
+                                        "extract_steady_state_data")
+
+
+def get_parser_args() -> argparse.Namespace:
+    """
+    Arguments required from user to input
+    :return: parser of arguments
+    """
+    parser = argparse.ArgumentParser(description="Run the preprocessing stages with cached stage outputs")
+    parser.add_argument(
+        "-p",
+        "--path",
+        help="Enter the path to the directory containing the raw trajectory files"
+    )
+    parser.add_argument(
+        "-n",
+        "--fileName",
+        help="Enter the names of the trajectory files",
+        nargs="+"
+    )
+    parser.add_argument(
+        "-expk",
+        "--expKey",
+        help="Enter the experiment key: " + " , ".join(EXPERIMENTS.keys()),
+    )
+    parser.add_argument(
+        "-po",
+        "--pathOutput",
+        help="Enter the path to save the output"
+    )
+    parser.add_argument(
+        "-format",
+        "--formatColumns",
+        type=int,
+        nargs=7,
+        metavar=("ID", "FR", "X", "Y", "Z", "GENDER", "TIME"),
+        help="Run 00_traj_file_format with these column indices of the raw files (-1 => no z/gender/time column)"
+    )
+    parser.add_argument(
+        "-deli",
+        "--delimiter",
+        help="Enter the delimiter of the raw trajectory files (00_traj_file_format)"
+    )
+    parser.add_argument(
+        "-index",
+        "--sqliteIndex",
+        action="store_true",
+        help="Create the index on frame in SQLite files which do not have it yet (faster queries, the file is changed)"
+    )
+    parser.add_argument(
+        "-ta",
+        "--transformAdditional",
+        action="store_true",
+        help="Run 01_transformation_additional"
+    )
+    parser.add_argument(
+        "-ts",
+        "--transformStraight",
+        action="store_true",
+        help="Run 02_transformation_straight_traj (oval top-view experiments)"
+    )
+    parser.add_argument(
+        "-delta",
+        "--deltaTime",
+        type=float,
+        default=[0.4],
+        nargs="+",
+        help="Enter the time constants to calculate the velocity (default=0.4)"
+    )
+    parser.add_argument(
+        "-s",
+        "--start",
+        type=float,
+        nargs="+",
+        help="Enter the start frame of the steady state for each file (runs 01_extract_steady_state_data)"
+    )
+    parser.add_argument(
+        "-auto",
+        "--autoSteadyState",
+        action="store_true",
+        help="Run 01_extract_steady_state_data with the automatically detected steady state of each file"
+    )
+    parser.add_argument(
+        "-e",
+        "--end",
+        type=float,
+        nargs="+",
+        help="Enter the end frame of the steady state for each file"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=0,
+        help="Enter the number of worker processes (default=0 => all CPUs, 1 => no parallel stages)"
+    )
+    parser.add_argument(
+        "-b",
+        "--binary",
+        action="store_true",
+        help="Save the outputs in the binary columnar format (one .npy file per column, memory-mapped reads)"
+    )
+    parser.add_argument(
+        "-compact",
+        "--compact",
+        action="store_true",
+        help="Compact mode: float32 data in the stages after the format unification (binary outputs: int32 id and "
+             "frame, int8 gender, float32 other columns)"
+    )
+    parser.add_argument(
+        "-c",
+        "--cacheDir",
+        help="Enter the path of the cache directory (default=<pathOutput>/.cache)"
+    )
+    parser.add_argument(
+        "-budget",
+        "--cacheBudget",
+        type=float,
+        default=1024,
+        help="Enter the disk budget of the cache in MB. The least recently used entries are removed (default=1024)"
+    )
+    parser.add_argument(
+        "-metrics",
+        "--metricsFile",
+        help="Enter the path of the file to append the run metrics of each stage run (JSON lines)"
+    )
+    parser.add_argument(
+        "-tm",
+        "--traceMemory",
+        action="store_true",
+        help="Trace the peak memory of each stage run with tracemalloc (slower)"
+    )
+    return parser.parse_args()
+
+
+def stage_traj_file_format(inputs: List[str], path_output: str, exp_key: str, delimiter: Optional[str],
+                           columns: Sequence[int], binary: bool, sqlite_index: bool = False) -> str:
+    """
+    stage task of 00_traj_file_format.format_file (the framerate in the header is checked against the experiment)
+    """
+    return traj_file_format.format_file(inputs[0], path_output, delimiter, *columns, binary=binary,
+                                        sqlite_index=sqlite_index, exp_key=exp_key)
+
+
+def stage_transformation_additional(inputs: List[str], path_output: str, exp_key: str, binary: bool,
+                                    compact: bool = False, sqlite_index: bool = False) -> str:
+    """
+    stage task of 01_transformation_additional.transform_file
+    """
+    return transformation_additional.transform_file(inputs[0], path_output, exp_key, binary, compact, sqlite_index)
+
+
+def stage_transformation_straight_traj(inputs: List[str], path_output: str, exp_key: str, binary: bool,
+                                       compact: bool = False) -> str:
+    """
+    stage task of 02_transformation_straight_traj.transform_file
+    """
+    e = EXPERIMENTS[exp_key]
+    return transformation_straight_traj.transform_file(inputs[0], path_output, e.length, e.radius, binary, compact)
+
+
+def stage_cal_vel_rho_headway(inputs: List[str], path_output: str, exp_key: str, delta_t: float, binary: bool,
+                              compact: bool = False) -> str:
+    """
+    stage task of 00_cal_vel_rho_headway.calculate_file
+    """
+    e = EXPERIMENTS[exp_key]
+    return cal_vel_rho_headway.calculate_file(inputs[0], path_output, e.fps, e.circumference, e.camera_capture,
+                                              delta_t, binary, compact=compact)
+
+
+def stage_extract_steady_state_data(inputs: List[str], path_output: str, exp_key: str, st: Optional[float],
+                                    en: Optional[float], binary: bool, compact: bool = False) -> str:
+    """
+    stage task of 01_extract_steady_state_data.extract_file
+    """
+    return extract_steady_state_data.extract_file(inputs[0], path_output, st, en, binary, EXPERIMENTS[exp_key].fps,
+                                                  compact)
+
+
+def build_tasks(args: argparse.Namespace) -> Tuple[List[Task], Dict[str, str]]:
+    """
+    build the tasks of the stages for each file
+    :param args: parser of arguments
+    :return: list of the tasks, dict of the final tasks -> directory to save their output
+    """
+    tasks = []
+    final_tasks = {}
+    for i, file in enumerate(args.fileName):
+        file_name = os.path.splitext(file)[0]
+        depends = ()
+        sources = ("%s/%s" % (args.path, file),)
+
+        def add(stage_name, stage, module, **params):
+            nonlocal depends, sources
+            task = Task("%s:%s" % (stage_name, file_name), stage, depends, sources,
+                        code=(module.__file__,) + HELPER_CODE, **params)
+            tasks.append(task)
+            depends, sources = (task.name,), ()
+            return task
+
+        if args.formatColumns is not None:
+            add("00_traj_file_format", stage_traj_file_format, traj_file_format, exp_key=args.expKey,
+                params={"delimiter": args.delimiter, "columns": args.formatColumns, "binary": args.binary,
+                        "sqlite_index": args.sqliteIndex})
+        if args.transformAdditional:
+            add("01_transformation_additional", stage_transformation_additional, transformation_additional,
+                exp_key=args.expKey,
+                params={"binary": args.binary, "compact": args.compact, "sqlite_index": args.sqliteIndex})
+        if args.transformStraight:
+            add("02_transformation_straight_traj", stage_transformation_straight_traj, transformation_straight_traj,
+                exp_key=args.expKey, params={"binary": args.binary, "compact": args.compact})
+
+        # one branch for each delta_t
+        traj_depends, traj_sources = depends, sources
+        for delta_t in args.deltaTime:
+            # the outputs of each delta_t in its own directory if there are several
+            p_final = args.pathOutput if len(args.deltaTime) == 1 else "%s/delta_t_%g" % (args.pathOutput, delta_t)
+            depends, sources = traj_depends, traj_sources
+            task = add("00_cal_vel_rho_headway:%g" % delta_t, stage_cal_vel_rho_headway, cal_vel_rho_headway,
+                       exp_key=args.expKey,
+                       params={"delta_t": delta_t, "binary": args.binary, "compact": args.compact})
+            final_tasks[task.name] = p_final
+            if args.start is not None or args.autoSteadyState:
+                st, en = (args.start[i], args.end[i]) if args.start is not None else (None, None)
+                task = add("01_extract_steady_state_data:%g" % delta_t, stage_extract_steady_state_data,
+                           extract_steady_state_data, exp_key=args.expKey,
+                           params={"st": st, "en": en, "binary": args.binary, "compact": args.compact})
+                final_tasks[task.name] = p_final
+    return tasks, final_tasks
+
+
+def copy_output(output: str, path_output: str) -> str:
+    """
+    copy the output of a stage from the cache
+    :param output: str. path of the output in the cache
+    :param path_output: str. Path of the directory to save the output
+    :return: str. path of the copy
+    """
+    os.makedirs(path_output, exist_ok=True)
+    p_copy = os.path.join(path_output, os.path.basename(output))
+    if os.path.isdir(output):
+        shutil.rmtree(p_copy, ignore_errors=True)
+        shutil.copytree(output, p_copy)
+    else:
+        shutil.copyfile(output, p_copy)
+    return p_copy
+
+
+if __name__ == "__main__":
+    args = get_parser_args()
+    path_output = args.pathOutput
+    cache_dir = args.cacheDir or "%s/.cache" % path_output
+
+    if args.expKey not in EXPERIMENTS:
+        print("Warning:\tPlease enter one of the experiment keys: %s" % " , ".join(EXPERIMENTS.keys()))
+        sys.exit(1)
+    if args.start is not None and (args.end is None or not len(args.start) == len(args.end) == len(args.fileName)):
+        print("Warning:\tPlease enter the start and end frame of the steady state for each file.")
+        sys.exit(1)
+
+    tasks, final_tasks = build_tasks(args)
+
+    keys = []
+    failed = 0
+    for i, result in enumerate(run_tasks(tasks, cache_dir, args.workers, args.metricsFile, args.traceMemory), 1):
+        if result.key is not None:
+            keys.append(result.key)
+        if result.error is not None:
+            failed += 1
+            print("Warning:\t[%d/%d] Failed: %s (%s)" % (i, len(tasks), result.task.name, result.error))
+            continue
+
+        print("Info:\t[%d/%d] %s: %s" % (i, len(tasks), "Cached" if result.cached else "Done", result.task.name))
+        if result.task.name in final_tasks:
+            copy_output(result.output, final_tasks[result.task.name])
+
+    removed = evict_cache(cache_dir, int(args.cacheBudget * 1024 ** 2), keep=keys)
+    if removed:
+        print("Info:\tRemoved %d old cache entries" % len(removed))
+
+    if failed:
+        print("Warning:\t%d of %d stages failed" % (failed, len(tasks)))
+        sys.exit(1)
@@ -0,0 +1,55 @@
+"""
+©Rudina Subaih
+Summarize the run metrics (JSON lines, -metrics argument of the stage scripts and of 00_run_pipeline) of one or
+several (batch) runs per stage
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from metrics import aggregate_metrics, read_metrics
+
+
+def get_parser_args() -> argparse.Namespace:
+    """
+    Arguments required from user to input
+    :return: parser of arguments
+    """
+    parser = argparse.ArgumentParser(description="Summarize the run metrics of the stages")
+    parser.add_argument(
+        "-m",
+        "--metricsFiles",
+        nargs="+",
+        help="Enter the paths of the metrics files (JSON lines)"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Enter the path of the JSON file to save the summary"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_parser_args()
+    records = [record for p_file in args.metricsFiles for record in read_metrics(p_file)]
+    stages = aggregate_metrics(records)
+
+    # peak [MB]: largest peak of a run (tracemalloc), process peak [MB]: largest peak RSS of the processes (not per file)
+    print("%-40s %5s %6s %10s %10s %12s %12s %10s %10s %17s" % (
+        "stage", "runs", "failed", "wall [s]", "cpu [s]", "rows in", "rows out", "nan rows", "peak [MB]",
+        "process peak [MB]"))
+    for stage, total in stages.items():
+        peak, process_peak = total["peak_memory_mb"], total["process_peak_rss_mb"]
+        print("%-40s %5d %6d %10.3f %10.3f %12d %12d %10d %10s %17s" % (
+            stage, total["runs"], total["failed"], total["wall_time"], total["cpu_time"], total["rows_in"],
+            total["rows_out"], total["rows_nan_dropped"], "-" if peak is None else "%.1f" % peak,
+            "-" if process_peak is None else "%.1f" % process_peak))
+        for name, timer_total in sorted(total["timers"].items(), key=lambda item: -item[1]["seconds"]):
+            print("    %-36s %10.3f s %10d calls" % (name, timer_total["seconds"], timer_total["calls"]))
+
+    if args.output:
+        with open(args.output, "w") as summary_file:
+            json.dump(stages, summary_file, indent=1)
@@ -4,11 +4,15 @@ Unify the raw trajectory file format to a unified format
 """
 import argparse
 import os
+import sys
 from typing import List, Optional, Tuple, Union
 
 import numpy as np
-import pandas as pd
-import sqlite3
+
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from experiments import EXPERIMENTS
+from metrics import add_rows, stage_metrics
+from trajectory_io import SQLITE_RAW_COLUMNS, TRAJ_FMT, TRAJ_HEADER, read_header, read_sqlite, read_text, write_data
 
 
 def get_parser_args() -> argparse.Namespace:
@@ -85,25 +89,62 @@ def get_parser_args() -> argparse.Namespace:
         help="Enter the path to save the output",
         type=str
     )
+    parser.add_argument(
+        "-expk",
+        "--expKey",
+        help="Enter the experiment key to check the framerate in the header of the files against its frame rate "
+             "(optional): " + " , ".join(EXPERIMENTS.keys()),
+    )
+    parser.add_argument(
+        "-b",
+        "--binary",
+        action="store_true",
+        help="Save the output in the binary columnar format (one .npy file per column, memory-mapped reads)"
+    )
+    parser.add_argument(
+        "-fr",
+        "--frameRange",
+        type=float,
+        nargs=2,
+        metavar=("FIRST", "LAST"),
+        help="Enter the first and the last frame to keep (read only these frames of SQLite files)"
+    )
+    parser.add_argument(
+        "-index",
+        "--sqliteIndex",
+        action="store_true",
+        help="Create the index on frame in SQLite files which do not have it yet (faster queries, the file is changed)"
+    )
+    parser.add_argument(
+        "-metrics",
+        "--metricsFile",
+        help="Enter the path of the file to append the run metrics of each file (JSON lines)"
+    )
+    parser.add_argument(
+        "-tm",
+        "--traceMemory",
+        action="store_true",
+        help="Trace the peak memory of each file with tracemalloc (slower)"
+    )
     return parser.parse_args()
 
 
-def file_format(traj_data: np.ndarray, id_col_index: int, fr_col_index: int,
+def file_format(traj_data: np.ndarray, id_col_index: int, fr_col_index: Optional[int],
                 x_col_index: int, y_col_index: int, z_col_index: Optional[int], gender_index: Optional[int], time_index: Optional[float]) -> np.ndarray:
     """
     Make the format of the trajectory file
-    #id  frame   x   y   z
-    OR
-    #id  time   x   y   z
-    :param traj_data:
-    :param id_col_index:
-    :param fr_col_index:
-    :param x_col_index:
-    :param y_col_index:
-    :param z_col_index:
-    :param gender_index:
-    :param time_index:
-    :return:
+    #id  frame   x   y   z   gender   time
+    The rows are sorted by id and frame. Without frame column, the frames of each pedestrian are counted from 0 in the
+    order of x
+    :param traj_data: numpy array. raw trajectory data
+    :param id_col_index: int. column index of the pedestrian ID
+    :param fr_col_index: int. column index of the frame (None => frames are counted per pedestrian)
+    :param x_col_index: int. column index of x
+    :param y_col_index: int. column index of y
+    :param z_col_index: int. column index of z (-1 or None => 0)
+    :param gender_index: int. column index of the gender (-1 or None => 0)
+    :param time_index: int. column index of the time (-1 or None => 0)
+    :return: numpy array. id, fr, x, y, z, gender, time
     """
     if id_col_index is None:
         raise ValueError('ERROR: you have to add pedestrian ID to the trajectory file.')
@@ -114,64 +155,104 @@ def file_format(traj_data: np.ndarray, id_col_index: int, fr_col_index: int,
     if y_col_index is None:
         raise ValueError('ERROR: you have to add y-coordinate to the trajectory file.')
 
+    ids = traj_data[:, id_col_index]
+    x = traj_data[:, x_col_index]
 
-    # Specify the column indices by which you want to sort the rows
-    column_indices = (id_col_index, x_col_index)
-
-    # Get the indices that would sort the first column
-    sorted_indices = np.lexsort((traj_data[:, column_indices[1]], traj_data[:, column_indices[0]]))
+    # one sort by id, frame, and x (without frame column by id and x, the counted frames are then sorted too)
+    if fr_col_index is None:
+        order = np.lexsort((x, ids))
+    else:
+        order = np.lexsort((x, traj_data[:, fr_col_index], ids))
 
-    # Sort the matrix based on the specified columns
-    traj_data = traj_data[sorted_indices]
+    # the output is filled column by column, the missing optional columns stay 0
+    n_rows = traj_data.shape[0]
+    result = np.zeros((n_rows, 7))
+    for out_col, col_index in ((0, id_col_index), (1, fr_col_index), (2, x_col_index), (3, y_col_index),
+                               (4, z_col_index), (5, gender_index), (6, time_index)):
+        if col_index is not None and col_index != -1:
+            result[:, out_col] = traj_data[order, col_index]
 
     if fr_col_index is None:
-        # iterate over pedestrians and give them frame
-        pedIDs = set(traj_data[:, id_col_index])
-        frames = np.array([])
-        for id in pedIDs:
-            ped_data = traj_data[traj_data[:, id_col_index] == id]
-            frames = np.append(frames, np.arange(ped_data.shape[0]))  # values from 0 to the length of ped. traj.
-    else:
-        frames = traj_data[:, fr_col_index]
+        # frames 0 .. n-1 of each pedestrian: row position minus the position of the first row of the pedestrian
+        rows = np.arange(n_rows)
+        first = np.ones(n_rows, dtype=bool)
+        np.not_equal(result[1:, 0], result[:-1, 0], out=first[1:])
+        result[:, 1] = rows - np.maximum.accumulate(np.where(first, rows, 0))
 
-    if z_col_index == -1:
-        z = np.zeros(traj_data.shape[0])  # values equal 0
-    else:
-        z = frames = traj_data[:, z_col_index]
+    return result
 
-    if gender_index == -1:
-        gender_data = np.zeros(traj_data.shape[0])  # values equal 0
-    else:
-        gender_data = frames = traj_data[:, gender_index]
 
-    if time_index == -1:
-        time_data = np.zeros(traj_data.shape[0])  # values equal 0
-    else:
-        time_data = frames = traj_data[:, time_index]
-    # Create a 2D NumPy matrix by stacking the 1D arrays vertically
-    traj_data = np.column_stack((traj_data[:, id_col_index], frames, traj_data[:, x_col_index], traj_data[:, y_col_index], z, gender_data, time_data))
+def used_columns(*col_indices: Optional[int]) -> List[int]:
+    """
+    :param col_indices: column indices of the raw file (-1 or None => no column)
+    :return: list. sorted column indices to read
+    """
+    return sorted({i for i in col_indices if i is not None and i != -1})
 
-    # sort based od id and fr because the previous data appears not aus_mix_sorted
-    traj_data = traj_data[np.lexsort((traj_data[:, 1], traj_data[:, 0]))]
 
-    return traj_data
+def check_framerate(p_file: str, exp_key: str, skiprows: int = 1) -> Optional[float]:
+    """
+    compare the framerate in the header of a raw trajectory file (e.g. "# framerate: 25 fps" of PeTrack) with the frame
+    rate of the experiment, and warn if they differ
+    :param p_file: str. Path of the raw trajectory file (text)
+    :param exp_key: str. experiment key of EXPERIMENTS
+    :param skiprows: int. number of lines to skip at the beginning of the file
+    :return: float. framerate of the header (None if the header has no framerate)
+    """
+    framerate = read_header(p_file, skiprows).framerate
+    fps = EXPERIMENTS[exp_key].fps
+    if framerate is not None and framerate != fps:
+        print("Warning:\tThe framerate of %s (%g fps) is not the frame rate of the experiment %s (%d fps)." %
+              (p_file, framerate, exp_key, fps))
+    return framerate
 
 
-def read_sqlite_file(traj_path: str, traj_file_name: str) -> pd.DataFrame:
+def format_file(p_file: str, path_output: str, delimiter: Optional[str], id_col_index: int,
+                fr_col_index: Optional[int], x_col_index: int, y_col_index: int, z_col_index: int, gender_index: int,
+                time_index: int, binary: bool = False, frame_range: Optional[Tuple[float, float]] = None,
+                sqlite_index: bool = False, exp_key: Optional[str] = None) -> str:
     """
-    To read the trajectory data from .sqlite files
-    :param traj_path: string. Path to the trajectory file
-    :param traj_file_name: name of the file
-    :return:
+    unify the format of one raw trajectory file and save it
+    :param p_file: str. Path of the raw trajectory file (.txt, .csv, or .sqlite)
+    :param path_output: str. Path of the directory to save the output
+    :param delimiter: str. delimiter of the trajectory file (None => whitespace)
+    :param id_col_index: int. column index of the pedestrian ID
+    :param fr_col_index: int. column index of the frame (None => frames are counted per pedestrian)
+    :param x_col_index: int. column index of x
+    :param y_col_index: int. column index of y
+    :param z_col_index: int. column index of z (-1 => no z column)
+    :param gender_index: int. column index of the gender (-1 => no gender column)
+    :param time_index: int. column index of the time (-1 => no time column)
+    :param binary: bool. True => save the output in the binary columnar format
+    :param frame_range: (first frame, last frame) to keep (None => all frames). Only these frames are read of SQLite
+    files
+    :param sqlite_index: bool. True => create the index on frame in a SQLite file without it (the file is changed)
+    :param exp_key: str. experiment key of EXPERIMENTS to check the framerate in the header of text files (None => no
+    check)
+    :return: str. Path of the output file
     """
-    trajectory_file = "%s/%s" % (traj_path, traj_file_name)
-    con = sqlite3.connect(trajectory_file)
-    output_data = pd.read_sql_query(
-        "select frame, id, pos_x as x, pos_y as y, ori_x as ox, ori_y as oy from trajectory_data",
-        con,
-    )
-    # table in the SQLite database. The data is read into a Pandas DataFrame named data.
-    return output_data
+    file_name = os.path.basename(os.path.splitext(p_file)[0])
+    file_type = os.path.splitext(p_file)[1]  # extension of the data file
+    # format of the file
+    col_indices = (id_col_index, fr_col_index, x_col_index, y_col_index, z_col_index, gender_index, time_index)
+    if file_type == ".sqlite":
+        # fr, pedID, x, y, ori_x, ori_y
+        data = read_sqlite(p_file, SQLITE_RAW_COLUMNS, frame_range, create_index=sqlite_index)
+    else:
+        if exp_key is not None:
+            check_framerate(p_file, exp_key)
+        # only the used columns are read, the column indices refer then to the read columns
+        usecols = used_columns(*col_indices)
+        data = read_text(p_file, usecols=usecols, delimiter=delimiter, skiprows=1)
+        col_indices = tuple(usecols.index(i) if i in usecols else i for i in col_indices)
+    add_rows(rows_in=len(data))
+
+    data = file_format(data, *col_indices)
+    if frame_range is not None:
+        data = data[(data[:, 1] >= frame_range[0]) & (data[:, 1] <= frame_range[1])]
+    add_rows(rows_out=len(data))
+
+    return write_data("%s/%s_traj_file_format" % (path_output, file_name), data, TRAJ_HEADER, TRAJ_FMT, binary)
 
 
 if __name__ == "__main__":
@@ -188,33 +269,13 @@ if __name__ == "__main__":
     gender_index: int = arg.genderIndex
     time_index: int = arg.timeIndex
 
+    if arg.expKey is not None and arg.expKey not in EXPERIMENTS:
+        print("Warning:\tPlease enter one of the experiment keys: %s" % " , ".join(EXPERIMENTS.keys()))
+        sys.exit(1)
+
     for file in files:
         print("Transforming: %s/%s" % (path, file))
-        file_name = os.path.splitext(file)[0]
-        file_type = os.path.splitext(file)[1]  # extension of the data file
-        # format of the file
-        if file_type == ".sqlite":
-            data = read_sqlite_file(path, file)
-            data = data.to_numpy()  # fr, pedID, x, y, ori_x, ori_y
-        else:
-            data = np.loadtxt("%s/%s" % (path, file), skiprows=1, delimiter=delimiter)
-
-        data = file_format(data,
-                           id_col_index,
-                           fr_col_index,
-                           x_col_index,
-                           y_col_index,
-                           z_col_index,
-                           gender_index,
-                           time_index)
-
-        header = "#id\tfr\tx\ty\tz\tgender\ttime"
-        np.savetxt(
-            "%s/%s_traj_file_format.txt" % (path_output, file_name),
-            data,
-            delimiter="\t",
-            header=header,
-            comments="",
-            newline="\r\n",
-            fmt="%d\t%d\t%.4f\t%.4f\t%.4f\t%d\t%.4f"
-        )
+        with stage_metrics("00_traj_file_format", "%s/%s" % (path, file), arg.metricsFile, arg.traceMemory):
+            format_file("%s/%s" % (path, file), path_output, delimiter, id_col_index, fr_col_index, x_col_index,
+                        y_col_index, z_col_index, gender_index, time_index, arg.binary, arg.frameRange,
+                        arg.sqliteIndex, arg.expKey)
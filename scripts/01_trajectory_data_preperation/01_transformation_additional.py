@@ -19,9 +19,9 @@ import argparse
 
 sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
 from experiments import EXPERIMENTS
-
-import pandas as pd
-import sqlite3
+from helper import compact_array
+from metrics import add_rows, stage_metrics
+from trajectory_io import COMPACT_FLOAT, SQLITE_TRAJ_COLUMNS, TRAJ_FMT, TRAJ_HEADER, read_data, read_sqlite, write_data
 
 
 def get_parser_args() -> argparse.Namespace:
@@ -51,6 +51,35 @@ def get_parser_args() -> argparse.Namespace:
         "--pathOutput",
         help="Enter the path to save the output"
     )
+    parser.add_argument(
+        "-b",
+        "--binary",
+        action="store_true",
+        help="Save the output in the binary columnar format (one .npy file per column, memory-mapped reads)"
+    )
+    parser.add_argument(
+        "-compact",
+        "--compact",
+        action="store_true",
+        help="Compact mode: float32 data (binary output: int32 id and frame, int8 gender, float32 other columns)"
+    )
+    parser.add_argument(
+        "-index",
+        "--sqliteIndex",
+        action="store_true",
+        help="Create the index on frame in SQLite files which do not have it yet (faster queries, the file is changed)"
+    )
+    parser.add_argument(
+        "-metrics",
+        "--metricsFile",
+        help="Enter the path of the file to append the run metrics of each file (JSON lines)"
+    )
+    parser.add_argument(
+        "-tm",
+        "--traceMemory",
+        action="store_true",
+        help="Trace the peak memory of each file with tracemalloc (slower)"
+    )
     return parser.parse_args()
 
 
@@ -80,21 +109,40 @@ def process_data(arr: npt.NDArray[np.float64], experiment_name: str) -> npt.NDAr
     return arr
 
 
-def read_sqlite_file(path: str, file: str) -> pd.DataFrame:
+def transform_file(p_file: str, path_output: str, exp_key: str, binary: bool = False, compact: bool = False,
+                   sqlite_index: bool = False) -> str:
     """
-
-    :param trajectory_file:
-    :return: obj: TrajectoryData
-    obj: WalkableArea
+    apply the additional transformation of the experiment to one trajectory file and save it
+    :param p_file: str. Path of the trajectory file (.txt, .cols, or .sqlite)
+    :param path_output: str. Path of the directory to save the output
+    :param exp_key: str. experiment key of EXPERIMENTS
+    :param binary: bool. True => save the output in the binary columnar format
+    :param compact: bool. True => float32 data (compact binary output)
+    :param sqlite_index: bool. True => create the index on frame in a SQLite file without it (the file is changed)
+    :return: str. Path of the output file
     """
-    trajectory_file = "%s/%s" % (path, file)
-    con = sqlite3.connect(trajectory_file)
-    data = pd.read_sql_query(
-        "select frame, id, pos_x as x, pos_y as y, ori_x as ox, ori_y as oy from trajectory_data",
-        con,
-    )
-    # table in the SQLite database. The data is read into a Pandas DataFrame named data.
-    return data
+    file_name = os.path.basename(os.path.splitext(p_file)[0])
+    file_type = os.path.splitext(p_file)[1]  # extension of the data file
+    # format of the file
+    if file_type == ".sqlite":
+        e = EXPERIMENTS[exp_key]
+        # only the rows inside the measurement area are read (x / unit in [Min, Max], see process_data)
+        x_range = (e.Min * e.unit, e.Max * e.unit) if (e.Min is not None) and (e.Max is not None) else None
+        # id, fr, x, y, z, gender, time (the unified format, like the output of 00_traj_file_format)
+        data = read_sqlite(p_file, SQLITE_TRAJ_COLUMNS, x_range=x_range, create_index=sqlite_index)
+    else:
+        data = read_data(p_file, dtype=COMPACT_FLOAT if compact else np.float64)
+    if compact:
+        data = compact_array(data)
+
+    add_rows(rows_in=len(data))
+
+    # setup coordination system transformation (the rows outside the measurement area are dropped)
+    data = process_data(data, exp_key)
+    add_rows(rows_out=len(data))
+
+    return write_data("%s/%s_transformation_additional" % (path_output, file_name), data, TRAJ_HEADER, TRAJ_FMT,
+                      binary, compact=compact)
 
 
 if __name__ == "__main__":
@@ -106,26 +154,5 @@ if __name__ == "__main__":
 
     for file in files:
         print("Transforming: %s/%s" % (path, file))
-        file_name = os.path.splitext(file)[0]
-        file_type = os.path.splitext(file)[1]  # extension of the data file
-        # format of the file
-        if file_type == ".sqlite":
-            data = read_sqlite_file(path, file)
-            data = data.to_numpy()  # fr, pedID, x, y, ori_x, ori_y
-        else:
-            e = EXPERIMENTS[exp_key]
-            data = np.loadtxt("%s/%s" % (path, file), skiprows=1, delimiter=e.delimiter)
-
-        # setup coordination system transformation
-        data = process_data(data, exp_key)
-
-        header = "#id\tfr\tx\ty\tz\tgender\ttime"
-        np.savetxt(
-            "%s/%s_transformation_additional.txt" % (path_output, file_name),
-            data,
-            delimiter="\t",
-            header=header,
-            comments="",
-            newline="\r\n",
-            fmt="%d\t%d\t%.4f\t%.4f\t%.4f\t%d\t%.4f"
-        )
+        with stage_metrics("01_transformation_additional", "%s/%s" % (path, file), arg.metricsFile, arg.traceMemory):
+            transform_file("%s/%s" % (path, file), path_output, exp_key, arg.binary, arg.compact, arg.sqliteIndex)
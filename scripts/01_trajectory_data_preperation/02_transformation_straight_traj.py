@@ -5,10 +5,14 @@ some modifications
 """
 import numpy as np
 import os
+import sys
 from typing import List
 
 sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
 from experiments import EXPERIMENTS
+from helper import compact_array, transformation_coord
+from metrics import add_rows, stage_metrics
+from trajectory_io import COMPACT_FLOAT, TRAJ_FMT, TRAJ_HEADER, read_data, write_data
 
 import time
 import argparse
@@ -41,37 +45,56 @@ def get_parser_args() -> argparse.Namespace:
         "--pathOutput",
         help="Enter the path to save the output"
     )
+    parser.add_argument(
+        "-b",
+        "--binary",
+        action="store_true",
+        help="Save the output in the binary columnar format (one .npy file per column, memory-mapped reads)"
+    )
+    parser.add_argument(
+        "-compact",
+        "--compact",
+        action="store_true",
+        help="Compact mode: float32 data (binary output: int32 id and frame, int8 gender, float32 other columns)"
+    )
+    parser.add_argument(
+        "-metrics",
+        "--metricsFile",
+        help="Enter the path of the file to append the run metrics of each file (JSON lines)"
+    )
+    parser.add_argument(
+        "-tm",
+        "--traceMemory",
+        action="store_true",
+        help="Trace the peak memory of each file with tracemalloc (slower)"
+    )
     return parser.parse_args()
 
 
-def transformation_coord(x, y, length, r):
+def transform_file(p_file: str, path_output: str, length: float, r: float, binary: bool = False,
+                   compact: bool = False) -> str:
     """
-    transform coordinates to straight periodic trajectories (Ziemer2016)
-    :param length: float. length of the oval corridor (circumference) in meter
-    :param r: flowt. Radius
-    :param x: float. x-coordinate
-    :param y: float. y-coordinate
-    :return: float, float. x and y-coordinate
+    transform one oval trajectory file to a straight trajectory file and save it
+    :param p_file: str. Path of the trajectory file (.txt or .cols)
+    :param path_output: str. Path of the directory to save the output
+    :param length: float. length of the straight part in the oval set-up
+    :param r: float. radius of the oval set-up
+    :param binary: bool. True => save the output in the binary columnar format
+    :param compact: bool. True => float32 data (compact binary output)
+    :return: str. Path of the output file
     """
-    x_trans = None
-    y_trans = None
+    file_name = os.path.basename(os.path.splitext(p_file)[0])
+
+    data = read_data(p_file, usecols=(0, 1, 2, 3, 4, 5, 6), dtype=COMPACT_FLOAT if compact else np.float64)
+    if compact:
+        data = compact_array(data)
+    # transform the x and y columns in place
+    transformation_coord(data[:, 2:4], length, r, out=data[:, 2:4])
+    add_rows(rows_in=len(data), rows_out=len(data))
 
-    if x < 0:
-        arccos_val = (r - y) / math.sqrt((x ** 2) + ((y - r) ** 2))
-        x_trans = (2 * length) + (r * math.pi) + (r * np.arccos(-arccos_val))
-        y_trans = math.sqrt((x ** 2) + ((y - r) ** 2)) - r
-    elif 0 <= x <= length:
-        y_trans = math.sqrt(((y - r) ** 2)) - r
-        if y < r:
-            x_trans = x
-        elif y >= r:
-            x_trans = (2 * length) + (r * math.pi) - x
-    elif x > length:
-        arccos_val = (r - y) / math.sqrt(((x - length) ** 2) + ((y - r) ** 2))
-        x_trans = length + (r * np.arccos(arccos_val))
-        y_trans = math.sqrt(((x - length) ** 2) + ((y - r) ** 2)) - r
+    return write_data("%s/%s_straight_traj" % (path_output, file_name), data, TRAJ_HEADER, TRAJ_FMT, binary,
+                      compact=compact)
 
-    return x_trans, y_trans
 
 if __name__ == "__main__":
     arg: argparse.Namespace = get_parser_args()
@@ -91,24 +114,9 @@ if __name__ == "__main__":
 
     for file in files:
         print("Transforming: %s/%s" % (path, file))
-        file_name = os.path.splitext(file)[0]
-        file_type = os.path.splitext(file)[1]  # extension of the data file
-
-        data = np.loadtxt("%s/%s" % (path, file), usecols=(0, 1, 2, 3, 4, 5, 6))
-        data_new = np.empty((len(data), 7))
-
-        for i, row in enumerate(data):
-            x_trans, y_trans = transformation_coord(row[2], row[3], length, r)
-            data_new[i] = [row[0], row[1], x_trans, y_trans, row[4], row[5], row[6]]
-
-        header = "#id\tfr\tx\ty\tz\tgender\ttime"
-        np.savetxt("%s/%s_straight_traj.txt" % (path_output, file_name),
-                   data_new,
-                   delimiter="\t",
-                   header=header,
-                   comments="",
-                   newline="\r\n",
-                   fmt="%d\t%d\t%.4f\t%.4f\t%.4f\t%d\t%.4f")
+        with stage_metrics("02_transformation_straight_traj", "%s/%s" % (path, file), arg.metricsFile,
+                           arg.traceMemory):
+            transform_file("%s/%s" % (path, file), path_output, length, r, arg.binary, arg.compact)
 
     # record end time
     end = time.time()
@@ -5,15 +5,18 @@ import argparse
 import glob
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 
 sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
 from experiments import EXPERIMENTS
-from helper import process_data
-from helper import read_trajectory_data, individual_velocity_top_view, voronoi_rho_top_view, \
-    individual_velocity_side_view, individual_headway_side_view, voronoi_rho_side_view
-from experiments import EXPERIMENTS
+from helper import (calculate_speed_density_headway, compact_array, delta_t_list, iter_frames,
+                    stream_speed_density_headway)
+from metrics import add_rows, stage_metrics
+from trajectory_io import (BINARY_SUFFIX, COMPACT_FLOAT, columns_format, iter_chunks, read_data, vel_h_rho_columns,
+                           write_data, write_text_rows)
 
 
 def get_parser_args():
@@ -31,8 +34,10 @@ def get_parser_args():
         "-delta",
         "--deltaTime",
         type=float,
-        default=0.4,
-        help="Enter the time constant to calculate the velocity (default=0.4)")
+        default=[0.4],
+        nargs="+",
+        help="Enter the time constant to calculate the velocity (default=0.4). Several time constants are calculated "
+             "in a single pass with one velocity column per time constant")
     parser.add_argument(
         "-expk",
         "--expKey",
@@ -43,9 +48,149 @@ def get_parser_args():
         "--pathOutput",
         help="Enter the path to save the output"
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Enter the number of worker processes to calculate the files in parallel (default=1, 0 => all CPUs)"
+    )
+    parser.add_argument(
+        "-b",
+        "--binary",
+        action="store_true",
+        help="Save the output in the binary columnar format (one .npy file per column, memory-mapped reads)"
+    )
+    parser.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Stream the trajectory files frame by frame with constant memory (text output only, the trajectory "
+             "files have to be sorted by frame)"
+    )
+    parser.add_argument(
+        "-compact",
+        "--compact",
+        action="store_true",
+        help="Compact mode: float32 data (binary output: int32 id and frame, float32 other columns)"
+    )
+    parser.add_argument(
+        "-metrics",
+        "--metricsFile",
+        help="Enter the path of the file to append the run metrics of each file (JSON lines)"
+    )
+    parser.add_argument(
+        "-tm",
+        "--traceMemory",
+        action="store_true",
+        help="Trace the peak memory of each file with tracemalloc (slower)"
+    )
     return parser.parse_args()
 
 
+def calculate_file(p_file: str, path_output: str, fps: int, c: float, camera_capture: int,
+                   delta_t: Union[float, Sequence[float]],
+                   binary: bool = False, stream: bool = False, compact: bool = False) -> str:
+    """
+    calculate the velocity, headway, and rho of one trajectory file and save the result
+    :param p_file: str. Path of the trajectory file (straight transformed trajectory)
+    :param path_output: str. Path of the directory to save the output
+    :param fps: int. camera frame per second
+    :param c: float. circumference of the oval corridor
+    :param camera_capture: int. 0 => top_view, 1 => side_view
+    :param delta_t: float or list. time constant(s) to calculate the velocity (one velocity column per delta_t)
+    :param binary: bool. True => save the output in the binary columnar format
+    :param stream: bool. True => read, calculate, and write the file chunk by chunk (constant memory, text output)
+    :param compact: bool. True => float32 data and result (compact binary output)
+    :return: str. Path of the output file
+    """
+    file_name = os.path.basename(os.path.splitext(p_file)[0])
+    header, fmt = columns_format(vel_h_rho_columns(delta_t_list(delta_t)))
+
+    if stream:
+        if binary:
+            raise ValueError("ERROR: the streaming mode writes text output only.")
+        if compact:
+            raise ValueError("ERROR: the streaming mode does not support the compact mode.")
+        p_output = "%s/%s_vel_h_rho.txt" % (path_output, file_name)
+        frames = iter_frames(iter_chunks(p_file, usecols=(0, 1, 2, 3, 4)))  # #id	fr	x	y	z
+        with open(p_output, "w", newline="") as text_file:
+            text_file.write(header + "\r\n")
+            for rows in stream_speed_density_headway(counted_frames(frames), fps, c, camera_capture, delta_t):
+                write_text_rows(text_file, rows, fmt)
+                add_rows(rows_out=len(rows))
+        return p_output
+
+    # #id	fr	x	y	z
+    data = read_data(p_file, usecols=(0, 1, 2, 3, 4), dtype=COMPACT_FLOAT if compact else np.float64)
+    if compact:
+        data = compact_array(data)
+
+    # id, fr, x, y, z, velocity (one per delta_t), headway, rho (all nan-value rows are dropped)
+    result = calculate_speed_density_headway(data, fps, c, camera_capture, delta_t)
+    add_rows(rows_in=len(data), rows_out=len(result))
+
+    # the rows are sorted by frame (steady-state windows are read by binary search)
+    return write_data("%s/%s_vel_h_rho" % (path_output, file_name), result, header, fmt, binary, sorted_by="fr",
+                      compact=compact)
+
+
+def counted_frames(frames: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+    """
+    count the rows read of the streamed frames (run metrics)
+    :param frames: iterable of numpy arrays. Data of each frame
+    :return: iterator of the same frames
+    """
+    for frame_data in frames:
+        add_rows(rows_in=len(frame_data))
+        yield frame_data
+
+
+def measured_calculate_file(p_file: str, metrics_file: Optional[str], trace_memory: bool, *args) -> str:
+    """
+    calculate_file with run metrics
+    :param p_file: str. Path of the trajectory file
+    :param metrics_file: str. Path of the file to append the run metrics (None => metrics are not saved)
+    :param trace_memory: bool. True => trace the peak memory with tracemalloc
+    :param args: arguments of calculate_file after the file path
+    :return: str. Path of the output file
+    """
+    with stage_metrics("00_cal_vel_rho_headway", p_file, metrics_file, trace_memory):
+        return calculate_file(p_file, *args)
+
+
+def calculate_files(files: List[str], workers: int, metrics_file: Optional[str], trace_memory: bool,
+                    *args) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    calculate the trajectory files one after another (workers=1) or in a process pool. A failing file does not stop
+    the other files
+    :param files: list. Paths of the trajectory files
+    :param workers: int. Number of worker processes (0 => all CPUs)
+    :param metrics_file: str. Path of the file to append the run metrics (None => metrics are not saved)
+    :param trace_memory: bool. True => trace the peak memory with tracemalloc
+    :param args: arguments of calculate_file after the file path
+    :return: iterator of (path of the trajectory file, error message or None) as soon as each file is done
+    """
+    if workers == 1:
+        for p_file in files:
+            try:
+                measured_calculate_file(p_file, metrics_file, trace_memory, *args)
+                yield p_file, None
+            except Exception as err:
+                yield p_file, repr(err)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers or None) as executor:
+        futures = {executor.submit(measured_calculate_file, p_file, metrics_file, trace_memory, *args): p_file
+                   for p_file in files}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                yield futures[future], None
+            except Exception as err:
+                yield futures[future], repr(err)
+
+
 if __name__ == "__main__":
     args = get_parser_args()
     path = args.path
@@ -59,70 +204,21 @@ if __name__ == "__main__":
     c = e.circumference
     camera_capture = e.camera_capture
 
-    files = glob.glob("%s/*.txt" % path)
-
-    for p_file in files:
-        if len(p_file):
-            file_name = os.path.basename(os.path.splitext(p_file)[0])
-            path = "%s/%s_vel_h_rho.txt" % (path_output, file_name)
-
-            print("Info:\tCalculating: %s" % p_file)
-            data = read_trajectory_data(p_file) # #id	fr	x	y	z
-
-
-            # 1. For each frame, I need to calculate the speed, rho, and distances of pedestrians inside frame
-            frames = np.sort(np.unique(data[:, 1]))
-            frame_start = frames[0]
-            frame_end = frames[-1]
-
-            new_arr = np.empty((1, 8))
-
-            for fr in frames:
-                # Pedestrians inside the frame
-                frame_data = data[data[:, 1] == fr]
-                # A. Sort the row data by the position of pedestrians to know the order of the pedestrians in the
-                # oval corridor (straight trajectories format)
-                frame_data = frame_data[frame_data[:, 2].argsort()]
-
-                # B. Calculate pedestrian velocity
-                if camera_capture == 0:
-                    velocity = individual_velocity_top_view(data, frame_data, delta_t, fr, frame_start,
-                                                            frame_end, fps, c)
-                    # C. Calculate pedestrians' headway
-                    # Calculate the headway by taking the difference between each row x value and the previous
-                    headway = np.diff(frame_data[:, 2])
-                    # ... for the last pedestrian, we calculate it as
-                    headway_last = (c - frame_data[-1, 2]) + (frame_data[0, 2])
-                    headway = np.append(headway, headway_last)
-                    # D. Calculate pedestrians' rho
-                    rho = voronoi_rho_top_view(headway)
-                else:
-                    velocity = individual_velocity_side_view(data, frame_data, delta_t, fr, fps)
-                    # C. Calculate pedestrians' headway
-                    headway = individual_headway_side_view(frame_data)
-                    # D. Calculate pedestrians' rho
-                    rho = voronoi_rho_side_view(headway)
-
-                # reshape the velocity, headway, rho
-                velocity = np.reshape(velocity, (velocity.size, 1))
-                headway = np.reshape(headway, (headway.size, 1))
-                rho = np.reshape(rho, (rho.size, 1))
-
-                # id, fr, x, y, z, velocity, headway, rho
-                frame_data = np.append(frame_data, velocity, axis=1)
-                frame_data = np.append(frame_data, headway, axis=1)
-                frame_data = np.append(frame_data, rho, axis=1)
-
-                new_arr = np.concatenate((new_arr, frame_data))
-
+    files = glob.glob("%s/*.txt" % path) + glob.glob("%s/*%s" % (path, BINARY_SUFFIX))
+    if len(files) == 0:
+        print("Warning:\tPlease enter the full path of the source file.")
+        sys.exit()
+
+    failed = 0
+    for i, (p_file, error) in enumerate(calculate_files(files, args.workers, args.metricsFile, args.traceMemory,
+                                                        path_output, fps, c, camera_capture, delta_t, args.binary,
+                                                        args.stream, args.compact), 1):
+        if error is None:
+            print("Info:\t[%d/%d] Calculated: %s" % (i, len(files), p_file))
         else:
-            print("Warning:\tPlease enter the full path of the source file.")
-            sys.exit()
-
-        result = new_arr[1:]
-        # drop all nan-value rows
-        result = result[~np.isnan(result).any(axis=1)]
+            failed += 1
+            print("Warning:\t[%d/%d] Failed: %s (%s)" % (i, len(files), p_file, error))
 
-        header = "#id\tfr\tx\ty\tz\tvelocity\theadway\trho"
-        np.savetxt(path, result, fmt="%d\t%d\t%.4f\t%.4f\t%.4f\t%.4f\t%.4f\t%.4f", delimiter="\t", header=header,
-                   comments="", newline="\r\n")
+    if failed:
+        print("Warning:\t%d of %d files failed" % (failed, len(files)))
+        sys.exit(1)
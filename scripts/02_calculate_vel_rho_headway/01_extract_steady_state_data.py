@@ -3,9 +3,19 @@
 to save only the steady-state data
 """
 import argparse
+import os
+import sys
+from typing import List, Optional, Sequence, Tuple
 
 import numpy as np
 
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from experiments import EXPERIMENTS, ExperimentData
+from helper import compact_array, detect_steady_state
+from metrics import add_rows, stage_metrics
+from trajectory_io import COMPACT_FLOAT, VEL_H_RHO_HEADER, columns_format, header_columns, is_binary, read_data, \
+    read_frame_windows, read_header, read_schema, write_data
+
 
 def get_parser_args():
     """
@@ -28,7 +38,7 @@ def get_parser_args():
         "-s",
         "--start",
         type=float,
-        help="Enter the start frame of the steady state",
+        help="Enter the start frame of the steady state (default: automatic detection of the steady state)",
         nargs="+"
     )
     parser.add_argument(
@@ -38,14 +48,114 @@ def get_parser_args():
         help="Enter the end frame of the steady state",
         nargs="+"
     )
+    parser.add_argument(
+        "-win",
+        "--windows",
+        type=float,
+        nargs="+",
+        help="Enter the start and end frames of several steady-state windows of each file, read in one read: "
+             "start1 end1 start2 end2 ..."
+    )
     parser.add_argument(
         "-po",
         "--pathOutput",
         help="Enter the path to save the output"
     )
+    parser.add_argument(
+        "-expk",
+        "--expKey",
+        help="Enter the experiment key (frame rate for the automatic detection of the steady state): " +
+             " , ".join(EXPERIMENTS.keys()),
+    )
+    parser.add_argument(
+        "-b",
+        "--binary",
+        action="store_true",
+        help="Save the output in the binary columnar format (one .npy file per column, memory-mapped reads)"
+    )
+    parser.add_argument(
+        "-compact",
+        "--compact",
+        action="store_true",
+        help="Compact mode: float32 data (binary output: int32 id and frame, float32 other columns)"
+    )
+    parser.add_argument(
+        "-metrics",
+        "--metricsFile",
+        help="Enter the path of the file to append the run metrics of each file (JSON lines)"
+    )
+    parser.add_argument(
+        "-tm",
+        "--traceMemory",
+        action="store_true",
+        help="Trace the peak memory of each file with tracemalloc (slower)"
+    )
     return parser.parse_args()
 
 
+def data_columns(p_file: str) -> List[str]:
+    """
+    :param p_file: str. Path of the rho_v file (.txt or .cols)
+    :return: list. column names (id, fr, x, y, z, velocity (one per delta_t), headway, rho)
+    """
+    if is_binary(p_file):
+        return read_schema(p_file)["columns"]
+    return read_header(p_file).columns or header_columns(VEL_H_RHO_HEADER)
+
+
+def extract_windows(p_file: str, path_output: str, windows: Sequence[Tuple[float, float]],
+                    binary: bool = False, compact: bool = False) -> List[str]:
+    """
+    extract several steady-state windows of one rho_v file in one read and save each of them. Only the rows of the
+    windows are read if the file is sorted by frame (the output of 00_cal_vel_rho_headway)
+    :param p_file: str. Path of the rho_v file (.txt or .cols)
+    :param path_output: str. Path of the directory to save the output
+    :param windows: list of (start frame, end frame) of the steady states
+    :param binary: bool. True => save the output in the binary columnar format
+    :param compact: bool. True => float32 data (compact binary output)
+    :return: list. Paths of the output files (<file>_steadystate, or <file>_steadystate_<start>_<end> for several
+    windows)
+    """
+    n = data_columns(p_file)
+    header, fmt = columns_format(n)
+    p_outputs = []
+    dtype = COMPACT_FLOAT if compact else np.float64
+    for (st, en), rho_v in zip(windows, read_frame_windows(p_file, windows, usecols=range(len(n)), dtype=dtype)):
+        if compact:
+            rho_v = compact_array(rho_v)
+        add_rows(rows_in=len(rho_v), rows_out=len(rho_v))
+        suffix = "steadystate" if len(windows) == 1 else "steadystate_%g_%g" % (st, en)
+        p_outputs.append(write_data("%s/%s_%s" % (path_output, os.path.basename(p_file), suffix), rho_v, header, fmt,
+                                    binary, sorted_by="fr", compact=compact))
+    return p_outputs
+
+
+def extract_file(p_file: str, path_output: str, st: Optional[float] = None, en: Optional[float] = None,
+                 binary: bool = False, fps: int = ExperimentData.fps, compact: bool = False) -> str:
+    """
+    extract the steady-state data of one rho_v file and save it (all velocity columns if there are several)
+    :param p_file: str. Path of the rho_v file (.txt or .cols)
+    :param path_output: str. Path of the directory to save the output
+    :param st: float. start frame of the steady state (None => detect the steady state)
+    :param en: float. end frame of the steady state (None => detect the steady state)
+    :param binary: bool. True => save the output in the binary columnar format
+    :param fps: int. camera frame per second (automatic detection of the steady state)
+    :param compact: bool. True => float32 data (compact binary output)
+    :return: str. Path of the output file
+    """
+    if st is None:
+        # only the frame, the (first) velocity, and rho columns are read for the detection
+        data = read_data(p_file, usecols=(0, 1, 5, len(data_columns(p_file)) - 1),
+                         dtype=COMPACT_FLOAT if compact else np.float64)
+        window = detect_steady_state(data, fps, columns=(2, 3))
+        if window is None:
+            raise ValueError("ERROR: no steady state found in %s." % p_file)
+        st, en = window
+        print("Info:\tSteady state of %s: %d - %d" % (p_file, st, en))
+
+    return extract_windows(p_file, path_output, [(st, en)], binary, compact)[0]
+
+
 if __name__ == "__main__":
     args = get_parser_args()
     path = args.path  # The path of the rho_v directory
@@ -54,22 +164,18 @@ if __name__ == "__main__":
     ends = args.end  # End frame of the steady state for each file
     path_output = args.pathOutput
 
-    for file, st, en in zip(files, starts, ends):
-        n = ["id", "fr", "x", "y", "z", "velocity", "headway", "rho"]
-        header = "#id\tfr\tx\ty\tz\tvelocity\theadway\trho"
-        fmt = "%d\t%d\t%.4f\t%.4f\t%.4f\t%.4f\t%.4f\t%.4f"
+    fps = EXPERIMENTS[args.expKey].fps if args.expKey else ExperimentData.fps
+    if starts is None:
+        starts = ends = [None] * len(files)
+    if args.windows is not None and len(args.windows) % 2:
+        print("Warning:\tPlease enter the start and the end frame of each window.")
+        sys.exit(1)
 
-        data = np.loadtxt("%s/%s" % (path, file), usecols=(0, 1, 2, 3, 4, 5, 6, 7))
-
-        rho_v = data[data[:, 1] > st]
-        rho_v = rho_v[rho_v[:, 1] < en]
-
-        np.savetxt(
-            "%s/%s_steadystate.txt" % (path_output, file),
-            rho_v,
-            delimiter="\t",
-            header=header,
-            comments="",
-            newline="\r\n",
-            fmt=fmt
-        )
+    for file, st, en in zip(files, starts, ends):
+        with stage_metrics("01_extract_steady_state_data", "%s/%s" % (path, file), args.metricsFile,
+                           args.traceMemory):
+            if args.windows is not None:
+                extract_windows("%s/%s" % (path, file), path_output, list(zip(args.windows[::2], args.windows[1::2])),
+                                args.binary, args.compact)
+            else:
+                extract_file("%s/%s" % (path, file), path_output, st, en, args.binary, fps, args.compact)
@@ -6,14 +6,14 @@ Visualise the "straight trajectories" spatially (x-y)
 import os
 import sys
 import argparse
+from typing import List, Tuple
 
 import matplotlib.pyplot as plt
-import numpy as np
 
 sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
 from experiments import EXPERIMENTS
-
-import sqlite3
+from plotting import PLOT_MODES, plot_trajectories
+from trajectory_io import read_data
 
 
 def get_parser_args():
@@ -44,45 +44,78 @@ def get_parser_args():
         "--pathOutput",
         help="Enter the path to save the output"
     )
+    parser.add_argument(
+        "-m",
+        "--mode",
+        choices=PLOT_MODES,
+        default="points",
+        help="Enter the rendering mode: points, lines (one line collection), or density (2D density raster) "
+             "(default=points). The trajectories are rasterized in the pdf"
+    )
+    parser.add_argument(
+        "-bins",
+        "--bins",
+        type=int,
+        nargs=2,
+        default=[400, 400],
+        help="Enter the number of bins in x and y of the density raster (default=400 400)"
+    )
     return parser.parse_args()
 
 
+def plot_file(p_file: str, path_output: str, title: str, mode: str = "points",
+              bins: Tuple[int, int] = (400, 400)) -> List[str]:
+    """
+    plot the trajectories (x-y) of one file
+    :param p_file: str. path of the trajectory file
+    :param path_output: str. Path of the directory to save the figures
+    :param title: str. title of the figure
+    :param mode: str. rendering mode: points, lines, or density
+    :param bins: (number of bins in x, number of bins in y) of the density raster
+    :return: list. paths of the saved figures (pdf, png)
+    """
+    file_name = os.path.basename(os.path.splitext(p_file)[0])
+
+    fig = plt.figure(figsize=(7, 6))
+
+    data = read_data(p_file, usecols=(0, 1, 2, 3, 4))
+    # all points in one rasterized layer (points: the markers of plt.plot(x, y, "bo", markersize=0.3))
+    plot_trajectories(plt.gca(), data[:, 0], data[:, 1], data[:, 2], data[:, 3], mode, color="blue",
+                      size=0.3 ** 2 if mode == "points" else 0.5, bins=tuple(bins), marker="o",
+                      edge_width=plt.rcParams["lines.markeredgewidth"])
+
+    # plt.xlim(1, 12)
+    # plt.ylim(-2, 6)
+    #
+    # plt.vlines(2.3, -2, 2, colors="r", linestyles="dashed")
+    # plt.vlines(7.48363,  -2, 2, colors="r", linestyles="dashed")
+    # plt.vlines(9.78363,  -2, 2, colors="r", linestyles="dashed")
+
+    plt.xlim(0, 14.97)
+    plt.ylim(-2, 2)
+
+    plt.vlines(2.3, -2, 2, colors="r", linestyles="dashed")
+    plt.vlines(7.48363, -2, 2, colors="r", linestyles="dashed")
+    plt.vlines(9.78363, -2, 2, colors="r", linestyles="dashed")
+
+    plt.xlabel(r"$\rm x~[m]$")
+    plt.ylabel(r"$\rm y~[m]$")
+    plt.title(title)
+
+    outputs = ["%s/%s.pdf" % (path_output, file_name), "%s/%s.png" % (path_output, file_name)]
+    for p_figure in outputs:
+        plt.savefig(p_figure)
+    plt.close(fig)
+    return outputs
+
+
 if __name__ == "__main__":
     arg = get_parser_args()
     path = arg.path
     files = arg.fileName
     titles = arg.title
     path_output = arg.pathOutput
-    fig_name = os.path.basename(os.path.splitext(path)[0])
 
     for file, title in zip(files, titles):
         print("Transforming: %s/%s" % (path, file))
-        file_name = os.path.splitext(file)[0]
-        file_type = os.path.splitext(file)[1]  # extension of the data file
-
-        fig = plt.figure(figsize=(7, 6))
-
-        data = np.loadtxt("%s/%s" % (path, file), usecols=(0, 1, 2, 3, 4))
-        plt.plot(data[:, 2], data[:, 3], "bo", markersize=0.3)
-
-        # plt.xlim(1, 12)
-        # plt.ylim(-2, 6)
-        #
-        # plt.vlines(2.3, -2, 2, colors="r", linestyles="dashed")
-        # plt.vlines(7.48363,  -2, 2, colors="r", linestyles="dashed")
-        # plt.vlines(9.78363,  -2, 2, colors="r", linestyles="dashed")
-
-        plt.xlim(0, 14.97)
-        plt.ylim(-2, 2)
-
-        plt.vlines(2.3, -2, 2, colors="r", linestyles="dashed")
-        plt.vlines(7.48363, -2, 2, colors="r", linestyles="dashed")
-        plt.vlines(9.78363, -2, 2, colors="r", linestyles="dashed")
-
-        plt.xlabel(r"$\rm x~[m]$")
-        plt.ylabel(r"$\rm y~[m]$")
-        plt.title(title)
-
-        plt.savefig("%s/%s.pdf" % (path_output, file_name))
-        plt.savefig("%s/%s.png" % (path_output, file_name))
-        plt.close()
+        plot_file("%s/%s" % (path, file), path_output, title, arg.mode, arg.bins)
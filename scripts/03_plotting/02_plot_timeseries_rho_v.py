@@ -4,9 +4,15 @@ Plot the states of pedestrians' velocity and density change over time (steady-st
 """
 import argparse
 import os
+import sys
+from typing import List, Optional
 
 import matplotlib.pyplot as plt
-import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from experiments import EXPERIMENTS, ExperimentData
+from helper import detect_steady_state
+from trajectory_io import read_data
 
 
 def get_parser_args():
@@ -30,31 +36,55 @@ def get_parser_args():
         "--title",
         help="Enter a title for the figure",
     )
+    parser.add_argument(
+        "-expk",
+        "--expKey",
+        help="Enter the experiment key (frame rate for the automatic detection of the steady state): " +
+             " , ".join(EXPERIMENTS.keys()),
+    )
     return parser.parse_args()
 
 
-if __name__ == "__main__":
-    args = get_parser_args()
-    path = args.path
-    path_output = args.pathOutput
-    title = args.title
-
-    fig_name = os.path.basename(os.path.splitext(path)[0])
-    data = pd.read_csv(path, comment="#", sep="\t", names=["ID", "FR", "x", "y", "z", "vel", "headway", "density"])
+def plot_file(p_file: str, path_output: str, title: str, exp_key: Optional[str] = None) -> List[str]:
+    """
+    plot the time series of the velocity and density of one file with the proposed steady state
+    :param p_file: str. path of the vel_h_rho file
+    :param path_output: str. Path of the directory to save the figures
+    :param title: str. title of the figure
+    :param exp_key: str. experiment key of EXPERIMENTS (frame rate, None => default frame rate)
+    :return: list. paths of the saved figures (pdf, png)
+    """
+    fig_name = os.path.basename(os.path.splitext(p_file)[0])
+    # id, fr, x, y, z, velocity (one per delta_t), headway, density: density is the last column
+    values = read_data(p_file)
+    frames = values[:, 1]
+    fps = EXPERIMENTS[exp_key].fps if exp_key else ExperimentData.fps
+    window = detect_steady_state(values, fps)
 
     fig = plt.figure(figsize=(6, 6))
 
-    plt.plot(data.FR, data.density, 'r-', label="Density")
-    plt.plot(data.FR, data.vel, 'b-', label="Velocity")
+    plt.plot(frames, values[:, -1], 'r-', label="Density")
+    plt.plot(frames, values[:, 5], 'b-', label="Velocity")
 
-    plt.axvline(x=600, linestyle="--")
-    plt.axvline(x=15000, linestyle="--")
+    # proposed steady state
+    if window is not None:
+        plt.axvline(x=window[0], linestyle="--")
+        plt.axvline(x=window[1], linestyle="--")
     plt.legend()
     plt.title(title)
 
-    print("Minimum frame: ", data.FR.min())
-    print("Maximum frame: ", data.FR.max())
+    print("Minimum frame: ", frames.min())
+    print("Maximum frame: ", frames.max())
+    print("Steady state (proposed): ", window)
     plt.xlabel(r" $\rm Time[Frame]$")
-    plt.savefig("%s/%s_timeseries_rho_vel.pdf" % (path_output, fig_name))
-    plt.savefig("%s/%s_timeseries_rho_vel.png" % (path_output, fig_name))
-    plt.close()
+    outputs = ["%s/%s_timeseries_rho_vel.pdf" % (path_output, fig_name),
+               "%s/%s_timeseries_rho_vel.png" % (path_output, fig_name)]
+    for p_figure in outputs:
+        plt.savefig(p_figure)
+    plt.close(fig)
+    return outputs
+
+
+if __name__ == "__main__":
+    args = get_parser_args()
+    plot_file(args.path, args.pathOutput, args.title, args.expKey)
@@ -5,9 +5,13 @@ Plot the individual fundamental diagram (FD, rho-velocity relation) and the head
     - for the same experiment, different runs (provide the data of each run using a separate 01_FD_germany_seyfried2005_all.txt file)
 """
 import argparse
+import os
+import sys
 
 import matplotlib.pyplot as plt
-import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from trajectory_io import read_data
 
 
 def get_parser_args():
@@ -67,12 +71,12 @@ if __name__ == "__main__":
     ax2 = fig2.add_subplot(111)
 
     for file, label, in zip(files, labels):
-        data = pd.read_csv("%s/%s" % (path, file), sep='\t', comment='#',
-                           names=["id", "fr", "x", "y", "z", "vel", "headway", "rho"])
+        # id, fr, x, y, z, velocity (one per delta_t), headway, rho
+        data = read_data("%s/%s" % (path, file))
 
         print("Plotting: %s%s" % (path, file))
-        ax1.scatter(data["headway"], data["vel"], label=label, alpha=0.5)
-        ax2.scatter(data["rho"], data["vel"], label=label, alpha=0.5)
+        ax1.scatter(data[:, -2], data[:, 5], label=label, alpha=0.5)
+        ax2.scatter(data[:, -1], data[:, 5], label=label, alpha=0.5)
 
     # ax1.set_xlim(-0.5, 2.5)
     # ax1.set_ylim(-0.6, 0.8)
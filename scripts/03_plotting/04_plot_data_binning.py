@@ -2,8 +2,13 @@
 ©Rudina Subaih
 """
 import matplotlib.pyplot as plt
-import numpy as np
 import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from helper import bin_data
+from trajectory_io import read_data
 
 
 def get_parser_args():
@@ -40,43 +45,29 @@ def get_parser_args():
         "--pathOutput",
         help="Enter the path to save the output"
     )
+    parser.add_argument(
+        "-bw",
+        "--binWidth",
+        type=float,
+        default=0.2,
+        help="Enter the width of the bins (default=0.2)"
+    )
     return parser.parse_args()
 
 
-def binning_data(x_values, y_values, lb, ax):
+def binning_data(x_values, y_values, lb, ax, bin_width=0.2):
     """
     binning the data and plot the errorbar plots
     :param x_values: x-axis values (independent variable values)
     :param y_values: y-axis values (dependent variable values)
     :param lb: texts. Label of plot
     :param ax: subplot name
+    :param bin_width: float. width of the bins (default=0.2)
     :return:
     """
-    sort_x = x_values.copy()
-    sort_x.sort()
-
-    min_x = sort_x[0]
-    max_x = sort_x[-1]
-    ranges = np.arange(min_x, max_x, 0.2)
-
-    y_mean = []
-    x_mean = []
-
-    y_std = []
-    x_std = []
-
-    r = len(ranges) - 1
-    for group in range(r):
-        v = y_values[(x_values >= ranges[group]) & (x_values <= ranges[group + 1])]
-        rho = x_values[(x_values >= ranges[group]) & (x_values <= ranges[group + 1])]
-
-        if (len(v) >= 0) and (len(rho) >= 0):
-            y_mean.append(np.mean(v))
-            y_std.append(np.std(v))
-            x_mean.append(np.mean(rho))
-            x_std.append(np.std(rho))
+    binned = bin_data(x_values, y_values, bin_width).nonempty()
 
-    ax.errorbar(x_mean, y_mean, xerr=x_std, yerr=y_std, label=lb,
+    ax.errorbar(binned.x_mean, binned.y_mean, xerr=binned.x_std, yerr=binned.y_std, label=lb,
                 markerfacecolor="None")
 
 
@@ -96,9 +87,10 @@ if __name__ == "__main__":
 
     for path_file, l in zip(path_source, label):
         print(path_file)
-        data = np.loadtxt(path_file)
-        binning_data(data[:, 7], data[:, 5], l, ax1)
-        binning_data(data[:, 6], data[:, 5], l, ax2)
+        data = read_data(path_file)
+        # id, fr, x, y, z, velocity, headway, rho
+        binning_data(data[:, -1], data[:, 5], l, ax1, arg.binWidth)
+        binning_data(data[:, -2], data[:, 5], l, ax2, arg.binWidth)
 
     # 1. rho-velocity figure
     ax1.set_xlabel(r"$\rm \rho(x_{i})~[m^{-1}]$")
@@ -4,12 +4,14 @@
 import argparse
 import os
 import sys
+from typing import List, Tuple
 
 import matplotlib.pyplot as plt
-import pandas as pd
 
 sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
 from experiments import EXPERIMENTS
+from plotting import PLOT_MODES, plot_trajectories
+from trajectory_io import read_data
 
 
 def get_parser_args():
@@ -38,38 +40,66 @@ def get_parser_args():
         "--pathOutput",
         help="Enter the path to save the output"
     )
+    parser.add_argument(
+        "-m",
+        "--mode",
+        choices=PLOT_MODES,
+        default="points",
+        help="Enter the rendering mode: points, lines (one line collection), or density (2D density raster) "
+             "(default=points). The trajectories are rasterized in the pdf"
+    )
+    parser.add_argument(
+        "-bins",
+        "--bins",
+        type=int,
+        nargs=2,
+        default=[400, 400],
+        help="Enter the number of bins in x and y of the density raster (default=400 400)"
+    )
     return parser.parse_args()
 
 
-if __name__ == "__main__":
-    args = get_parser_args()
-    path_file = args.path
-    exp_name = args.expName
-    title = args.title
-    path_output = args.pathOutput
-
+def plot_file(p_file: str, path_output: str, title: str, exp_name: str, mode: str = "points",
+              bins: Tuple[int, int] = (400, 400)) -> List[str]:
+    """
+    plot the x-t diagram of one file
+    :param p_file: str. path of the trajectory file (straight periodic trajectories)
+    :param path_output: str. Path of the directory to save the figures
+    :param title: str. title of the figure
+    :param exp_name: str. experiment key of EXPERIMENTS (fps and circumference)
+    :param mode: str. rendering mode: points, lines, or density
+    :param bins: (number of bins in x, number of bins in y) of the density raster
+    :return: list. paths of the saved figures (pdf, png)
+    """
     e = EXPERIMENTS[exp_name]
     fps = e.fps
 
-    file_name = os.path.splitext(path_file)[0]
+    file_name = os.path.basename(os.path.splitext(p_file)[0])
 
     fig = plt.figure(figsize=(6, 6))
 
-    data = pd.read_csv(path_file, comment="#", sep="\t", names=["id", "fr", "x", "y", "z"])
+    data = read_data(p_file, usecols=(0, 1, 2, 3, 4))  # id, fr, x, y, z
 
-    print("Start frame id:%s" % (data["fr"].max()))
-    print("End frame ID:%s" % (data["fr"]).min())
+    print("Start frame id:%s" % (data[:, 1].max()))
+    print("End frame ID:%s" % (data[:, 1].min()))
 
-    for ped_id in set(data["id"]):
-        # Take only the trajectory for one person
-        p_data = data.loc[data["id"] == ped_id]
-        plt.scatter(p_data["x"], p_data["fr"] / fps, s=0.1, edgecolors="black", facecolors="black", marker=".")
+    # all pedestrians in one rasterized layer (no line across the periodic boundary of the straight trajectories)
+    plot_trajectories(plt.gca(), data[:, 0], data[:, 1], data[:, 2], data[:, 1] / fps, mode,
+                      size=0.1 if mode == "points" else 0.5, bins=tuple(bins),
+                      max_jump=e.circumference / 2 if e.circumference else None)
 
     # plt.xlim(0, 16.62)
     # plt.ylim(0, 70)
     plt.title(title)
     plt.xlabel(r"Space [$\rm m$]")
     plt.ylabel(r"Time [$\rm sec.$]")
-    plt.savefig("%s/%s_x_t.pdf" % (path_output, file_name))
-    plt.savefig("%s/%s_x_t.png" % (path_output, file_name))
-    plt.close()
+    outputs = ["%s/%s_x_t.pdf" % (path_output, file_name), "%s/%s_x_t.png" % (path_output, file_name)]
+    for p_figure in outputs:
+        plt.savefig(p_figure)
+    plt.close(fig)
+    return outputs
+
+
+if __name__ == "__main__":
+    args = get_parser_args()
+    plot_file(args.path, args.pathOutput, args.title, args.expName, args.mode, args.bins)
@@ -0,0 +1,212 @@
+"""
+©Rudina Subaih
+Render the figures of many files and experiments in parallel (process pool, Agg backend, plotsettings.mplystyle
+loaded once per worker). Figures whose inputs (content), parameters, style, and code (this script, the plot script, and the
+helper modules) did not change since the last run are skipped (manifest .figures.json in the output directory).
+
+The figures of each experiment are saved in <pathOutput>/<experiment key>. The file patterns can contain {expk},
+which is replaced by the experiment key, e.g. all experiments of the registry:
+python 06_render_figures.py -xt all "data/{expk}/*_straight_traj.txt" -ts all "data/{expk}/*vel_h_rho*.txt" -po figs
+"""
+import argparse
+import glob
+import importlib.util
+import os
+import sys
+from typing import List, Optional, Sequence, Tuple
+
+sys.path.append(os.path.abspath(os.path.join('..', 'helper'))+'/')
+from experiments import EXPERIMENTS
+from plotting import PLOT_MODES
+from rendering import MANIFEST_FILE, STYLE_FILE, FigureJob, render_figures
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# code of all plots (part of the key of each figure, besides the plot script)
+HELPER_CODE = tuple(sorted(glob.glob(os.path.join(os.path.dirname(SCRIPTS_DIR), "helper", "*.py"))))
+
+
+def load_script(path: str, name: str):
+    """
+    import a plot script (the file names of the scripts are not valid module names). The plot scripts (matplotlib) are
+    only imported by the processes which render figures
+    :param path: str. path of the script relative to the scripts directory
+    :param name: str. module name
+    :return: module
+    """
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPTS_DIR, path))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+def get_parser_args() -> argparse.Namespace:
+    """
+    Arguments required from user to input
+    :return: parser of arguments
+    """
+    parser = argparse.ArgumentParser(description="Render the figures of many files and experiments in parallel")
+    parser.add_argument(
+        "-xy",
+        "--trajectories",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("EXPK", "PATTERN"),
+        help="Enter an experiment key (or all) and a pattern of trajectory files to plot x-y (00_plot_trajectories). "
+             "Can be repeated"
+    )
+    parser.add_argument(
+        "-xt",
+        "--spaceTime",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("EXPK", "PATTERN"),
+        help="Enter an experiment key (or all) and a pattern of straight trajectory files to plot x-t "
+             "(05_plot_x_t). Can be repeated"
+    )
+    parser.add_argument(
+        "-ts",
+        "--timeseries",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("EXPK", "PATTERN"),
+        help="Enter an experiment key (or all) and a pattern of vel_h_rho files to plot the time series "
+             "(02_plot_timeseries_rho_v). Can be repeated"
+    )
+    parser.add_argument(
+        "-po",
+        "--pathOutput",
+        help="Enter the path to save the output"
+    )
+    parser.add_argument(
+        "-m",
+        "--mode",
+        choices=PLOT_MODES,
+        default="points",
+        help="Enter the rendering mode of the trajectories: points, lines, or density (default=points)"
+    )
+    parser.add_argument(
+        "-bins",
+        "--bins",
+        type=int,
+        nargs=2,
+        default=[400, 400],
+        help="Enter the number of bins in x and y of the density raster (default=400 400)"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=0,
+        help="Enter the number of worker processes (default=0 => all CPUs, 1 => no process pool)"
+    )
+    parser.add_argument(
+        "-style",
+        "--style",
+        default=STYLE_FILE,
+        help="Enter the path of the matplotlib style (default=helper/plotsettings.mplystyle, none => matplotlib "
+             "default)"
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="Render all figures, also if their inputs did not change"
+    )
+    return parser.parse_args()
+
+
+def render_trajectories(inputs: List[str], path_output: str, title: str, mode: str,
+                        bins: Sequence[int]) -> List[str]:
+    """
+    figure job of 00_plot_trajectories.plot_file
+    """
+    plot_trajectories = load_script("03_plotting/00_plot_trajectories.py", "plot_trajectories_script")
+    return plot_trajectories.plot_file(inputs[0], path_output, title, mode, tuple(bins))
+
+
+def render_space_time(inputs: List[str], path_output: str, title: str, exp_key: str, mode: str,
+                      bins: Sequence[int]) -> List[str]:
+    """
+    figure job of 05_plot_x_t.plot_file
+    """
+    plot_x_t = load_script("03_plotting/05_plot_x_t.py", "plot_x_t")
+    return plot_x_t.plot_file(inputs[0], path_output, title, exp_key, mode, tuple(bins))
+
+
+def render_timeseries(inputs: List[str], path_output: str, title: str, exp_key: str) -> List[str]:
+    """
+    figure job of 02_plot_timeseries_rho_v.plot_file
+    """
+    plot_timeseries_rho_v = load_script("03_plotting/02_plot_timeseries_rho_v.py", "plot_timeseries_rho_v")
+    return plot_timeseries_rho_v.plot_file(inputs[0], path_output, title, exp_key)
+
+
+def expand_files(patterns: Sequence[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """
+    files of the experiments
+    :param patterns: list. (experiment key or all, file pattern with optional {expk})
+    :return: list. (experiment key, path of the file)
+    """
+    files = []
+    for exp_key, pattern in patterns:
+        exp_keys = EXPERIMENTS.keys() if exp_key == "all" else [exp_key]
+        for key in exp_keys:
+            if key not in EXPERIMENTS:
+                raise ValueError("ERROR: unknown experiment key %s." % key)
+            files.extend((key, p_file) for p_file in sorted(glob.glob(pattern.replace("{expk}", key))))
+    return files
+
+
+def build_jobs(args: argparse.Namespace) -> List[FigureJob]:
+    """
+    build the figure jobs of all files
+    :param args: parser of arguments
+    :return: list of the figure jobs
+    """
+    jobs = []
+    for plot_name, render, patterns in (("00_plot_trajectories", render_trajectories, args.trajectories),
+                                        ("05_plot_x_t", render_space_time, args.spaceTime),
+                                        ("02_plot_timeseries_rho_v", render_timeseries, args.timeseries)):
+        code = (os.path.join(SCRIPTS_DIR, "03_plotting", plot_name + ".py"),) + HELPER_CODE
+        for exp_key, p_file in expand_files(patterns):
+            file_name = os.path.basename(os.path.splitext(p_file)[0])
+            params = {"title": file_name}
+            if render is not render_timeseries:
+                params.update(mode=args.mode, bins=list(args.bins))
+            if render is not render_trajectories:
+                params["exp_key"] = exp_key
+            jobs.append(FigureJob("%s:%s:%s" % (plot_name, exp_key, p_file), render, (p_file,),
+                                  "%s/%s" % (args.pathOutput, exp_key), params, code))
+    return jobs
+
+
+if __name__ == "__main__":
+    args = get_parser_args()
+    style: Optional[str] = None if args.style.lower() == "none" else args.style
+
+    jobs = build_jobs(args)
+    if not jobs:
+        print("Warning:\tNo files found.")
+        sys.exit(1)
+
+    os.makedirs(args.pathOutput, exist_ok=True)
+    failed = 0
+    skipped = 0
+    results = render_figures(jobs, os.path.join(args.pathOutput, MANIFEST_FILE), args.workers, style, args.force)
+    for i, result in enumerate(results, 1):
+        if result.error is not None:
+            failed += 1
+            print("Warning:\t[%d/%d] Failed: %s (%s)" % (i, len(jobs), result.job.name, result.error))
+            continue
+        skipped += result.skipped
+        print("Info:\t[%d/%d] %s: %s" % (i, len(jobs), "Unchanged" if result.skipped else "Done", result.job.name))
+
+    print("Info:\t%d figures rendered, %d unchanged" % (len(jobs) - failed - skipped, skipped))
+    if failed:
+        print("Warning:\t%d of %d figures failed" % (failed, len(jobs)))
+        sys.exit(1)